@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import event
+from sqlmodel import Session, col, select
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.database import get_async_session, get_session
+from app.models import Product
+
+INVALIDATIONS_KEY = "catalog_cache_invalidations"
+# the after_commit hooks only see this process's writes; an entry older than this is read again
+MAX_AGE = float(os.environ.get("APP_CATALOG_CACHE_MAX_AGE_SECONDS", "60"))
+
+
+class CatalogEntry:
+    """Compact read-only snapshot of an active product for the scan path"""
+
+    __slots__ = ("id", "sku", "barcode", "name", "category_id", "base_price", "stock_quantity")
+
+    def __init__(
+        self,
+        id: int,
+        sku: str,
+        barcode: Optional[str],
+        name: str,
+        category_id: int,
+        base_price: Decimal,
+        stock_quantity: int,
+    ):
+        self.id = id
+        self.sku = sku
+        self.barcode = barcode
+        self.name = name
+        self.category_id = category_id
+        self.base_price = base_price
+        self.stock_quantity = stock_quantity
+
+    @classmethod
+    def from_product(cls, product: Product) -> "CatalogEntry":
+        if product.id is None:
+            raise ValueError("Cannot cache a product without an id")
+        return cls(
+            product.id,
+            product.sku,
+            product.barcode,
+            product.name,
+            product.category_id,
+            product.base_price,
+            product.stock_quantity,
+        )
+
+
+class ProductCatalogCache:
+    """Read-through LRU of active products indexed by id, barcode and SKU, each kept for `max_age` seconds"""
+
+    def __init__(self, max_size: int = 50_000, max_age: float = MAX_AGE):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, CatalogEntry] = OrderedDict()
+        self._expires: Dict[int, float] = {}
+        self._by_barcode: Dict[str, int] = {}
+        self._by_sku: Dict[str, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, index: Dict[str, int], key: str) -> Optional[CatalogEntry]:
+        with self._lock:
+            product_id = index.get(key)
+            if product_id is not None and time.monotonic() >= self._expires[product_id]:
+                self._discard(product_id)
+                product_id = None
+            if product_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(product_id)
+            self.hits += 1
+            return self._entries[product_id]
+
+    def _put(self, entry: CatalogEntry, generation: int) -> None:
+        with self._lock:
+            # an invalidation raced with the load, so the snapshot may predate the write
+            if generation != self._generation:
+                return
+            self._discard(entry.id)
+            self._entries[entry.id] = entry
+            self._expires[entry.id] = time.monotonic() + self.max_age
+            self._by_sku[entry.sku] = entry.id
+            if entry.barcode is not None:
+                self._by_barcode[entry.barcode] = entry.id
+            while len(self._entries) > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._unindex(evicted)
+
+    def _unindex(self, entry: CatalogEntry) -> None:
+        self._expires.pop(entry.id, None)
+        if self._by_sku.get(entry.sku) == entry.id:
+            del self._by_sku[entry.sku]
+        if entry.barcode is not None and self._by_barcode.get(entry.barcode) == entry.id:
+            del self._by_barcode[entry.barcode]
+
+    def _discard(self, product_id: int) -> None:
+        entry = self._entries.pop(product_id, None)
+        if entry is not None:
+            self._unindex(entry)
+
+    def _load(self, column_name: str, key: str) -> Optional[CatalogEntry]:
+        generation = self._generation
+        with get_session() as session:
+            product = session.exec(_lookup(column_name, key)).first()
+            if product is None:
+                return None
+            entry = CatalogEntry.from_product(product)
+        self._put(entry, generation)
+        return entry
+
+    async def _load_async(self, column_name: str, key: str) -> Optional[CatalogEntry]:
+        generation = self._generation
+        async with get_async_session() as session:
+            product = (await session.exec(_lookup(column_name, key))).first()
+            if product is None:
+                return None
+            entry = CatalogEntry.from_product(product)
+        self._put(entry, generation)
+        return entry
+
+    def get_by_barcode(self, barcode: str) -> Optional[CatalogEntry]:
+        entry = self._get(self._by_barcode, barcode)
+        return entry if entry is not None else self._load("barcode", barcode)
+
+    def get_by_sku(self, sku: str) -> Optional[CatalogEntry]:
+        entry = self._get(self._by_sku, sku)
+        return entry if entry is not None else self._load("sku", sku)
+
+    async def get_by_barcode_async(self, barcode: str) -> Optional[CatalogEntry]:
+        """Like get_by_barcode, but a miss is loaded without blocking the event loop"""
+        entry = self._get(self._by_barcode, barcode)
+        return entry if entry is not None else await self._load_async("barcode", barcode)
+
+    async def get_by_sku_async(self, sku: str) -> Optional[CatalogEntry]:
+        entry = self._get(self._by_sku, sku)
+        return entry if entry is not None else await self._load_async("sku", sku)
+
+    def invalidate(self, product_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._generation += 1
+            for product_id in product_ids:
+                self._discard(product_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._expires.clear()
+            self._by_barcode.clear()
+            self._by_sku.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def _lookup(column_name: str, key: str) -> SelectOfScalar[Product]:
+    return select(Product).where(getattr(Product, column_name) == key, col(Product.is_active).is_(True))
+
+
+catalog_cache = ProductCatalogCache(max_size=int(os.environ.get("APP_CATALOG_CACHE_SIZE", "50000")))
+
+
+def invalidate_on_commit(session: Session, product_ids: Iterable[int]) -> None:
+    """Drop cached products once the session's transaction commits"""
+    pending: Set[int] = session.info.setdefault(INVALIDATIONS_KEY, set())
+    pending.update(product_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    pending: Optional[Set[int]] = session.info.pop(INVALIDATIONS_KEY, None)
+    if pending:
+        catalog_cache.invalidate(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(INVALIDATIONS_KEY, None)
@@ -0,0 +1,324 @@
+"""Bulk import of supplier catalogs: products upserted by SKU, `BATCH_SIZE` rows per transaction.
+
+Each row is validated against ProductCreate, with its category given by name (`category`) or id
+(`category_id`). A row that fails is reported with its position and the rest of its batch is still written.
+Empty values count as not given: a new product gets the model default, an existing one keeps its value, so
+re-importing a catalog without a stock column leaves stock alone. Rows equal to the stored product are not
+rewritten. Every stock change writes an adjustment row to stock_movements.
+
+`python -m app.catalog_import catalog.csv --user 1 [--create-categories]`
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlmodel import Session
+
+from app.catalog_cache import invalidate_on_commit
+from app.database import TimeoutClass, bulk_insert, get_session
+from app.models import CatalogImportReport, CatalogImportRowError, Category, ProductCreate, StockMovement
+from app.price_resolver import refresh_prices_on_commit
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get("APP_CATALOG_IMPORT_BATCH", "1000"))
+
+ACTIVE_CATEGORIES = text("SELECT id, name FROM categories WHERE is_active ORDER BY id")
+
+# locked in id order, like the stock decrement, so checkouts and the import cannot deadlock; the lock also
+# keeps the stock the movements start from current until commit
+LOCK_EXISTING = text(
+    """
+    SELECT id, sku, stock_quantity, min_stock_level FROM products
+    WHERE sku = ANY(CAST(:skus AS varchar[])) ORDER BY id FOR NO KEY UPDATE
+    """
+)
+
+# nullable columns left empty keep the stored value; stock_quantity and min_stock_level arrive filled in
+UPSERT = text(
+    """
+    INSERT INTO products AS p
+        (name, description, sku, barcode, category_id, base_price, cost_price, stock_quantity, min_stock_level,
+         image_url, weight, dimensions, is_active, created_at, updated_at)
+    SELECT i.name, i.description, i.sku, i.barcode, i.category_id, i.base_price, i.cost_price, i.stock_quantity,
+           i.min_stock_level, i.image_url, i.weight, CAST(i.dimensions AS json), true, :now, :now
+    FROM unnest(
+        CAST(:names AS varchar[]), CAST(:descriptions AS varchar[]), CAST(:skus AS varchar[]),
+        CAST(:barcodes AS varchar[]), CAST(:category_ids AS integer[]), CAST(:base_prices AS numeric[]),
+        CAST(:cost_prices AS numeric[]), CAST(:stock_quantities AS integer[]), CAST(:min_stock_levels AS integer[]),
+        CAST(:image_urls AS varchar[]), CAST(:weights AS numeric[]), CAST(:dimensions AS text[])
+    ) AS i(name, description, sku, barcode, category_id, base_price, cost_price, stock_quantity, min_stock_level,
+           image_url, weight, dimensions)
+    ORDER BY i.sku
+    ON CONFLICT (sku) DO UPDATE SET
+        name = excluded.name,
+        description = coalesce(excluded.description, p.description),
+        barcode = coalesce(excluded.barcode, p.barcode),
+        category_id = excluded.category_id,
+        base_price = excluded.base_price,
+        cost_price = excluded.cost_price,
+        stock_quantity = excluded.stock_quantity,
+        min_stock_level = excluded.min_stock_level,
+        image_url = coalesce(excluded.image_url, p.image_url),
+        weight = coalesce(excluded.weight, p.weight),
+        dimensions = coalesce(excluded.dimensions, p.dimensions),
+        updated_at = excluded.updated_at
+    WHERE (p.name, p.description, p.barcode, p.category_id, p.base_price, p.cost_price, p.stock_quantity,
+           p.min_stock_level, p.image_url, p.weight, CAST(p.dimensions AS jsonb))
+        IS DISTINCT FROM
+          (excluded.name, coalesce(excluded.description, p.description), coalesce(excluded.barcode, p.barcode),
+           excluded.category_id, excluded.base_price, excluded.cost_price, excluded.stock_quantity,
+           excluded.min_stock_level, coalesce(excluded.image_url, p.image_url), coalesce(excluded.weight, p.weight),
+           CAST(coalesce(excluded.dimensions, p.dimensions) AS jsonb))
+    RETURNING p.id, p.sku, p.stock_quantity, p.xmax = 0 AS created
+    """
+)
+
+Row = Tuple[int, ProductCreate]  # position in the input, validated product
+
+
+class CategoryMap:
+    """Active category ids by name, case-insensitive, loaded on first use; the oldest wins a shared name"""
+
+    def __init__(self, create_missing: bool = False):
+        self.create_missing = create_missing
+        self.created = 0
+        self._ids: Optional[Dict[str, int]] = None
+
+    def resolve(self, name: str) -> Optional[int]:
+        if self._ids is None:
+            with get_session() as session:
+                self._ids = {}
+                for category_id, category_name in session.execute(ACTIVE_CATEGORIES).all():
+                    self._ids.setdefault(category_name.strip().lower(), category_id)
+        key = name.strip().lower()
+        category_id = self._ids.get(key)
+        if category_id is None and self.create_missing:
+            with get_session() as session:
+                category = Category(name=name.strip())
+                session.add(category)
+                session.commit()
+                category_id = self._ids[key] = category.id or 0
+            self.created += 1
+        return category_id
+
+
+def _given(raw: Mapping[str, Any]) -> Dict[str, Any]:
+    """The row without empty values, so they fall back as described above"""
+    row: Dict[str, Any] = {}
+    for key, value in raw.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            continue
+        row[key] = value
+    return row
+
+
+def _validate(raw: Mapping[str, Any], categories: CategoryMap) -> ProductCreate:
+    """Raises ValueError with the row's problems"""
+    row = _given(raw)
+    category = row.pop("category", None)
+    if "category_id" not in row:
+        if category is None:
+            raise ValueError("category or category_id is required")
+        category_id = categories.resolve(str(category))
+        if category_id is None:
+            raise ValueError(f"unknown category {category!r}")
+        row["category_id"] = category_id
+    if isinstance(row.get("dimensions"), str):
+        try:
+            row["dimensions"] = json.loads(row["dimensions"])
+        except json.JSONDecodeError as e:
+            raise ValueError(f"dimensions: not JSON ({e})") from e
+    try:
+        return ProductCreate.model_validate(row)
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+
+
+def _write(session: Session, rows: List[Row], created_by: int, reference_number: Optional[str]) -> Counter:
+    """Upsert `rows` and write their stock movements in the caller's transaction; returns what it did"""
+    counts: Counter = Counter()
+    now = datetime.utcnow()
+    skus = [product.sku for _, product in rows]
+    existing = {sku: (stock, min_stock) for _, sku, stock, min_stock in session.execute(LOCK_EXISTING, {"skus": skus})}
+
+    def kept(product: ProductCreate, field: str, position: int) -> int:
+        if field in product.model_fields_set or product.sku not in existing:
+            return getattr(product, field)
+        return existing[product.sku][position]
+
+    products = [product for _, product in rows]
+    upserted = session.execute(
+        UPSERT,
+        {
+            "now": now,
+            "names": [product.name for product in products],
+            "descriptions": [product.description for product in products],
+            "skus": skus,
+            "barcodes": [product.barcode for product in products],
+            "category_ids": [product.category_id for product in products],
+            "base_prices": [product.base_price for product in products],
+            "cost_prices": [product.cost_price for product in products],
+            "stock_quantities": [kept(product, "stock_quantity", 0) for product in products],
+            "min_stock_levels": [kept(product, "min_stock_level", 1) for product in products],
+            "image_urls": [product.image_url for product in products],
+            "weights": [product.weight for product in products],
+            "dimensions": [
+                json.dumps(product.dimensions) if product.dimensions is not None else None for product in products
+            ],
+        },
+    ).all()
+
+    movements: List[Dict[str, Any]] = []
+    for product_id, sku, stock, created in upserted:
+        if created:
+            counts["created"] += 1
+            previous = 0
+        elif sku in existing:
+            counts["updated"] += 1
+            previous = existing[sku][0]
+        else:
+            # inserted by another session after the lock was taken; its starting stock is unknown
+            counts["updated"] += 1
+            logger.warning(f"Product {sku} was created concurrently; no stock movement written for the import")
+            continue
+        if stock != previous:
+            movements.append(
+                {
+                    "product_id": product_id,
+                    "movement_type": "adjustment",
+                    "quantity": stock - previous,
+                    "previous_quantity": previous,
+                    "new_quantity": stock,
+                    "reference_number": reference_number,
+                    "notes": "catalog import",
+                    "created_by": created_by,
+                    "created_at": now,
+                }
+            )
+    bulk_insert(session, StockMovement, movements)
+    counts["unchanged"] += len(rows) - len(upserted)
+    counts["stock_movements"] += len(movements)
+    changed = [product_id for product_id, _, _, _ in upserted]
+    invalidate_on_commit(session, changed)
+    refresh_prices_on_commit(session, changed)
+    return counts
+
+
+def _import_batch(
+    rows: List[Row], created_by: int, reference_number: Optional[str], report: CatalogImportReport
+) -> None:
+    if not rows:
+        return
+    counts: Counter = Counter()
+    with get_session(TimeoutClass.BATCH) as session:
+        try:
+            counts = _write(session, rows, created_by, reference_number)
+            session.commit()
+        except (IntegrityError, DataError) as e:
+            session.rollback()
+            logger.info(f"Catalog import batch failed ({e.orig}); retrying its rows one by one")
+            counts.clear()
+            for position, product in rows:
+                try:
+                    with session.begin_nested():
+                        counts += _write(session, [(position, product)], created_by, reference_number)
+                except (IntegrityError, DataError) as e:
+                    message = str(e.orig).strip()
+                    report.errors.append(CatalogImportRowError(row=position, sku=product.sku, message=message))
+            session.commit()
+    report.created += counts["created"]
+    report.updated += counts["updated"]
+    report.unchanged += counts["unchanged"]
+    report.stock_movements += counts["stock_movements"]
+
+
+def _batches(rows: Iterable[Mapping[str, Any]], size: int) -> Iterator[List[Tuple[int, Mapping[str, Any]]]]:
+    numbered = enumerate(rows, start=1)
+    while batch := list(islice(numbered, size)):
+        yield batch
+
+
+def import_catalog(
+    rows: Iterable[Mapping[str, Any]],
+    created_by: int,
+    reference_number: Optional[str] = None,
+    create_categories: bool = False,
+    batch_size: int = BATCH_SIZE,
+) -> CatalogImportReport:
+    """Validate and upsert catalog rows (e.g. from csv.DictReader), one transaction per batch"""
+    started = time.perf_counter()
+    report = CatalogImportReport()
+    categories = CategoryMap(create_missing=create_categories)
+    first_row: Dict[str, int] = {}  # sku -> row that brought it
+    for batch in _batches(rows, batch_size):
+        valid: List[Row] = []
+        for position, raw in batch:
+            report.rows += 1
+            try:
+                product = _validate(raw, categories)
+            except ValueError as e:
+                sku = raw.get("sku")
+                report.errors.append(CatalogImportRowError(row=position, sku=str(sku) if sku else None, message=str(e)))
+                continue
+            if product.sku in first_row:
+                message = f"duplicate sku, already imported from row {first_row[product.sku]}"
+                report.errors.append(CatalogImportRowError(row=position, sku=product.sku, message=message))
+                continue
+            first_row[product.sku] = position
+            valid.append((position, product))
+        _import_batch(valid, created_by, reference_number, report)
+    report.categories_created = categories.created
+    report.elapsed_seconds = time.perf_counter() - started
+    logger.info(
+        f"Imported {report.rows} catalog rows in {report.elapsed_seconds:.1f}s ({report.rows_per_second:,.0f} rows/s): "
+        f"{report.created} created, {report.updated} updated, {report.unchanged} unchanged, "
+        f"{len(report.errors)} errors"
+    )
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.catalog_import", description="Bulk catalog import")
+    parser.add_argument("path", help="CSV file with a header row of ProductCreate fields, category by name")
+    parser.add_argument("--user", type=int, required=True, help="user id recorded on the stock movements")
+    parser.add_argument("--create-categories", action="store_true", help="create categories that do not exist")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    path = Path(args.path)
+    with path.open(newline="", encoding="utf-8-sig") as file:
+        report = import_catalog(
+            csv.DictReader(file),
+            created_by=args.user,
+            reference_number=path.name[:100],
+            create_categories=args.create_categories,
+            batch_size=args.batch,
+        )
+    for error in report.errors:
+        logger.warning(f"row {error.row} ({error.sku or 'no sku'}): {error.message}")
+    logger.info(
+        f"{report.rows} rows in {report.elapsed_seconds:.1f}s ({report.rows_per_second:,.0f} rows/s): "
+        f"{report.created} created, {report.updated} updated, {report.unchanged} unchanged, "
+        f"{report.stock_movements} stock movements, {report.categories_created} categories created, "
+        f"{len(report.errors)} errors"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import os
+import uuid
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlmodel import Session, col, select
+
+from app.catalog_cache import invalidate_on_commit
+from app.database import bulk_insert, get_async_session, get_session
+from app.models import (
+    AffiliateProfile,
+    Commission,
+    Product,
+    Receipt,
+    Transaction,
+    TransactionCreate,
+    TransactionItem,
+    TransactionItemCreate,
+    TransactionPromotion,
+    TransactionStatus,
+    User,
+    UserRole,
+)
+from app.price_resolver import price_resolver
+from app.promotion_engine import BasketLine, claim_promotions, promotion_engine
+from app.reseller_service import get_reseller_upline
+from app.running_totals import TotalsDelta, add_to_totals
+from app.stock_service import OVERSELL_POLICY, OversellPolicy, can_sell, decrement_stock
+
+CENT = Decimal("0.01")
+
+# "settlement" leaves commissions to the end-of-day batch in app.settlement_service
+DEFER_COMMISSIONS = os.environ.get("APP_COMMISSION_MODE", "checkout") == "settlement"
+
+
+def money(value: Decimal) -> Decimal:
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def document_number(prefix: str, now: datetime) -> str:
+    return f"{prefix}-{now:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8].upper()}"
+
+
+def _commission_rows(
+    session: Session, data: TransactionCreate, transaction_id: int, base_amount: Decimal, now: datetime
+) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    if data.reseller_id is not None:
+        for reseller in get_reseller_upline(session, data.reseller_id):
+            if not reseller["is_active"] or reseller["commission_rate"] <= 0:
+                continue
+            rows.append(
+                {
+                    "user_id": reseller["user_id"],
+                    "transaction_id": transaction_id,
+                    "commission_type": "reseller",
+                    "level": reseller["depth"],
+                    "base_amount": base_amount,
+                    "commission_rate": reseller["commission_rate"],
+                    "commission_amount": money(base_amount * reseller["commission_rate"]),
+                    "is_paid": False,
+                    "created_at": now,
+                }
+            )
+
+    if data.affiliate_id is not None:
+        affiliate = session.exec(
+            select(AffiliateProfile).where(
+                AffiliateProfile.user_id == data.affiliate_id, col(AffiliateProfile.is_active).is_(True)
+            )
+        ).first()
+        if affiliate is not None and affiliate.commission_rate > 0:
+            rows.append(
+                {
+                    "user_id": affiliate.user_id,
+                    "transaction_id": transaction_id,
+                    "commission_type": "affiliate",
+                    "level": None,
+                    "base_amount": base_amount,
+                    "commission_rate": affiliate.commission_rate,
+                    "commission_amount": money(base_amount * affiliate.commission_rate),
+                    "is_paid": False,
+                    "created_at": now,
+                }
+            )
+    return rows
+
+
+def _cap_discounts(discounts: Dict[int, Decimal], subtotal: Decimal) -> Dict[int, Decimal]:
+    """Each promotion's discount within what is left of the subtotal, in promotion id order, so they add up to the
+    transaction's discount"""
+    left = subtotal
+    capped: Dict[int, Decimal] = {}
+    for promotion_id, amount in sorted(discounts.items()):
+        capped[promotion_id] = min(money(amount), left)
+        left -= capped[promotion_id]
+    return capped
+
+
+def _buyer_role(session: Session, data: TransactionCreate) -> str:
+    if data.reseller_id is not None:
+        return UserRole.RESELLER.value
+    if data.user_id is not None:
+        user = session.get(User, data.user_id)
+        if user is not None:
+            return user.role.value
+    return UserRole.CONSUMER.value
+
+
+def checkout_in_session(
+    session: Session,
+    data: TransactionCreate,
+    promotion_discounts: Optional[Dict[int, Decimal]] = None,
+    tax_rate: Decimal = Decimal("0"),
+    defer_commissions: bool = DEFER_COMMISSIONS,
+    apply_promotions: bool = False,
+    oversell_policy: OversellPolicy = OVERSELL_POLICY,
+) -> Transaction:
+    """Write a completed sale with one multi-row statement per table; the caller owns commit/rollback"""
+    items = [TransactionItemCreate.model_validate(item) for item in data.items]
+    if not items:
+        raise ValueError("Basket is empty")
+
+    created_by = data.cashier_id if data.cashier_id is not None else data.user_id
+    if created_by is None:
+        raise ValueError("Checkout requires a cashier_id or user_id")
+
+    now = datetime.utcnow()
+    quantities: Dict[int, int] = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    # plain read: stock rows are only locked by the decrement at the very end of the sale
+    products = {
+        product_id: (is_active, base_price, stock_quantity)
+        for product_id, is_active, base_price, stock_quantity in session.execute(
+            select(Product.id, Product.is_active, Product.base_price, Product.stock_quantity).where(
+                col(Product.id).in_(sorted(quantities))
+            )
+        )
+    }
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None or not product[0]:
+            raise ValueError(f"Product {product_id} is not available")
+        # fail fast on a snapshot; decrement_stock re-checks under the row lock
+        if not can_sell(product[2], quantity, oversell_policy):
+            raise ValueError(f"Insufficient stock for product {product_id}")
+
+    # reseller sales are priced from the in-memory level / per-reseller matrix
+    reseller_prices = (
+        price_resolver.resolve(quantities, data.reseller_id, session) if data.reseller_id is not None else {}
+    )
+    lines: List[Dict[str, Any]] = []
+    for item in items:
+        unit_price = item.unit_price
+        if unit_price is None:
+            unit_price = reseller_prices.get(item.product_id, products[item.product_id][1])
+        lines.append(
+            {
+                "product_id": item.product_id,
+                "quantity": item.quantity,
+                "unit_price": unit_price,
+                "discount_amount": Decimal("0"),
+                "total_price": money(unit_price * item.quantity),
+            }
+        )
+
+    discounts = dict(promotion_discounts or {})
+    if apply_promotions:
+        basket_lines = [BasketLine(line["product_id"], line["quantity"], line["unit_price"]) for line in lines]
+        discounts.update(promotion_engine.evaluate(basket_lines, _buyer_role(session, data), now, session))
+    subtotal = sum((line["total_price"] for line in lines), Decimal("0"))
+    discounts = _cap_discounts(claim_promotions(session, discounts, now), subtotal)
+    discount_amount = sum(discounts.values(), Decimal("0"))
+    net_amount = subtotal - discount_amount
+    tax_amount = money(net_amount * tax_rate)
+
+    transaction = session.scalars(
+        insert(Transaction).returning(Transaction),
+        [
+            {
+                "transaction_number": document_number("TRX", now),
+                "user_id": data.user_id,
+                "cashier_id": data.cashier_id,
+                "reseller_id": data.reseller_id,
+                "affiliate_id": data.affiliate_id,
+                "affiliate_link_id": data.affiliate_link_id,
+                "transaction_type": data.transaction_type,
+                "status": TransactionStatus.COMPLETED,
+                "subtotal": subtotal,
+                "discount_amount": discount_amount,
+                "tax_amount": tax_amount,
+                "total_amount": net_amount + tax_amount,
+                "payment_method": data.payment_method,
+                "notes": data.notes,
+                "created_at": now,
+                "completed_at": now,
+            }
+        ],
+    ).one()
+    if transaction.id is None:
+        raise RuntimeError("Transaction insert returned no id")
+
+    bulk_insert(
+        session, TransactionItem, [{**line, "transaction_id": transaction.id, "created_at": now} for line in lines]
+    )
+
+    totals = TotalsDelta()
+    totals.add_sale(data.reseller_id, data.affiliate_id, data.affiliate_link_id, net_amount)
+    if not defer_commissions:
+        commissions = _commission_rows(session, data, transaction.id, net_amount, now)
+        bulk_insert(session, Commission, commissions)
+        for row in commissions:
+            totals.add_commission(row["commission_type"], row["user_id"], row["commission_amount"])
+
+    if discounts:
+        bulk_insert(
+            session,
+            TransactionPromotion,
+            [
+                {"transaction_id": transaction.id, "promotion_id": promotion_id, "discount_amount": amount}
+                for promotion_id, amount in discounts.items()
+            ],
+        )
+
+    bulk_insert(
+        session,
+        Receipt,
+        [
+            {
+                "transaction_id": transaction.id,
+                "receipt_number": document_number("RCP", now),
+                "printed": False,
+                "email_sent": False,
+                "created_at": now,
+            }
+        ],
+    )
+
+    # the sale's last statements, so hot profiles and products stay locked only for the commit
+    add_to_totals(session, totals)
+    decrement_stock(session, quantities, transaction.transaction_number, created_by, now, oversell_policy)
+    invalidate_on_commit(session, quantities)
+    return transaction
+
+
+def checkout(
+    data: TransactionCreate,
+    promotion_discounts: Optional[Dict[int, Decimal]] = None,
+    tax_rate: Decimal = Decimal("0"),
+    defer_commissions: bool = DEFER_COMMISSIONS,
+    apply_promotions: bool = False,
+    oversell_policy: OversellPolicy = OVERSELL_POLICY,
+) -> Transaction:
+    """Commit a whole POS sale in a single database transaction"""
+    with get_session() as session:
+        try:
+            transaction = checkout_in_session(
+                session, data, promotion_discounts, tax_rate, defer_commissions, apply_promotions, oversell_policy
+            )
+            session.expunge(transaction)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+    return transaction
+
+
+async def checkout_async(
+    data: TransactionCreate,
+    promotion_discounts: Optional[Dict[int, Decimal]] = None,
+    tax_rate: Decimal = Decimal("0"),
+    defer_commissions: bool = DEFER_COMMISSIONS,
+    apply_promotions: bool = False,
+    oversell_policy: OversellPolicy = OVERSELL_POLICY,
+) -> Transaction:
+    """checkout() for the event loop: the same statements, awaited on an asyncpg connection"""
+    async with get_async_session() as session:
+        try:
+            transaction = await session.run_sync(
+                checkout_in_session,
+                data,
+                promotion_discounts,
+                tax_rate,
+                defer_commissions,
+                apply_promotions,
+                oversell_policy,
+            )
+            session.expunge(transaction)
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+    return transaction
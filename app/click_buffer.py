@@ -0,0 +1,334 @@
+"""Write-behind counting of affiliate link clicks.
+
+Incrementing affiliate_links.clicks once per click serializes every click on a busy link on one row lock.
+The tracking endpoint records clicks in memory instead, and flush() adds them to the links as one UPDATE per
+batch: every APP_CLICK_FLUSH_MS from the startup timer, or sooner once APP_CLICK_FLUSH_CLICKS are waiting.
+
+APP_CLICK_DURABILITY picks what a crash can lose:
+- memory: the clicks since the last flush.
+- journal: nothing the process acknowledged; each click is appended to a segment file in APP_CLICK_JOURNAL_DIR
+  before it is counted, and segments left by a crashed process are applied by the next flush.
+- fsync: as journal, and the append is fsynced before the click is acknowledged, so it survives power loss.
+  Concurrent clicks share an fsync.
+
+Each batch is applied with its id recorded in affiliate_click_batches in the same transaction, so a segment
+replayed after a crash between the commit and its deletion is not counted twice.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import col, select
+from starlette.responses import RedirectResponse, Response
+
+from app.database import TimeoutClass, get_async_session, get_session
+from app.models import AffiliateLink
+
+logger = logging.getLogger(__name__)
+
+
+class ClickDurability(str, Enum):
+    MEMORY = "memory"
+    JOURNAL = "journal"
+    FSYNC = "fsync"
+
+
+FLUSH_INTERVAL = int(os.environ.get("APP_CLICK_FLUSH_MS", "500")) / 1000
+FLUSH_CLICKS = int(os.environ.get("APP_CLICK_FLUSH_CLICKS", "1000"))
+DURABILITY = ClickDurability(os.environ.get("APP_CLICK_DURABILITY", "memory"))
+JOURNAL_DIR = os.environ.get("APP_CLICK_JOURNAL_DIR", "var/clicks")
+BATCH_RETENTION = timedelta(days=int(os.environ.get("APP_CLICK_BATCH_RETENTION_DAYS", "7")))
+PRUNE_INTERVAL = 3600
+# Where a click sends the visitor. This app has no product pages of its own: a link for a product goes to
+# APP_AFFILIATE_PRODUCT_URL (e.g. "https://shop.example.com/products/{product_id}") when the shop's is set,
+# everything else to APP_AFFILIATE_LANDING_URL.
+LANDING_URL = os.environ.get("APP_AFFILIATE_LANDING_URL", "/")
+PRODUCT_URL = os.environ.get("APP_AFFILIATE_PRODUCT_URL") or None
+
+# nothing is added when the batch id is already recorded; links are locked in id order, like the running totals
+APPLY_CLICKS = text(
+    """
+    WITH batch AS (
+        INSERT INTO affiliate_click_batches (id, clicks) VALUES (:batch_id, :clicks)
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id
+    ),
+    delta AS (
+        SELECT d.id, d.clicks FROM unnest(CAST(:ids AS integer[]), CAST(:counts AS integer[])) AS d(id, clicks)
+        WHERE EXISTS (SELECT 1 FROM batch)
+    ),
+    locked AS (
+        SELECT l.id FROM affiliate_links l WHERE l.id IN (SELECT id FROM delta) ORDER BY l.id FOR NO KEY UPDATE
+    ),
+    added AS (
+        UPDATE affiliate_links l SET clicks = l.clicks + delta.clicks
+        FROM delta JOIN locked ON locked.id = delta.id
+        WHERE l.id = delta.id
+    )
+    SELECT count(*) FROM batch
+    """
+)
+PRUNE_BATCHES = text("DELETE FROM affiliate_click_batches WHERE applied_at < :before")
+
+Batch = Tuple[str, Dict[int, int]]  # batch id -> clicks per link id
+
+
+class ClickBuffer:
+    """Click counts per link id waiting to be added to affiliate_links.clicks"""
+
+    def __init__(
+        self,
+        flush_clicks: int = FLUSH_CLICKS,
+        durability: ClickDurability = DURABILITY,
+        journal_dir: str = JOURNAL_DIR,
+    ):
+        self.flush_clicks = flush_clicks
+        self.durability = durability
+        self.journal_dir = Path(journal_dir)
+        self.flushed = 0
+        self._pending: Dict[int, int] = {}
+        self._pending_clicks = 0
+        self._batch_id = uuid.uuid4().hex
+        self._unapplied: List[Batch] = []  # sealed, in order, until their transaction commits
+        self._recovered = False
+        self._pruned_at = 0.0
+        # segment of the current batch, opened on its first click
+        self._segment: Optional[int] = None
+        self._written = 0
+        self._synced = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()  # taken before _lock
+        self._flush_lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending_clicks
+
+    def record(self, link_id: int) -> bool:
+        """Count one click; returns True once enough are waiting that the caller should schedule a flush.
+
+        With fsync durability this blocks on the disk: call it from a worker thread.
+        """
+        with self._lock:
+            if self.durability != ClickDurability.MEMORY:
+                if self._segment is None:
+                    self._segment = self._open_segment(self._batch_id)
+                os.write(self._segment, b"%d\n" % link_id)
+                self._written += 1
+            written = self._written
+            self._pending[link_id] = self._pending.get(link_id, 0) + 1
+            self._pending_clicks += 1
+            due = self._pending_clicks >= self.flush_clicks
+        if self.durability == ClickDurability.FSYNC:
+            self._sync(written)
+        return due
+
+    def _sync(self, written: int) -> None:
+        with self._sync_lock:
+            # whoever got here first fsynced the appends of everyone who waited behind it
+            if self._synced >= written:
+                return
+            with self._lock:
+                segment, target = self._segment, self._written
+            if segment is not None:
+                os.fsync(segment)
+            self._synced = target
+
+    def flush(self) -> int:
+        """Add the waiting clicks to their links; returns how many were added.
+
+        Returns 0 straight away when another flush is running: the clicks wait for the next one. A batch whose
+        transaction fails stays queued and is retried first next time.
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            if not self._recovered:
+                self._unapplied.extend(self._recover())
+                self._recovered = True
+            self._seal()
+            applied = 0
+            while self._unapplied:
+                batch_id, counts = self._unapplied[0]
+                try:
+                    applied += self._apply(batch_id, counts)
+                except SQLAlchemyError as e:
+                    logger.warning(f"Could not flush {len(self._unapplied)} click batches, retrying later: {e}")
+                    break
+                self._unapplied.pop(0)
+                if self.durability != ClickDurability.MEMORY:
+                    self._discard(batch_id)
+            self.flushed += applied
+            return applied
+        finally:
+            self._flush_lock.release()
+
+    def close(self) -> None:
+        """Flush, for shutdown; with a journal, clicks that could not be flushed wait in their segments"""
+        self.flush()
+        with self._sync_lock, self._lock:
+            if self._segment is not None:
+                os.close(self._segment)
+                self._segment = None
+            unflushed = self._pending_clicks + sum(sum(counts.values()) for _, counts in self._unapplied)
+        if unflushed and self.durability == ClickDurability.MEMORY:
+            logger.warning(f"Shutting down with {unflushed} clicks not flushed")
+
+    def _seal(self) -> None:
+        with self._sync_lock, self._lock:
+            if not self._pending:
+                return
+            self._unapplied.append((self._batch_id, self._pending))
+            if self._segment is not None:
+                if self.durability == ClickDurability.FSYNC:
+                    os.fsync(self._segment)
+                    self._synced = self._written
+                os.close(self._segment)
+                self._segment = None
+            self._batch_id = uuid.uuid4().hex
+            self._pending = {}
+            self._pending_clicks = 0
+
+    def _apply(self, batch_id: str, counts: Dict[int, int]) -> int:
+        ids = sorted(counts)
+        clicks = sum(counts.values())
+        with get_session(TimeoutClass.BATCH) as session:
+            new = session.execute(
+                APPLY_CLICKS,
+                {"batch_id": batch_id, "clicks": clicks, "ids": ids, "counts": [counts[link] for link in ids]},
+            ).scalar_one()
+            if time.monotonic() - self._pruned_at > PRUNE_INTERVAL:
+                session.execute(PRUNE_BATCHES, {"before": datetime.utcnow() - BATCH_RETENTION})
+                self._pruned_at = time.monotonic()
+            session.commit()
+        if not new:
+            logger.info(f"Click batch {batch_id} was already applied; dropped its {clicks} clicks")
+            return 0
+        return clicks
+
+    def _segment_path(self, batch_id: str) -> Path:
+        return self.journal_dir / f"clicks-{batch_id}.log"
+
+    def _open_segment(self, batch_id: str) -> int:
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        segment = os.open(self._segment_path(batch_id), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        # held while the segment is open, so another process sharing the directory leaves it alone
+        fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if self.durability == ClickDurability.FSYNC:
+            # the new directory entry has to reach the disk too
+            directory = os.open(self.journal_dir, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        return segment
+
+    def _discard(self, batch_id: str) -> None:
+        try:
+            self._segment_path(batch_id).unlink()
+        except FileNotFoundError:
+            # a recovered segment another process applied and deleted first
+            logger.debug(f"Click journal segment {batch_id} was already deleted")
+
+    def _recover(self) -> List[Batch]:
+        """Segments left behind by processes that stopped before flushing them"""
+        if self.durability == ClickDurability.MEMORY:
+            return []
+        recovered: List[Batch] = []
+        for path in sorted(self.journal_dir.glob("clicks-*.log")):
+            batch_id = path.stem[len("clicks-") :]
+            if batch_id == self._batch_id:
+                continue
+            try:
+                with path.open("rb") as segment:
+                    fcntl.flock(segment, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                    lines = segment.read().split(b"\n")
+            except BlockingIOError:
+                logger.debug(f"Skipping click journal segment {path}: a live process is still writing it")
+                continue
+            except FileNotFoundError:
+                logger.debug(f"Skipping click journal segment {path}: applied by another process since the listing")
+                continue
+            counts: Dict[int, int] = {}
+            # the last element is empty unless the crash tore the final append, which was never acknowledged
+            for line in lines[:-1]:
+                counts[int(line)] = counts.get(int(line), 0) + 1
+            if counts:
+                recovered.append((batch_id, counts))
+            else:
+                self._discard(batch_id)
+        if recovered:
+            clicks = sum(sum(counts.values()) for _, counts in recovered)
+            logger.info(f"Recovered {clicks} unflushed clicks from {len(recovered)} journal segments")
+        return recovered
+
+
+click_buffer = ClickBuffer()
+
+
+class LinkCodes:
+    """Active links' ids and product ids by link_code, kept for `ttl` seconds so a deactivated link stops counting
+    soon after"""
+
+    def __init__(self, ttl: float = 60, max_size: int = 100_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._links: Dict[str, Tuple[int, Optional[int], float]] = {}
+
+    async def resolve(self, link_code: str) -> Optional[Tuple[int, Optional[int]]]:
+        cached = self._links.get(link_code)
+        if cached is not None and time.monotonic() - cached[2] < self.ttl:
+            return cached[0], cached[1]
+        query = select(AffiliateLink.id, AffiliateLink.product_id).where(
+            AffiliateLink.link_code == link_code, col(AffiliateLink.is_active).is_(True)
+        )
+        async with get_async_session() as session:
+            link = (await session.exec(query)).first()
+        if link is None:
+            self._links.pop(link_code, None)
+            return None
+        if len(self._links) >= self.max_size:
+            self._links.clear()
+        link_id, product_id = link
+        self._links[link_code] = (link_id, product_id, time.monotonic())
+        return link_id, product_id
+
+    def clear(self) -> None:
+        self._links.clear()
+
+
+link_codes = LinkCodes()
+
+
+def redirect_url(
+    product_id: Optional[int], product_url: Optional[str] = PRODUCT_URL, landing_url: str = LANDING_URL
+) -> str:
+    if product_id is not None and product_url is not None:
+        return product_url.format(product_id=product_id)
+    return landing_url
+
+
+async def track_click(link_code: str) -> Response:
+    """Count a click on an active affiliate link and send the visitor on; 404 for unknown or inactive codes"""
+    link = await link_codes.resolve(link_code)
+    if link is None:
+        return Response(status_code=404)
+    link_id, product_id = link
+    if click_buffer.durability == ClickDurability.FSYNC:
+        due = await asyncio.to_thread(click_buffer.record, link_id)
+    else:
+        due = click_buffer.record(link_id)
+    if due:
+        asyncio.get_running_loop().run_in_executor(None, click_buffer.flush)
+    return RedirectResponse(redirect_url(product_id), status_code=302)
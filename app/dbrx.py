@@ -1,67 +1,402 @@
-from typing import List, Dict, Any, ClassVar, Sequence, TypeVar
-from databricks.sdk import WorkspaceClient
-from databricks.sdk.service.sql import StatementState, State
+import asyncio
+import os
+import threading
+import time
+import urllib.request
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Dict, Any, Awaitable, Callable, ClassVar, Iterator, Optional, Sequence, Tuple, Type, TypeVar
 
 from pydantic import BaseModel
 from logging import getLogger
 
+from app.dbrx_cache import cache_key, result_cache
+
 logger = getLogger(__name__)
 
 T = TypeVar("T", bound="DatabricksModel")
+R = TypeVar("R")
 
+# how long a chosen warehouse is reused before the list is read again; a stopped pick is re-checked sooner
+WAREHOUSE_TTL = float(os.environ.get("APP_DBRX_WAREHOUSE_TTL_SECONDS", "300"))
+STOPPED_WAREHOUSE_TTL = float(os.environ.get("APP_DBRX_STOPPED_WAREHOUSE_TTL_SECONDS", "15"))
+STATEMENT_WAIT = os.environ.get("APP_DBRX_STATEMENT_WAIT", "30s")
+# async queries: submitted without waiting, then polled every POLL_INITIAL seconds, doubling up to POLL_MAX
+POLL_INITIAL = float(os.environ.get("APP_DBRX_POLL_INITIAL_SECONDS", "0.25"))
+POLL_MAX = float(os.environ.get("APP_DBRX_POLL_MAX_SECONDS", "5"))
+QUERY_TIMEOUT = float(os.environ.get("APP_DBRX_QUERY_TIMEOUT_SECONDS", "300"))
+UNFINISHED = ("PENDING", "RUNNING")
+# after the inline wait: statements in these states, or pending on a warehouse in these, are retried elsewhere
+ABANDONED = ("CANCELED", "CLOSED")
+STOPPED = ("STOPPING", "STOPPED", "DELETING", "DELETED")
+LINK_TIMEOUT = float(os.environ.get("APP_DBRX_LINK_TIMEOUT_SECONDS", "60"))
 
-def execute_databricks_query(query: str) -> List[Dict[str, Any]]:
-    """helper function to execute SQL query via WorkspaceClient"""
-    client = WorkspaceClient()
+# JSON_ARRAY results are strings; these Databricks column types are parsed when rows are streamed typed
+PARSERS: Dict[str, Callable[[str], Any]] = {
+    "BYTE": int,
+    "SHORT": int,
+    "INT": int,
+    "LONG": int,
+    "FLOAT": float,
+    "DOUBLE": float,
+    "DECIMAL": Decimal,
+    "BOOLEAN": lambda value: value.lower() == "true",
+    "DATE": date.fromisoformat,
+    "TIMESTAMP": datetime.fromisoformat,
+}
+
+
+def _state(value: Any) -> Optional[str]:
+    # SDK enums and plain strings alike, so the client can be swapped for a local fake
+    return getattr(value, "value", value)
+
+
+def _sql_option(enum: str, value: str) -> Any:
+    """The SDK's enum member for an execute_statement option; the plain string without the SDK (the fake)"""
+    try:
+        from databricks.sdk.service import sql
+    except ImportError:
+        return value
+    return getattr(sql, enum)(value)
+
+
+def _not_found() -> Type[Exception]:
+    """The SDK's error for a missing resource; LookupError without the SDK (the fake)"""
+    try:
+        from databricks.sdk.errors import NotFound
+    except ImportError:
+        return LookupError
+    return NotFound
+
+
+def _workspace_client() -> Any:
+    # the SDK is optional and slow to import: load it on the first query, not with the app
+    from databricks.sdk import WorkspaceClient
+
+    return WorkspaceClient()
+
+
+class DatabricksClient:
+    """Process-wide WorkspaceClient plus the warehouse to run statements on, cached for `warehouse_ttl` seconds.
+
+    A running warehouse is preferred; when none is, the first one is used (the statement starts it) and the
+    choice is re-checked after `stopped_ttl` seconds. A statement still pending or running after the inline
+    wait is polled to completion, unless it was cancelled or closed under us or is queued on a warehouse that
+    stopped or went away: that drops the cached choice and the statement is retried once elsewhere.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any] = _workspace_client,
+        warehouse_ttl: float = WAREHOUSE_TTL,
+        stopped_ttl: float = STOPPED_WAREHOUSE_TTL,
+        poll_initial: float = POLL_INITIAL,
+        poll_max: float = POLL_MAX,
+        statement_wait: str = STATEMENT_WAIT,
+    ):
+        self.warehouse_ttl = warehouse_ttl
+        self.stopped_ttl = stopped_ttl
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.statement_wait = statement_wait
+        self._client_factory = client_factory
+        self._client: Any = None
+        self._warehouse_id: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
 
-    # use warehouse to execute query
-    running_warehouses = [x for x in client.warehouses.list() if x.state == State.RUNNING]
-    if not running_warehouses:
-        warehouse = list(client.warehouses.list())[0]
-    else:
-        warehouse = running_warehouses[0]
+    @property
+    def client(self) -> Any:
+        with self._lock:
+            if self._client is None:
+                self._client = self._client_factory()
+            return self._client
 
-    if warehouse.id is None:
-        raise RuntimeError("Warehouse ID is None")
+    def warehouse_id(self) -> str:
+        with self._lock:
+            if self._warehouse_id is not None and time.monotonic() < self._expires_at:
+                return self._warehouse_id
+        warehouses = list(self.client.warehouses.list())
+        if not warehouses:
+            raise RuntimeError("No SQL warehouse available")
+        running = [warehouse for warehouse in warehouses if _state(warehouse.state) == "RUNNING"]
+        warehouse = running[0] if running else warehouses[0]
+        if warehouse.id is None:
+            raise RuntimeError("Warehouse ID is None")
+        with self._lock:
+            self._warehouse_id = warehouse.id
+            self._expires_at = time.monotonic() + (self.warehouse_ttl if running else self.stopped_ttl)
+        return warehouse.id
 
-    logger.info(f"Executing query {query.replace('\n', '\t')} on warehouse: {warehouse.id}")
-    execution = client.statement_execution.execute_statement(
-        warehouse_id=warehouse.id, statement=query, wait_timeout="30s"
-    )
+    def forget_warehouse(self, warehouse_id: Optional[str] = None) -> None:
+        """Drop the cached choice (only if it is still `warehouse_id`, when given)"""
+        with self._lock:
+            if warehouse_id is None or self._warehouse_id == warehouse_id:
+                self._warehouse_id = None
 
-    if execution.status is None:
-        raise RuntimeError("Execution status is None")
+    def execute(self, query: str) -> List[Dict[str, Any]]:
+        warehouse_id = self.warehouse_id()
+        execution = self._execute_on(warehouse_id, query, self.statement_wait)
+        if self._stuck(warehouse_id, execution):
+            self._cancel(execution)
+            self.forget_warehouse(warehouse_id)
+            retry_on = self.warehouse_id()
+            if retry_on == warehouse_id:
+                raise RuntimeError(
+                    f"Query {_state(execution.status.state)} on warehouse {warehouse_id}, no other to retry on"
+                )
+            logger.warning(f"Warehouse {warehouse_id} did not run the query, retrying on {retry_on}")
+            execution = self._execute_on(retry_on, query, self.statement_wait)
+        return self._all_rows(self._poll(execution))
 
-    if execution.status.state != StatementState.SUCCEEDED:
-        error_msg = f"Query failed with state: {execution.status.state}"
+    def _stuck(self, warehouse_id: str, execution: Any) -> bool:
+        """Whether the statement will not finish where it is: cancelled or closed, or queued on a stopped warehouse"""
+        state = _state(execution.status.state)
+        if state in ABANDONED:
+            return True
+        if state != "PENDING":
+            return False
+        # anything but a missing warehouse (auth, network, throttling) is raised, not retried elsewhere
+        try:
+            warehouse = self.client.warehouses.get(warehouse_id)
+        except _not_found() as exc:
+            logger.warning(f"Warehouse {warehouse_id} no longer exists: {exc}")
+            return True
+        return _state(warehouse.state) in STOPPED
+
+    async def execute_async(self, query: str, timeout: float = QUERY_TIMEOUT) -> List[Dict[str, Any]]:
+        """execute() for the event loop: submit without waiting, then poll with backoff.
+
+        Only the short SDK calls run in worker threads, so concurrent queries do not each hold one for the
+        statement's duration. Cancelling the awaiting task (the page was closed) cancels the statement too.
+        """
+        warehouse_id = await asyncio.to_thread(self.warehouse_id)
+        execution = await asyncio.to_thread(self._execute_on, warehouse_id, query, "0s")
+        deadline = time.monotonic() + timeout
+        delay = self.poll_initial
+        try:
+            while _state(execution.status.state) in UNFINISHED:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Query still {_state(execution.status.state)} after {timeout:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.poll_max)
+                execution = await asyncio.to_thread(
+                    self.client.statement_execution.get_statement, execution.statement_id
+                )
+        except (asyncio.CancelledError, TimeoutError):
+            await asyncio.shield(asyncio.to_thread(self._cancel, execution))
+            raise
+        return await asyncio.to_thread(self._all_rows, execution)
+
+    def stream_rows(self, query: str, typed: bool = True) -> Iterator[Dict[str, Any]]:
+        """Rows as dicts, one result chunk in memory at a time; `typed` parses numbers, decimals, dates..."""
+        execution = self._run(query)
+        names, parsers = _columns(execution, typed)
+        for chunk in self._chunks(execution):
+            for row in chunk.data_array or []:
+                yield {name: _parse(parser, value) for name, parser, value in zip(names, parsers, row)}
+
+    def stream_batches(self, query: str) -> Iterator[Dict[str, List[Any]]]:
+        """Typed columns per result chunk, {column: [values]}, for consumers that work column-wise"""
+        execution = self._run(query)
+        names, parsers = _columns(execution, typed=True)
+        for chunk in self._chunks(execution):
+            rows = chunk.data_array or []
+            yield {
+                name: [_parse(parser, row[position]) for row in rows]
+                for position, (name, parser) in enumerate(zip(names, parsers))
+            }
+
+    def stream_arrow(self, query: str) -> Iterator[Any]:
+        """pyarrow.RecordBatch objects read from the result's external links, one link at a time.
+
+        For exports too large for inline results: the warehouse writes Arrow files to cloud storage and each
+        chunk's link is only requested once the previous chunk has been consumed, so links do not expire
+        while waiting. Needs pyarrow, imported here.
+        """
+        import pyarrow.ipc
+
+        execution = self._run(
+            query,
+            disposition=_sql_option("Disposition", "EXTERNAL_LINKS"),
+            format=_sql_option("Format", "ARROW_STREAM"),
+        )
+        for chunk in self._chunks(execution):
+            for link in chunk.external_links or []:
+                # presigned URLs: the workspace token must not be sent along
+                with urllib.request.urlopen(link.external_link, timeout=LINK_TIMEOUT) as response:
+                    yield from pyarrow.ipc.open_stream(response)
+
+    def _run(self, query: str, timeout: float = QUERY_TIMEOUT, **options: Any) -> Any:
+        """Submit, then poll with backoff until the statement succeeded (raises otherwise)"""
+        execution = self._poll(self._execute_on(self.warehouse_id(), query, **options), timeout)
+        _check(execution)
+        return execution
+
+    def _poll(self, execution: Any, timeout: float = QUERY_TIMEOUT) -> Any:
+        """Poll with backoff until the statement is no longer pending or running; cancelled if interrupted"""
+        deadline = time.monotonic() + timeout
+        delay = self.poll_initial
+        try:
+            while _state(execution.status.state) in UNFINISHED:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Query still {_state(execution.status.state)} after {timeout:.0f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.poll_max)
+                execution = self.client.statement_execution.get_statement(execution.statement_id)
+        except BaseException:
+            self._cancel(execution)
+            raise
+        return execution
+
+    def _chunks(self, execution: Any) -> Iterator[Any]:
+        """Every result chunk in order; chunks after the first are fetched as the caller gets to them"""
+        chunk = execution.result
+        while chunk is not None:
+            yield chunk
+            if chunk.next_chunk_index is None:
+                return
+            chunk = self.client.statement_execution.get_statement_result_chunk_n(
+                execution.statement_id, chunk.next_chunk_index
+            )
+
+    def _all_rows(self, execution: Any) -> List[Dict[str, Any]]:
+        _check(execution)
+        names, _ = _columns(execution, typed=False)
+        return [dict(zip(names, row)) for chunk in self._chunks(execution) for row in chunk.data_array or []]
+
+    def _execute_on(self, warehouse_id: str, query: str, wait_timeout: str = STATEMENT_WAIT, **options: Any) -> Any:
+        single_line = query.replace("\n", "\t")
+        logger.info(f"Executing query {single_line} on warehouse: {warehouse_id}")
+        try:
+            execution = self.client.statement_execution.execute_statement(
+                warehouse_id=warehouse_id, statement=query, wait_timeout=wait_timeout, **options
+            )
+        except Exception:
+            self.forget_warehouse(warehouse_id)
+            raise
+        if execution.status is None:
+            raise RuntimeError("Execution status is None")
+        return execution
+
+    def _cancel(self, execution: Any) -> None:
+        if getattr(execution, "statement_id", None) is not None:
+            self.client.statement_execution.cancel_execution(execution.statement_id)
+
+
+def _check(execution: Any) -> None:
+    if _state(execution.status.state) != "SUCCEEDED":
+        error_msg = f"Query failed with state: {_state(execution.status.state)}"
         if execution.status.error is not None:
             error_msg += f" - {execution.status.error.message}"
         raise RuntimeError(error_msg)
 
-    # convert result to dictionaries
-    if (
-        execution.result is not None
-        and execution.result.data_array is not None
-        and execution.manifest is not None
-        and execution.manifest.schema is not None
-        and execution.manifest.schema.columns is not None
-    ):
-        col_names = [col.name or "" for col in execution.manifest.schema.columns]
-        rows = execution.result.data_array
-        return [dict(zip(col_names, row)) for row in rows]
 
-    return []
+def _columns(execution: Any, typed: bool) -> Tuple[List[str], List[Optional[Callable[[str], Any]]]]:
+    """Column names and, when `typed`, the parser of each column's values (None keeps the string)"""
+    if execution.manifest is None or execution.manifest.schema is None or execution.manifest.schema.columns is None:
+        return [], []
+    columns = execution.manifest.schema.columns
+    names = [column.name or "" for column in columns]
+    if not typed:
+        return names, [None] * len(columns)
+    return names, [PARSERS.get(_state(getattr(column, "type_name", None)) or "") for column in columns]
+
+
+def _parse(parser: Optional[Callable[[str], Any]], value: Optional[str]) -> Any:
+    return parser(value) if parser is not None and value is not None else value
+
+
+databricks_client = DatabricksClient()
+
+
+def execute_databricks_query(query: str) -> List[Dict[str, Any]]:
+    """helper function to execute SQL query via the process-wide WorkspaceClient"""
+    return databricks_client.execute(query)
+
+
+def stream_databricks_query(query: str, typed: bool = True) -> Iterator[Dict[str, Any]]:
+    """Rows of a large result, walking all chunks lazily instead of building one list"""
+    return databricks_client.stream_rows(query, typed)
+
+
+async def execute_databricks_query_async(query: str) -> List[Dict[str, Any]]:
+    """execute_databricks_query() without blocking the event loop; cancellable"""
+    return await databricks_client.execute_async(query)
+
+
+async def fetch_concurrently(*fetches: Awaitable[R]) -> List[R]:
+    """Await several fetches at once, so a dashboard waits for the slowest query rather than the sum.
+
+    Results come back in argument order. If one fails, or the caller is cancelled, the others are cancelled.
+    """
+    async with asyncio.TaskGroup() as group:
+        tasks = [group.create_task(fetch) for fetch in fetches]  # type: ignore[arg-type]
+    return [task.result() for task in tasks]
+
+
+async def cancel_on_disconnect(client: Any, work: Awaitable[R]) -> R:
+    """Await `work` for a NiceGUI page, cancelling it (and its statements) if the page's client goes away"""
+    task = asyncio.ensure_future(work)
+    client.on_disconnect(task.cancel)
+    try:
+        return await task
+    finally:
+        if task.cancel in client.disconnect_handlers:
+            client.disconnect_handlers.remove(task.cancel)
 
 
 class DatabricksModel(BaseModel):
     __catalog__: ClassVar[str]
     __schema__: ClassVar[str]
     __table__: ClassVar[str]
+    # seconds a result is reused for the same query and parameters; 0 runs the query on every fetch
+    __cache_ttl__: ClassVar[float] = 0
 
     @classmethod
     def table_name(cls) -> str:
         return f"{cls.__catalog__}.{cls.__schema__}.{cls.__table__}"
 
     @classmethod
-    def fetch(cls: type[T], **params) -> Sequence[T]:
+    def query(cls, **params) -> str:
+        """SQL for fetch(); implement this, or fetch() itself for models that need more than one query"""
         raise NotImplementedError(f"Must implement fetch() method, but {cls.__name__} does not have it.")
+
+    @classmethod
+    def fetch(cls: type[T], **params) -> Sequence[T]:
+        query = cls.query(**params)
+        return [cls.model_validate(row) for row in cls.cached_rows(query, params, lambda: cls.execute(query))]
+
+    @classmethod
+    def cached_rows(
+        cls, query: str, params: Dict[str, Any], load: Callable[[], List[Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """Rows from the result cache for this table, query and parameters, loaded when missing or expired"""
+        return result_cache.get(cache_key(cls.table_name(), query, params), cls.__cache_ttl__, load)
+
+    @classmethod
+    async def cached_rows_async(
+        cls, query: str, params: Dict[str, Any], load: Callable[[], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """cached_rows() with an awaited `load`"""
+        return await result_cache.get_async(cache_key(cls.table_name(), query, params), cls.__cache_ttl__, load)
+
+    @classmethod
+    def execute(cls, query: str) -> List[Dict[str, Any]]:
+        return execute_databricks_query(query)
+
+    @classmethod
+    async def execute_async(cls, query: str) -> List[Dict[str, Any]]:
+        return await execute_databricks_query_async(query)
+
+    @classmethod
+    async def fetch_async(cls: type[T], **params) -> Sequence[T]:
+        """fetch() without blocking the event loop; cancelling the awaiting task cancels the statement.
+
+        A model that overrides fetch() itself gets it run in a worker thread instead, which cannot be cancelled.
+        """
+        if cls.fetch.__func__ is not DatabricksModel.fetch.__func__:  # type: ignore[attr-defined]
+            return await asyncio.to_thread(cls.fetch, **params)
+        query = cls.query(**params)
+        rows = await cls.cached_rows_async(query, params, lambda: cls.execute_async(query))
+        return [cls.model_validate(row) for row in rows]
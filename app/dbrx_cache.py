@@ -0,0 +1,242 @@
+"""Result cache for Databricks queries, keyed by table, query text and parameters.
+
+Entries live in an in-memory LRU and, when APP_DBRX_CACHE_DIR is set, as JSON files there, so a restarted
+process (or a sibling container sharing the volume) starts warm. Decimal, date and datetime values are tagged
+in the files and read back as such; rows holding anything else JSON cannot represent stay in memory only.
+
+Only one caller refreshes an expired key: the others get the stale rows while it runs (for up to `max_stale`
+seconds past expiry), or wait for it when there is nothing to serve. A failed refresh falls back to stale rows
+within the same window.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Rows = List[Dict[str, Any]]
+
+CACHE_DIR = os.environ.get("APP_DBRX_CACHE_DIR") or None
+CACHE_MAX_ENTRIES = int(os.environ.get("APP_DBRX_CACHE_MAX_ENTRIES", "256"))
+CACHE_MAX_STALE = float(os.environ.get("APP_DBRX_CACHE_MAX_STALE_SECONDS", "300"))
+
+
+def cache_key(table: str, query: str, params: Dict[str, Any]) -> str:
+    return json.dumps([table, query, params], sort_keys=True, default=str)
+
+
+def _encode(value: Any) -> Dict[str, str]:
+    # datetime before date: it is one
+    if isinstance(value, datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {"__type__": "date", "value": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__type__": "decimal", "value": str(value)}
+    raise TypeError(f"{type(value).__name__} cannot be stored in the result cache")
+
+
+def _decode(stored: Dict[str, Any]) -> Any:
+    match stored.get("__type__"):
+        case "datetime":
+            return datetime.fromisoformat(stored["value"])
+        case "date":
+            return date.fromisoformat(stored["value"])
+        case "decimal":
+            return Decimal(stored["value"])
+        case _:
+            return stored
+
+
+class CachedResult:
+    __slots__ = ("rows", "expires_at")
+
+    def __init__(self, rows: Rows, expires_at: float):
+        self.rows = rows
+        # wall-clock time, so entries read back from disk expire correctly in another process
+        self.expires_at = expires_at
+
+
+class ResultCache:
+    """Read-through LRU of query results with per-call TTLs, optional disk persistence and stampede protection"""
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        directory: Optional[str] = CACHE_DIR,
+        max_stale: float = CACHE_MAX_STALE,
+    ):
+        self.max_entries = max_entries
+        self.directory = Path(directory) if directory else None
+        self.max_stale = max_stale
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, CachedResult] = OrderedDict()
+        self._refreshing: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, ttl: float, load: Callable[[], Rows]) -> Rows:
+        """Cached rows for `key`, calling `load` when they are missing or older than `ttl` seconds"""
+        if ttl <= 0:
+            return load()
+        while True:
+            rows, entry, refreshing = self._lookup(key)
+            if rows is not None:
+                return rows
+            if refreshing is None:
+                break
+            # nothing to serve yet: wait for the refresh in flight, then look again
+            refreshing.wait()
+        try:
+            rows = load()
+            self.put(key, rows, ttl)
+            return rows
+        except Exception:
+            if self._serves_stale(entry):
+                logger.warning("Refreshing a cached Databricks result failed; serving the stale rows", exc_info=True)
+                return entry.rows  # type: ignore[union-attr]
+            raise
+        finally:
+            self._refreshed(key)
+
+    async def get_async(self, key: str, ttl: float, load: Callable[[], Awaitable[Rows]]) -> Rows:
+        """get() for the event loop: `load` is awaited, and waiting on another caller's refresh happens in a thread"""
+        if ttl <= 0:
+            return await load()
+        while True:
+            rows, entry, refreshing = self._lookup(key)
+            if rows is not None:
+                return rows
+            if refreshing is None:
+                break
+            await asyncio.to_thread(refreshing.wait)
+        try:
+            rows = await load()
+            self.put(key, rows, ttl)
+            return rows
+        except Exception:
+            if self._serves_stale(entry):
+                logger.warning("Refreshing a cached Databricks result failed; serving the stale rows", exc_info=True)
+                return entry.rows  # type: ignore[union-attr]
+            raise
+        finally:
+            # also when the awaiting task is cancelled
+            self._refreshed(key)
+
+    def _lookup(self, key: str) -> Tuple[Optional[Rows], Optional[CachedResult], Optional[threading.Event]]:
+        """Rows to serve; else the refresh in flight to wait for; else no refresh, and the caller now runs it"""
+        entry = self._entry(key)
+        with self._lock:
+            now = time.time()
+            if entry is not None and now < entry.expires_at:
+                self.hits += 1
+                return entry.rows, entry, None
+            refreshing = self._refreshing.get(key)
+            if refreshing is None:
+                self._refreshing[key] = threading.Event()
+                self.misses += 1
+                return None, entry, None
+            if entry is not None and now < entry.expires_at + self.max_stale:
+                self.stale_hits += 1
+                return entry.rows, entry, None
+            return None, entry, refreshing
+
+    def _serves_stale(self, entry: Optional[CachedResult]) -> bool:
+        return entry is not None and time.time() < entry.expires_at + self.max_stale
+
+    def _refreshed(self, key: str) -> None:
+        # waiters look again only once the new rows are in place
+        with self._lock:
+            self._refreshing.pop(key).set()
+
+    def put(self, key: str, rows: Rows, ttl: float) -> None:
+        entry = CachedResult(rows, time.time() + ttl)
+        with self._lock:
+            self._remember(key, entry)
+        if self.directory is None:
+            return
+        path = self._path(self.directory, key)
+        partial = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            partial.write_text(json.dumps({"key": key, "expires_at": entry.expires_at, "rows": rows}, default=_encode))
+            partial.replace(path)
+        except (OSError, TypeError):
+            # the memory copy is enough to serve from; persistence is best effort
+            logger.warning(f"Could not persist a cached Databricks result to {path}", exc_info=True)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.directory is not None:
+            self._path(self.directory, key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.stale_hits = self.misses = 0
+        if self.directory is not None:
+            for path in self.directory.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+            }
+
+    def _entry(self, key: str) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.directory is None:
+            return None
+        path = self._path(self.directory, key)
+        try:
+            stored = json.loads(path.read_text(), object_hook=_decode)
+            if stored.get("key") != key:
+                return None
+            entry = CachedResult(stored["rows"], stored["expires_at"])
+        except FileNotFoundError:
+            logger.debug(f"No cached Databricks result in {path}")
+            return None
+        except (ValueError, KeyError, AttributeError):
+            # e.g. torn by a full disk; the next refresh overwrites it
+            logger.warning(f"Ignoring the unreadable cached Databricks result {path}", exc_info=True)
+            return None
+        with self._lock:
+            self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: CachedResult) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _path(directory: Path, key: str) -> Path:
+        return directory / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+
+result_cache = ResultCache()
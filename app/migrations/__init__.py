@@ -0,0 +1,124 @@
+"""Versioned schema migrations.
+
+Each revision is a module here with REVISION, DESCRIPTION and upgrade(engine), listed in order in REVISIONS.
+Revisions are frozen once shipped: a model change gets a new revision, and tests/test_migrations.py fails
+until the migrated schema matches the models again. Applied revisions are recorded in schema_migrations.
+
+Startup only reads that table (ensure_schema); `python -m app.migrations upgrade` applies what is pending.
+A database built by create_all() before migrations existed is adopted at the baseline and upgraded from
+there; the later revisions check the catalog before each step, so they skip whatever is already in place.
+"""
+
+import logging
+import os
+import time
+from types import ModuleType
+from typing import List, Optional, Set
+
+from sqlalchemy import Connection, Engine, text
+
+from app.database import ENGINES, TimeoutClass
+from app.migrations import (
+    r0001_baseline,
+    r0002_hot_query_indexes,
+    r0003_monthly_partitions,
+    r0004_sales_rollups,
+    r0005_affiliate_link_sales,
+    r0006_affiliate_click_batches,
+    r0007_reseller_closure_and_counters,
+)
+
+logger = logging.getLogger(__name__)
+
+REVISIONS: List[ModuleType] = [
+    r0001_baseline,
+    r0002_hot_query_indexes,
+    r0003_monthly_partitions,
+    r0004_sales_rollups,
+    r0005_affiliate_link_sales,
+    r0006_affiliate_click_batches,
+    r0007_reseller_closure_and_counters,
+]
+HEAD = REVISIONS[-1].REVISION
+
+# "check" refuses to start with pending revisions, which `python -m app.migrations upgrade` applies before the
+# deploy; "auto" applies them at startup instead, backfills and table swaps included: opt in where that is fine
+MIGRATE_MODE = os.environ.get("APP_DB_MIGRATE", "check")
+
+CREATE_VERSION_TABLE = text(
+    """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        revision VARCHAR(50) PRIMARY KEY,
+        description VARCHAR(200) NOT NULL,
+        applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT timezone('utc', now()),
+        duration_ms INTEGER NOT NULL
+    )
+    """
+)
+RECORD = text(
+    "INSERT INTO schema_migrations (revision, description, duration_ms) VALUES (:revision, :description, :ms)"
+)
+APPLIED = text("SELECT revision FROM schema_migrations")
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def applied_revisions(connection: Connection) -> Set[str]:
+    if connection.execute(text("SELECT to_regclass('schema_migrations')")).scalar_one() is None:
+        return set()
+    return set(connection.execute(APPLIED).scalars())
+
+
+def pending_revisions(applied: Set[str]) -> List[ModuleType]:
+    return [revision for revision in REVISIONS if revision.REVISION not in applied]
+
+
+def upgrade(engine: Optional[Engine] = None) -> List[str]:
+    """Apply pending revisions in order; returns the ones applied"""
+    engine = engine or ENGINES[TimeoutClass.BATCH]
+    done: List[str] = []
+    with engine.connect() as lock:
+        # session-level, so it spans the revisions' own transactions; other instances wait here
+        lock.execute(text("SELECT pg_advisory_lock(hashtext('app.migrations'))"))
+        lock.commit()
+        try:
+            with engine.begin() as connection:
+                connection.execute(CREATE_VERSION_TABLE)
+                applied = applied_revisions(connection)
+                if not applied and connection.execute(text("SELECT to_regclass('users')")).scalar_one() is not None:
+                    logger.info("Adopting a database created before migrations at the baseline revision")
+                    connection.execute(
+                        RECORD, {"revision": "0001", "description": "baseline schema (adopted)", "ms": 0}
+                    )
+                    applied.add("0001")
+            for revision in pending_revisions(applied):
+                started = time.perf_counter()
+                revision.upgrade(engine)
+                ms = round((time.perf_counter() - started) * 1000)
+                with engine.begin() as connection:
+                    connection.execute(
+                        RECORD, {"revision": revision.REVISION, "description": revision.DESCRIPTION, "ms": ms}
+                    )
+                logger.info(f"Applied schema revision {revision.REVISION} ({revision.DESCRIPTION}) in {ms} ms")
+                done.append(revision.REVISION)
+        finally:
+            lock.execute(text("SELECT pg_advisory_unlock(hashtext('app.migrations'))"))
+            lock.commit()
+    return done
+
+
+def ensure_schema(engine: Optional[Engine] = None, mode: str = MIGRATE_MODE) -> List[str]:
+    """Startup check: one query when the schema is current, instead of create_all() reflecting every table"""
+    engine = engine or ENGINES[TimeoutClass.BATCH]
+    with engine.connect() as connection:
+        pending = pending_revisions(applied_revisions(connection))
+    if not pending:
+        return []
+    if mode != "auto":
+        raise SchemaOutOfDate(
+            f"Database is missing schema revisions {[revision.REVISION for revision in pending]}; "
+            "run `python -m app.migrations upgrade`"
+        )
+    return upgrade(engine)
@@ -0,0 +1,29 @@
+import argparse
+import logging
+
+from app.database import ENGINES, TimeoutClass
+from app.migrations import REVISIONS, applied_revisions, upgrade
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations", description="Schema revisions")
+    parser.add_argument("command", choices=["upgrade", "status"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    match args.command:
+        case "upgrade":
+            applied = upgrade()
+            logger.info(f"Applied {', '.join(applied)}" if applied else "Schema is up to date")
+        case "status":
+            with ENGINES[TimeoutClass.BATCH].connect() as connection:
+                applied = applied_revisions(connection)
+            for revision in REVISIONS:
+                state = "applied" if revision.REVISION in applied else "pending"
+                logger.info(f"{revision.REVISION}  {state:8} {revision.DESCRIPTION}")
+
+
+if __name__ == "__main__":
+    main()
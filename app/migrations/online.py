@@ -0,0 +1,131 @@
+"""DDL helpers that keep the app serving while a revision runs.
+
+Long work (index builds, constraint validation, backfills) runs in autocommit with CONCURRENTLY or NOT VALID,
+so it never holds a lock that blocks writes. The short catalog changes that do need an exclusive lock run in
+their own transaction under a lock_timeout, retried a few times instead of queueing checkouts behind them.
+Every helper checks the catalog first, so an interrupted revision can simply be run again.
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, TypeVar
+
+from sqlalchemy import Connection, Engine, text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LOCK_TIMEOUT = os.environ.get("APP_MIGRATION_LOCK_TIMEOUT", "2s")
+LOCK_ATTEMPTS = int(os.environ.get("APP_MIGRATION_LOCK_ATTEMPTS", "10"))
+LOCK_NOT_AVAILABLE = "55P03"
+
+RELATION_KIND = text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)")
+PARTITIONS = text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:name) ORDER BY 1")
+INDEX_VALID = text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)")
+# tables whose index is already attached to the partitioned index `name`
+INDEXED_PARTITIONS = text(
+    """
+    SELECT x.indrelid::regclass::text
+    FROM pg_inherits i JOIN pg_index x ON x.indexrelid = i.inhrelid
+    WHERE i.inhparent = to_regclass(:name)
+    """
+)
+CONSTRAINT_VALID = text(
+    "SELECT convalidated FROM pg_constraint WHERE conrelid = to_regclass(:table) AND conname = :name"
+)
+
+
+@contextmanager
+def autocommit(engine: Engine) -> Iterator[Connection]:
+    """A connection where every statement commits on its own; needed for CONCURRENTLY"""
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text(f"SET lock_timeout = '{LOCK_TIMEOUT}'"))
+        try:
+            yield connection
+        finally:
+            connection.execute(text("RESET lock_timeout"))
+
+
+def in_transaction(engine: Engine, work: Callable[[Connection], T]) -> T:
+    """Run `work` in one short transaction, retrying when its locks are not granted within LOCK_TIMEOUT"""
+    attempt = 1
+    while True:
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                return work(connection)
+        except OperationalError as exc:
+            if getattr(exc.orig, "pgcode", None) != LOCK_NOT_AVAILABLE or attempt >= LOCK_ATTEMPTS:
+                raise
+            logger.warning(f"Migration step did not get its locks within {LOCK_TIMEOUT} ({attempt}/{LOCK_ATTEMPTS})")
+            time.sleep(min(attempt, 5))
+            attempt += 1
+
+
+def relation_kind(connection: Connection, name: str) -> Optional[str]:
+    """pg_class.relkind: 'r' table, 'p' partitioned table, 'i' / 'I' index; None when missing"""
+    return connection.execute(RELATION_KIND, {"name": name}).scalar_one_or_none()
+
+
+def partitions(connection: Connection, table: str) -> List[str]:
+    return list(connection.execute(PARTITIONS, {"name": table}).scalars())
+
+
+def create_index(connection: Connection, name: str, table: str, definition: str, unique: bool = False) -> bool:
+    """CREATE INDEX CONCURRENTLY `name` ON `table` `definition`, e.g. "(user_id) WHERE is_paid IS FALSE".
+
+    Postgres cannot build a partitioned index concurrently, so a partitioned table gets an index ON ONLY the
+    parent and one concurrent build per partition, attached to it. An invalid index left behind by an
+    interrupted build is dropped and built again. Returns False when a valid index already exists.
+    """
+    valid = connection.execute(INDEX_VALID, {"name": name}).scalar_one_or_none()
+    if valid:
+        return False
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    if relation_kind(connection, table) == "p":
+        if valid is None:
+            connection.execute(text(f"CREATE {kind} {name} ON ONLY {table} {definition}"))
+        done = set(connection.execute(INDEXED_PARTITIONS, {"name": name}).scalars())
+        for partition in partitions(connection, table):
+            if partition in done:
+                continue
+            child = f"{name}_{partition.removeprefix(f'{table}_')}"
+            create_index(connection, child, partition, definition, unique)
+            connection.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+        return True
+    if valid is False:
+        connection.execute(text(f"DROP INDEX CONCURRENTLY {name}"))
+    connection.execute(text(f"CREATE {kind} CONCURRENTLY {name} ON {table} {definition}"))
+    return True
+
+
+def add_check(connection: Connection, table: str, name: str, expression: str) -> None:
+    """Add a CHECK without a write-blocking scan: NOT VALID first, then VALIDATE under a weaker lock"""
+    validated = connection.execute(CONSTRAINT_VALID, {"table": table, "name": name}).scalar_one_or_none()
+    if validated is None:
+        connection.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} CHECK ({expression}) NOT VALID"))
+    if not validated:
+        connection.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}"))
+
+
+def add_unique(connection: Connection, table: str, name: str, columns: str) -> None:
+    """Build the unique index concurrently, then turn it into a constraint (a catalog-only change)"""
+    create_index(connection, name, table, f"({columns})", unique=True)
+    if connection.execute(CONSTRAINT_VALID, {"table": table, "name": name}).scalar_one_or_none() is None:
+        connection.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}"))
+
+
+def add_foreign_key(connection: Connection, table: str, name: str, column: str, references: str) -> None:
+    """Add a FOREIGN KEY without a write-blocking scan: NOT VALID first, then VALIDATE under a weaker lock"""
+    validated = connection.execute(CONSTRAINT_VALID, {"table": table, "name": name}).scalar_one_or_none()
+    if validated is None:
+        connection.execute(
+            text(f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES {references} NOT VALID")
+        )
+    if not validated:
+        connection.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}"))
@@ -0,0 +1,264 @@
+"""Schema as create_all() built it before migrations existed (enums are stored by name)"""
+
+from sqlalchemy import Engine, text
+
+REVISION = "0001"
+DESCRIPTION = "baseline schema"
+
+BASELINE = text(
+    """
+    CREATE TYPE userrole AS ENUM ('ADMIN', 'CASHIER', 'RESELLER', 'AFFILIATE', 'CONSUMER');
+    CREATE TYPE transactiontype AS ENUM ('POS', 'ONLINE');
+    CREATE TYPE transactionstatus AS ENUM ('PENDING', 'COMPLETED', 'CANCELLED', 'REFUNDED');
+    CREATE TYPE promotiontype AS ENUM ('PERCENTAGE', 'FIXED_AMOUNT', 'BUY_X_GET_Y');
+
+    CREATE TABLE categories (
+        id SERIAL NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        description VARCHAR(500),
+        parent_category_id INTEGER,
+        is_active BOOLEAN NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(parent_category_id) REFERENCES categories (id)
+    );
+
+    CREATE TABLE promotions (
+        id SERIAL NOT NULL,
+        name VARCHAR(200) NOT NULL,
+        description VARCHAR(1000),
+        promotion_type promotiontype NOT NULL,
+        discount_value NUMERIC(10, 2) NOT NULL,
+        min_purchase_amount NUMERIC(10, 2),
+        max_discount_amount NUMERIC(10, 2),
+        start_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        end_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        is_active BOOLEAN NOT NULL,
+        usage_limit INTEGER,
+        usage_count INTEGER NOT NULL,
+        applicable_roles JSON,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id)
+    );
+
+    CREATE TABLE settings (
+        id SERIAL NOT NULL,
+        key VARCHAR(100) NOT NULL,
+        value VARCHAR(1000) NOT NULL,
+        description VARCHAR(500),
+        updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (key)
+    );
+
+    CREATE TABLE users (
+        id SERIAL NOT NULL,
+        username VARCHAR(100) NOT NULL,
+        email VARCHAR(255) NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        full_name VARCHAR(200) NOT NULL,
+        phone VARCHAR(20),
+        role userrole NOT NULL,
+        is_active BOOLEAN NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (username),
+        UNIQUE (email)
+    );
+
+    CREATE TABLE affiliate_profiles (
+        id SERIAL NOT NULL,
+        user_id INTEGER NOT NULL,
+        affiliate_code VARCHAR(50) NOT NULL,
+        commission_rate NUMERIC(8, 4) NOT NULL,
+        total_sales NUMERIC(15, 2) NOT NULL,
+        total_commission NUMERIC(15, 2) NOT NULL,
+        is_active BOOLEAN NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (user_id),
+        FOREIGN KEY(user_id) REFERENCES users (id),
+        UNIQUE (affiliate_code)
+    );
+
+    CREATE TABLE products (
+        id SERIAL NOT NULL,
+        name VARCHAR(200) NOT NULL,
+        description VARCHAR(1000),
+        sku VARCHAR(100) NOT NULL,
+        barcode VARCHAR(100),
+        category_id INTEGER NOT NULL,
+        base_price NUMERIC(10, 2) NOT NULL,
+        cost_price NUMERIC(10, 2) NOT NULL,
+        stock_quantity INTEGER NOT NULL,
+        min_stock_level INTEGER NOT NULL,
+        is_active BOOLEAN NOT NULL,
+        image_url VARCHAR(500),
+        weight NUMERIC(8, 2),
+        dimensions JSON,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (sku),
+        FOREIGN KEY(category_id) REFERENCES categories (id)
+    );
+
+    CREATE TABLE reseller_profiles (
+        id SERIAL NOT NULL,
+        user_id INTEGER NOT NULL,
+        level INTEGER NOT NULL,
+        parent_reseller_id INTEGER,
+        referral_code VARCHAR(50) NOT NULL,
+        commission_rate NUMERIC(8, 4) NOT NULL,
+        total_sales NUMERIC(15, 2) NOT NULL,
+        total_commission NUMERIC(15, 2) NOT NULL,
+        is_active BOOLEAN NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (user_id),
+        FOREIGN KEY(user_id) REFERENCES users (id),
+        FOREIGN KEY(parent_reseller_id) REFERENCES reseller_profiles (id),
+        UNIQUE (referral_code)
+    );
+
+    CREATE TABLE transactions (
+        id SERIAL NOT NULL,
+        transaction_number VARCHAR(50) NOT NULL,
+        user_id INTEGER,
+        cashier_id INTEGER,
+        reseller_id INTEGER,
+        affiliate_id INTEGER,
+        transaction_type transactiontype NOT NULL,
+        status transactionstatus NOT NULL,
+        subtotal NUMERIC(15, 2) NOT NULL,
+        discount_amount NUMERIC(15, 2) NOT NULL,
+        tax_amount NUMERIC(15, 2) NOT NULL,
+        total_amount NUMERIC(15, 2) NOT NULL,
+        payment_method VARCHAR(50) NOT NULL,
+        notes VARCHAR(1000),
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        completed_at TIMESTAMP WITHOUT TIME ZONE,
+        PRIMARY KEY (id),
+        UNIQUE (transaction_number),
+        FOREIGN KEY(user_id) REFERENCES users (id),
+        FOREIGN KEY(cashier_id) REFERENCES users (id),
+        FOREIGN KEY(reseller_id) REFERENCES users (id),
+        FOREIGN KEY(affiliate_id) REFERENCES users (id)
+    );
+
+    CREATE TABLE affiliate_links (
+        id SERIAL NOT NULL,
+        affiliate_profile_id INTEGER NOT NULL,
+        product_id INTEGER,
+        link_code VARCHAR(100) NOT NULL,
+        clicks INTEGER NOT NULL,
+        conversions INTEGER NOT NULL,
+        total_sales NUMERIC(15, 2) NOT NULL,
+        is_active BOOLEAN NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(affiliate_profile_id) REFERENCES affiliate_profiles (id),
+        FOREIGN KEY(product_id) REFERENCES products (id),
+        UNIQUE (link_code)
+    );
+
+    CREATE TABLE commissions (
+        id SERIAL NOT NULL,
+        user_id INTEGER NOT NULL,
+        transaction_id INTEGER NOT NULL,
+        commission_type VARCHAR(50) NOT NULL,
+        level INTEGER,
+        base_amount NUMERIC(15, 2) NOT NULL,
+        commission_rate NUMERIC(8, 4) NOT NULL,
+        commission_amount NUMERIC(15, 2) NOT NULL,
+        is_paid BOOLEAN NOT NULL,
+        paid_at TIMESTAMP WITHOUT TIME ZONE,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id),
+        FOREIGN KEY(transaction_id) REFERENCES transactions (id)
+    );
+
+    CREATE TABLE product_reseller_prices (
+        id SERIAL NOT NULL,
+        product_id INTEGER NOT NULL,
+        reseller_profile_id INTEGER,
+        reseller_level INTEGER,
+        price NUMERIC(10, 2) NOT NULL,
+        is_active BOOLEAN NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(product_id) REFERENCES products (id),
+        FOREIGN KEY(reseller_profile_id) REFERENCES reseller_profiles (id)
+    );
+
+    CREATE TABLE promotion_products (
+        id SERIAL NOT NULL,
+        promotion_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(promotion_id) REFERENCES promotions (id),
+        FOREIGN KEY(product_id) REFERENCES products (id)
+    );
+
+    CREATE TABLE receipts (
+        id SERIAL NOT NULL,
+        transaction_id INTEGER NOT NULL,
+        receipt_number VARCHAR(50) NOT NULL,
+        printed BOOLEAN NOT NULL,
+        printed_at TIMESTAMP WITHOUT TIME ZONE,
+        email_sent BOOLEAN NOT NULL,
+        email_sent_at TIMESTAMP WITHOUT TIME ZONE,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (transaction_id),
+        FOREIGN KEY(transaction_id) REFERENCES transactions (id),
+        UNIQUE (receipt_number)
+    );
+
+    CREATE TABLE stock_movements (
+        id SERIAL NOT NULL,
+        product_id INTEGER NOT NULL,
+        movement_type VARCHAR(50) NOT NULL,
+        quantity INTEGER NOT NULL,
+        previous_quantity INTEGER NOT NULL,
+        new_quantity INTEGER NOT NULL,
+        reference_number VARCHAR(100),
+        notes VARCHAR(500),
+        created_by INTEGER NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(product_id) REFERENCES products (id),
+        FOREIGN KEY(created_by) REFERENCES users (id)
+    );
+
+    CREATE TABLE transaction_items (
+        id SERIAL NOT NULL,
+        transaction_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        unit_price NUMERIC(10, 2) NOT NULL,
+        discount_amount NUMERIC(10, 2) NOT NULL,
+        total_price NUMERIC(15, 2) NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(transaction_id) REFERENCES transactions (id),
+        FOREIGN KEY(product_id) REFERENCES products (id)
+    );
+
+    CREATE TABLE transaction_promotions (
+        id SERIAL NOT NULL,
+        transaction_id INTEGER NOT NULL,
+        promotion_id INTEGER NOT NULL,
+        discount_amount NUMERIC(10, 2) NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(transaction_id) REFERENCES transactions (id),
+        FOREIGN KEY(promotion_id) REFERENCES promotions (id)
+    );
+    """
+)
+
+
+def upgrade(engine: Engine) -> None:
+    with engine.begin() as connection:
+        connection.execute(BASELINE)
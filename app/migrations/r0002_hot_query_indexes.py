@@ -0,0 +1,56 @@
+"""Indexes and constraints for the hot queries (history, settlement, payouts, catalog), built online"""
+
+from sqlalchemy import Engine, text
+
+from app.migrations.online import add_check, add_unique, autocommit, create_index
+
+REVISION = "0002"
+DESCRIPTION = "hot query indexes and constraints"
+
+INDEXES = [
+    ("ix_transactions_cashier_id_id", "transactions", "(cashier_id, id)"),
+    ("ix_transactions_user_id_id", "transactions", "(user_id, id) WHERE user_id IS NOT NULL"),
+    ("ix_transactions_created_at", "transactions", "(created_at)"),
+    ("ix_transactions_status_created_at", "transactions", "(status, created_at)"),
+    (
+        "ix_transactions_commissionable_completed_at",
+        "transactions",
+        "(completed_at) WHERE status = 'COMPLETED' AND (reseller_id IS NOT NULL OR affiliate_id IS NOT NULL)",
+    ),
+    ("ix_transaction_items_transaction_id", "transaction_items", "(transaction_id)"),
+    ("ix_transaction_items_product_id", "transaction_items", "(product_id)"),
+    ("ix_commissions_transaction_id", "commissions", "(transaction_id)"),
+    ("ix_commissions_user_id_created_at", "commissions", "(user_id, created_at)"),
+    ("ix_commissions_unpaid_user_id", "commissions", "(user_id) WHERE is_paid IS FALSE"),
+    ("ix_stock_movements_product_id_created_at", "stock_movements", "(product_id, created_at)"),
+    ("ix_products_active_category_name", "products", "(category_id, name) WHERE is_active IS TRUE"),
+    ("ix_reseller_profiles_parent_reseller_id", "reseller_profiles", "(parent_reseller_id)"),
+    ("ix_promotion_products_product_id", "promotion_products", "(product_id)"),
+    ("ix_transaction_promotions_transaction_id", "transaction_promotions", "(transaction_id)"),
+    ("ix_transaction_promotions_promotion_id", "transaction_promotions", "(promotion_id)"),
+    ("ix_affiliate_links_affiliate_profile_id", "affiliate_links", "(affiliate_profile_id)"),
+]
+
+CHECKS = [
+    ("transaction_items", "ck_transaction_items_quantity_positive", "quantity > 0"),
+]
+
+# the unique index would fail on duplicate links; they are redundant, keep the oldest
+DELETE_DUPLICATE_LINKS = text(
+    """
+    DELETE FROM promotion_products a USING promotion_products b
+    WHERE a.promotion_id = b.promotion_id AND a.product_id = b.product_id AND a.id > b.id
+    """
+)
+
+
+def upgrade(engine: Engine) -> None:
+    with autocommit(engine) as connection:
+        for name, table, definition in INDEXES:
+            create_index(connection, name, table, definition)
+        connection.execute(DELETE_DUPLICATE_LINKS)
+        add_unique(
+            connection, "promotion_products", "uq_promotion_products_promotion_product", "promotion_id, product_id"
+        )
+        for table, name, expression in CHECKS:
+            add_check(connection, table, name, expression)
@@ -0,0 +1,158 @@
+"""Turn the history tables into monthly range partitioned tables without rewriting them.
+
+Each existing table becomes the DEFAULT partition of a new partitioned parent: its rows stay where they are and
+partition maintenance (app.partitions) moves months out of it as their partitions are attached. Everything
+slow happens beforehand with concurrent builds and batched updates; the swap itself is one short transaction
+of catalog changes, and ATTACH reuses the indexes and foreign keys the old table already has. The parent's
+constraints are named explicitly: the old table still holds the default names when the parent is created.
+
+An empty table gets this month's and the coming months' partitions in the swap, as create_all() does. Otherwise
+only the coming months are attached afterwards, fenced off while this month's rows keep landing in the default
+partition; maintenance attaches the current month once it is over.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Connection, Engine, text
+
+from app.migrations.online import autocommit, create_index, in_transaction, relation_kind
+from app.partitions import create_months, ensure_partitions, upcoming_months
+
+REVISION = "0003"
+DESCRIPTION = "monthly partitions for transaction_items, commissions and stock_movements"
+
+BACKFILL_BATCH = 10_000
+
+PARENTS = {
+    "transaction_items": [
+        """
+        CREATE TABLE transaction_items (
+            id INTEGER DEFAULT nextval('transaction_items_id_seq') NOT NULL,
+            transaction_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price NUMERIC(10, 2) NOT NULL,
+            discount_amount NUMERIC(10, 2) NOT NULL,
+            total_price NUMERIC(15, 2) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT timezone('utc', now()) NOT NULL,
+            PRIMARY KEY (id, created_at),
+            CONSTRAINT ck_transaction_items_quantity_positive CHECK (quantity > 0),
+            CONSTRAINT transaction_items_transaction_id_fkey FOREIGN KEY(transaction_id) REFERENCES transactions (id),
+            CONSTRAINT transaction_items_product_id_fkey FOREIGN KEY(product_id) REFERENCES products (id)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        "CREATE INDEX ix_transaction_items_product_id ON transaction_items (product_id)",
+        "CREATE INDEX ix_transaction_items_transaction_id ON transaction_items (transaction_id)",
+    ],
+    "commissions": [
+        """
+        CREATE TABLE commissions (
+            id INTEGER DEFAULT nextval('commissions_id_seq') NOT NULL,
+            user_id INTEGER NOT NULL,
+            transaction_id INTEGER NOT NULL,
+            commission_type VARCHAR(50) NOT NULL,
+            level INTEGER,
+            base_amount NUMERIC(15, 2) NOT NULL,
+            commission_rate NUMERIC(8, 4) NOT NULL,
+            commission_amount NUMERIC(15, 2) NOT NULL,
+            is_paid BOOLEAN NOT NULL,
+            paid_at TIMESTAMP WITHOUT TIME ZONE,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (id, created_at),
+            CONSTRAINT commissions_user_id_fkey FOREIGN KEY(user_id) REFERENCES users (id),
+            CONSTRAINT commissions_transaction_id_fkey FOREIGN KEY(transaction_id) REFERENCES transactions (id)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        "CREATE INDEX ix_commissions_transaction_id ON commissions (transaction_id)",
+        "CREATE INDEX ix_commissions_unpaid_user_id ON commissions (user_id) WHERE is_paid IS FALSE",
+        "CREATE INDEX ix_commissions_user_id_created_at ON commissions (user_id, created_at)",
+    ],
+    "stock_movements": [
+        """
+        CREATE TABLE stock_movements (
+            id INTEGER DEFAULT nextval('stock_movements_id_seq') NOT NULL,
+            product_id INTEGER NOT NULL,
+            movement_type VARCHAR(50) NOT NULL,
+            quantity INTEGER NOT NULL,
+            previous_quantity INTEGER NOT NULL,
+            new_quantity INTEGER NOT NULL,
+            reference_number VARCHAR(100),
+            notes VARCHAR(500),
+            created_by INTEGER NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (id, created_at),
+            CONSTRAINT stock_movements_product_id_fkey FOREIGN KEY(product_id) REFERENCES products (id),
+            CONSTRAINT stock_movements_created_by_fkey FOREIGN KEY(created_by) REFERENCES users (id)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        "CREATE INDEX ix_stock_movements_product_id_created_at ON stock_movements (product_id, created_at)",
+    ],
+}
+
+HAS_CREATED_AT = text(
+    """
+    SELECT count(*) FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'transaction_items' AND column_name = 'created_at'
+    """
+)
+# a non-volatile default adds the column without a table rewrite; backfilled rows then get their sale's time
+ADD_CREATED_AT = text(
+    """
+    ALTER TABLE transaction_items
+    ADD COLUMN created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT timezone('utc', now()) NOT NULL
+    """
+)
+BACKFILL_CREATED_AT = text(
+    """
+    UPDATE transaction_items i SET created_at = t.created_at
+    FROM transactions t
+    WHERE t.id = i.transaction_id AND i.id > :after AND i.id <= :after + :batch AND i.created_at <> t.created_at
+    """
+)
+OTHER_INDEXES = text(
+    """
+    SELECT indexname FROM pg_indexes
+    WHERE schemaname = current_schema() AND tablename = :table AND indexname <> :primary_key
+    """
+)
+
+
+def _add_item_times(connection: Connection) -> None:
+    if not connection.execute(HAS_CREATED_AT).scalar_one():
+        connection.execute(ADD_CREATED_AT)
+    low, high = connection.execute(text("SELECT min(id), max(id) FROM transaction_items")).one()
+    if low is None:
+        return
+    for after in range(low - 1, high, BACKFILL_BATCH):
+        connection.execute(BACKFILL_CREATED_AT, {"after": after, "batch": BACKFILL_BATCH})
+
+
+def _swap(connection: Connection, table: str) -> None:
+    if relation_kind(connection, table) == "p":
+        return
+    primary_key = f"{table}_default_pkey"
+    connection.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {table}_pkey"))
+    connection.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {primary_key} PRIMARY KEY USING INDEX {primary_key}"))
+    # free the index names for the parent; ATTACH pairs the renamed ones with the parent's by definition
+    for name in connection.execute(OTHER_INDEXES, {"table": table, "primary_key": primary_key}).scalars().all():
+        connection.execute(text(f"ALTER INDEX {name} RENAME TO {name}_default"))
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_default"))
+    for statement in PARENTS[table]:
+        connection.execute(text(statement))
+    connection.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+    connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {table}_default DEFAULT"))
+    if connection.execute(text(f"SELECT NOT EXISTS (SELECT FROM {table}_default)")).scalar_one():
+        create_months(connection, table, upcoming_months(datetime.utcnow()))
+
+
+def upgrade(engine: Engine) -> None:
+    for table in PARENTS:
+        with autocommit(engine) as connection:
+            if relation_kind(connection, table) == "p":
+                continue
+            if table == "transaction_items":
+                _add_item_times(connection)
+            # the partitioned primary key must include created_at
+            create_index(connection, f"{table}_default_pkey", table, "(id, created_at)", unique=True)
+        in_transaction(engine, lambda connection: _swap(connection, table))
+    ensure_partitions(since=datetime.utcnow(), engine=engine)
@@ -0,0 +1,122 @@
+"""Sales rollup tables, and the trigger on transactions that queues their sales events.
+
+The trigger only sees status changes from now on: run `python -m app.sales_rollups rebuild` once to roll up
+the sales already in the database. Creating a trigger briefly locks transactions against writes, so that step
+runs under the migration lock timeout.
+"""
+
+import logging
+
+from sqlalchemy import Connection, Engine, text
+
+from app.migrations.online import autocommit, in_transaction
+
+logger = logging.getLogger(__name__)
+
+REVISION = "0004"
+DESCRIPTION = "sales rollup tables and the transactions sales event trigger"
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS sales_events (
+        id SERIAL NOT NULL,
+        transaction_id INTEGER NOT NULL,
+        sale_sign INTEGER NOT NULL,
+        refund_sign INTEGER NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT timezone('utc', now()) NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cashier_sales_rollups (
+        grain VARCHAR(10) NOT NULL,
+        bucket TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        subtotal NUMERIC(15, 2) NOT NULL,
+        discount_amount NUMERIC(15, 2) NOT NULL,
+        tax_amount NUMERIC(15, 2) NOT NULL,
+        total_amount NUMERIC(15, 2) NOT NULL,
+        refund_count INTEGER NOT NULL,
+        refunded_amount NUMERIC(15, 2) NOT NULL,
+        cashier_id INTEGER NOT NULL,
+        PRIMARY KEY (grain, bucket, cashier_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reseller_sales_rollups (
+        grain VARCHAR(10) NOT NULL,
+        bucket TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        subtotal NUMERIC(15, 2) NOT NULL,
+        discount_amount NUMERIC(15, 2) NOT NULL,
+        tax_amount NUMERIC(15, 2) NOT NULL,
+        total_amount NUMERIC(15, 2) NOT NULL,
+        refund_count INTEGER NOT NULL,
+        refunded_amount NUMERIC(15, 2) NOT NULL,
+        reseller_id INTEGER NOT NULL,
+        PRIMARY KEY (grain, bucket, reseller_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_sales_rollups (
+        grain VARCHAR(10) NOT NULL,
+        bucket TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        quantity INTEGER NOT NULL,
+        total_price NUMERIC(15, 2) NOT NULL,
+        discount_amount NUMERIC(15, 2) NOT NULL,
+        refunded_quantity INTEGER NOT NULL,
+        refunded_amount NUMERIC(15, 2) NOT NULL,
+        product_id INTEGER NOT NULL,
+        PRIMARY KEY (grain, bucket, product_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS category_sales_rollups (
+        grain VARCHAR(10) NOT NULL,
+        bucket TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        quantity INTEGER NOT NULL,
+        total_price NUMERIC(15, 2) NOT NULL,
+        discount_amount NUMERIC(15, 2) NOT NULL,
+        refunded_quantity INTEGER NOT NULL,
+        refunded_amount NUMERIC(15, 2) NOT NULL,
+        category_id INTEGER NOT NULL,
+        PRIMARY KEY (grain, bucket, category_id)
+    )
+    """,
+]
+
+FUNCTION = """
+CREATE OR REPLACE FUNCTION record_sales_event() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    sales integer := (NEW.status IN ('COMPLETED', 'REFUNDED'))::integer;
+    refunds integer := (NEW.status = 'REFUNDED')::integer;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        sales := sales - (OLD.status IN ('COMPLETED', 'REFUNDED'))::integer;
+        refunds := refunds - (OLD.status = 'REFUNDED')::integer;
+    END IF;
+    IF sales <> 0 OR refunds <> 0 THEN
+        INSERT INTO sales_events (transaction_id, sale_sign, refund_sign) VALUES (NEW.id, sales, refunds);
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+TRIGGER = """
+CREATE OR REPLACE TRIGGER transactions_sales_events
+AFTER INSERT OR UPDATE OF status ON transactions
+FOR EACH ROW EXECUTE FUNCTION record_sales_event()
+"""
+
+
+def _create_trigger(connection: Connection) -> None:
+    connection.execute(text(FUNCTION))
+    connection.execute(text(TRIGGER))
+
+
+def upgrade(engine: Engine) -> None:
+    with autocommit(engine) as connection:
+        for statement in TABLES:
+            connection.execute(text(statement))
+    in_transaction(engine, _create_trigger)
+    logger.info("Sales rollups start empty; run `python -m app.sales_rollups rebuild` to roll up past sales")
@@ -0,0 +1,37 @@
+"""Attribute sales to the affiliate link they came through, for the links' running totals.
+
+The new column is nullable without a default, so adding it is a catalog change; the foreign key is added
+NOT VALID and validated afterwards. The running totals start at whatever the columns held: the first run of
+app.running_totals.verify_running_totals() (at startup) sets them from the history.
+"""
+
+from sqlalchemy import Connection, Engine, text
+
+from app.migrations.online import add_foreign_key, autocommit, in_transaction
+
+REVISION = "0005"
+DESCRIPTION = "transactions.affiliate_link_id"
+
+HAS_COLUMN = text(
+    """
+    SELECT count(*) FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'transactions' AND column_name = 'affiliate_link_id'
+    """
+)
+
+
+def _add_column(connection: Connection) -> None:
+    if not connection.execute(HAS_COLUMN).scalar_one():
+        connection.execute(text("ALTER TABLE transactions ADD COLUMN affiliate_link_id INTEGER"))
+
+
+def upgrade(engine: Engine) -> None:
+    in_transaction(engine, _add_column)
+    with autocommit(engine) as connection:
+        add_foreign_key(
+            connection,
+            "transactions",
+            "transactions_affiliate_link_id_fkey",
+            "affiliate_link_id",
+            "affiliate_links (id)",
+        )
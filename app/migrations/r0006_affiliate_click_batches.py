@@ -0,0 +1,29 @@
+"""Ids of the click batches app.click_buffer has added to affiliate_links.clicks.
+
+A new table no request reads or writes yet, so it and its index are created plainly.
+"""
+
+from sqlalchemy import Engine, text
+
+from app.migrations.online import autocommit
+
+REVISION = "0006"
+DESCRIPTION = "affiliate_click_batches"
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS affiliate_click_batches (
+        id VARCHAR(64) NOT NULL,
+        clicks INTEGER NOT NULL,
+        applied_at TIMESTAMP WITHOUT TIME ZONE DEFAULT timezone('utc', now()) NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_affiliate_click_batches_applied_at ON affiliate_click_batches (applied_at)",
+]
+
+
+def upgrade(engine: Engine) -> None:
+    with autocommit(engine) as connection:
+        for statement in STATEMENTS:
+            connection.execute(text(statement))
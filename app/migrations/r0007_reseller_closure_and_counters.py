@@ -0,0 +1,54 @@
+"""Tables and indexes added to the models before migrations existed, for databases adopted at the baseline.
+
+The reseller closure is rebuilt from parent_reseller_id and every promotion gets its usage counter shards, as
+the services that maintain them expect. Databases built from an earlier copy of the baseline already have
+all of it; every step checks first.
+"""
+
+from sqlalchemy import Engine, text
+
+from app.migrations.online import add_check, autocommit, create_index, in_transaction
+from app.promotion_counters import create_missing_counters
+from app.reseller_service import rebuild_closure
+
+REVISION = "0007"
+DESCRIPTION = "reseller closure, promotion usage counters and lookup indexes"
+
+# new and empty, so creating them only takes brief locks on the tables they reference
+TABLES = text(
+    """
+    CREATE TABLE IF NOT EXISTS reseller_closure (
+        ancestor_id INTEGER NOT NULL,
+        descendant_id INTEGER NOT NULL,
+        depth INTEGER NOT NULL,
+        PRIMARY KEY (ancestor_id, descendant_id),
+        FOREIGN KEY(ancestor_id) REFERENCES reseller_profiles (id),
+        FOREIGN KEY(descendant_id) REFERENCES reseller_profiles (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS promotion_usage_counters (
+        promotion_id INTEGER NOT NULL,
+        shard INTEGER NOT NULL,
+        used INTEGER NOT NULL,
+        remaining INTEGER,
+        PRIMARY KEY (promotion_id, shard),
+        FOREIGN KEY(promotion_id) REFERENCES promotions (id)
+    );
+    """
+)
+
+INDEXES = [
+    ("ix_reseller_closure_descendant_depth", "reseller_closure", "(descendant_id, depth)"),
+    ("ix_products_barcode", "products", "(barcode)"),
+    ("ix_product_reseller_prices_product_id", "product_reseller_prices", "(product_id)"),
+]
+
+
+def upgrade(engine: Engine) -> None:
+    in_transaction(engine, lambda connection: connection.execute(TABLES))
+    with autocommit(engine) as connection:
+        for name, table, definition in INDEXES:
+            create_index(connection, name, table, definition)
+        add_check(connection, "promotion_usage_counters", "ck_promotion_usage_counters_remaining", "remaining >= 0")
+    rebuild_closure(engine)
+    create_missing_counters(engine)
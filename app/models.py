@@ -1,4 +1,5 @@
-from sqlmodel import SQLModel, Field, Relationship, JSON, Column
+from sqlalchemy import event
+from sqlmodel import SQLModel, Field, Relationship, JSON, Column, Index, CheckConstraint, UniqueConstraint, text
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from decimal import Decimal
@@ -50,7 +51,9 @@ class User(SQLModel, table=True):
     # Relationships
     reseller_profile: Optional["ResellerProfile"] = Relationship(back_populates="user")
     affiliate_profile: Optional["AffiliateProfile"] = Relationship(back_populates="user")
-    transactions: List["Transaction"] = Relationship(back_populates="user")
+    transactions: List["Transaction"] = Relationship(
+        back_populates="user", sa_relationship_kwargs={"foreign_keys": "[Transaction.user_id]"}
+    )
     commissions: List["Commission"] = Relationship(back_populates="user")
 
 
@@ -61,7 +64,7 @@ class ResellerProfile(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.id", unique=True)
     level: int = Field(ge=1, le=10)  # Levels 1-10
-    parent_reseller_id: Optional[int] = Field(default=None, foreign_key="reseller_profiles.id")
+    parent_reseller_id: Optional[int] = Field(default=None, foreign_key="reseller_profiles.id", index=True)
     referral_code: str = Field(unique=True, max_length=50)
     commission_rate: Decimal = Field(default=Decimal("0"), decimal_places=4, max_digits=8)
     total_sales: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=15)
@@ -78,6 +81,16 @@ class ResellerProfile(SQLModel, table=True):
     product_prices: List["ProductResellerPrice"] = Relationship(back_populates="reseller_profile")
 
 
+# Ancestor closure of the reseller hierarchy: one row per (ancestor, descendant) pair, depth 0 for self
+class ResellerClosure(SQLModel, table=True):
+    __tablename__ = "reseller_closure"  # type: ignore[assignment]
+    __table_args__ = (Index("ix_reseller_closure_descendant_depth", "descendant_id", "depth"),)
+
+    ancestor_id: int = Field(foreign_key="reseller_profiles.id", primary_key=True)
+    descendant_id: int = Field(foreign_key="reseller_profiles.id", primary_key=True)
+    depth: int = Field(ge=0)
+
+
 # Affiliate profile
 class AffiliateProfile(SQLModel, table=True):
     __tablename__ = "affiliate_profiles"  # type: ignore[assignment]
@@ -118,12 +131,17 @@ class Category(SQLModel, table=True):
 # Product model
 class Product(SQLModel, table=True):
     __tablename__ = "products"  # type: ignore[assignment]
+    # catalog browsing only ever lists active products; partial predicates are spelled the way
+    # queries filter (`col(...).is_(True)`), otherwise the planner cannot prove they apply
+    __table_args__ = (
+        Index("ix_products_active_category_name", "category_id", "name", postgresql_where=text("is_active IS TRUE")),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(max_length=200)
     description: Optional[str] = Field(default=None, max_length=1000)
     sku: str = Field(unique=True, max_length=100)
-    barcode: Optional[str] = Field(default=None, max_length=100)
+    barcode: Optional[str] = Field(default=None, max_length=100, index=True)
     category_id: int = Field(foreign_key="categories.id")
     base_price: Decimal = Field(decimal_places=2, max_digits=10)
     cost_price: Decimal = Field(decimal_places=2, max_digits=10)
@@ -149,7 +167,7 @@ class ProductResellerPrice(SQLModel, table=True):
     __tablename__ = "product_reseller_prices"  # type: ignore[assignment]
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    product_id: int = Field(foreign_key="products.id")
+    product_id: int = Field(foreign_key="products.id", index=True)
     reseller_profile_id: Optional[int] = Field(default=None, foreign_key="reseller_profiles.id")
     reseller_level: Optional[int] = Field(default=None, ge=1, le=10)
     price: Decimal = Field(decimal_places=2, max_digits=10)
@@ -164,6 +182,18 @@ class ProductResellerPrice(SQLModel, table=True):
 # Transaction model
 class Transaction(SQLModel, table=True):
     __tablename__ = "transactions"  # type: ignore[assignment]
+    __table_args__ = (
+        # history screens: newest first per cashier / customer
+        Index("ix_transactions_cashier_id_id", "cashier_id", "id"),
+        Index("ix_transactions_user_id_id", "user_id", "id", postgresql_where=text("user_id IS NOT NULL")),
+        Index("ix_transactions_status_created_at", "status", "created_at"),
+        # settlement scans completed sales with someone to pay
+        Index(
+            "ix_transactions_commissionable_completed_at",
+            "completed_at",
+            postgresql_where=text("status = 'COMPLETED' AND (reseller_id IS NOT NULL OR affiliate_id IS NOT NULL)"),
+        ),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     transaction_number: str = Field(unique=True, max_length=50)
@@ -171,6 +201,7 @@ class Transaction(SQLModel, table=True):
     cashier_id: Optional[int] = Field(default=None, foreign_key="users.id")
     reseller_id: Optional[int] = Field(default=None, foreign_key="users.id")
     affiliate_id: Optional[int] = Field(default=None, foreign_key="users.id")
+    affiliate_link_id: Optional[int] = Field(default=None, foreign_key="affiliate_links.id")
     transaction_type: TransactionType = Field(default=TransactionType.POS)
     status: TransactionStatus = Field(default=TransactionStatus.PENDING)
     subtotal: Decimal = Field(decimal_places=2, max_digits=15)
@@ -179,27 +210,44 @@ class Transaction(SQLModel, table=True):
     total_amount: Decimal = Field(decimal_places=2, max_digits=15)
     payment_method: str = Field(max_length=50)
     notes: Optional[str] = Field(default=None, max_length=1000)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     completed_at: Optional[datetime] = Field(default=None)
 
     # Relationships
-    user: Optional[User] = Relationship(back_populates="transactions")
+    user: Optional[User] = Relationship(
+        back_populates="transactions", sa_relationship_kwargs={"foreign_keys": "[Transaction.user_id]"}
+    )
     items: List["TransactionItem"] = Relationship(back_populates="transaction")
     commissions: List["Commission"] = Relationship(back_populates="transaction")
     promotions: List["TransactionPromotion"] = Relationship(back_populates="transaction")
 
 
-# Transaction items
+# Append-only history tables are range partitioned by month on created_at (see app.partitions).
+# Postgres wants the partition key in the primary key, hence (id, created_at).
+MONTHLY_PARTITIONS = {"postgresql_partition_by": "RANGE (created_at)"}
+
+
+# Transaction items; created_at is the sale's, so a transaction's lines share a partition
 class TransactionItem(SQLModel, table=True):
     __tablename__ = "transaction_items"  # type: ignore[assignment]
+    __table_args__ = (
+        CheckConstraint("quantity > 0", name="ck_transaction_items_quantity_positive"),
+        MONTHLY_PARTITIONS,
+    )
 
-    id: Optional[int] = Field(default=None, primary_key=True)
-    transaction_id: int = Field(foreign_key="transactions.id")
-    product_id: int = Field(foreign_key="products.id")
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
+    transaction_id: int = Field(foreign_key="transactions.id", index=True)
+    product_id: int = Field(foreign_key="products.id", index=True)
     quantity: int = Field(gt=0)
     unit_price: Decimal = Field(decimal_places=2, max_digits=10)
     discount_amount: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=10)
     total_price: Decimal = Field(decimal_places=2, max_digits=15)
+    # the server default covers writers that predate the column
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        primary_key=True,
+        sa_column_kwargs={"server_default": text("timezone('utc', now())")},
+    )
 
     # Relationships
     transaction: Transaction = Relationship(back_populates="items")
@@ -209,10 +257,16 @@ class TransactionItem(SQLModel, table=True):
 # Commission tracking
 class Commission(SQLModel, table=True):
     __tablename__ = "commissions"  # type: ignore[assignment]
+    __table_args__ = (
+        Index("ix_commissions_user_id_created_at", "user_id", "created_at"),
+        # payout runs only look at what is still owed
+        Index("ix_commissions_unpaid_user_id", "user_id", postgresql_where=text("is_paid IS FALSE")),
+        MONTHLY_PARTITIONS,
+    )
 
-    id: Optional[int] = Field(default=None, primary_key=True)
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
     user_id: int = Field(foreign_key="users.id")
-    transaction_id: int = Field(foreign_key="transactions.id")
+    transaction_id: int = Field(foreign_key="transactions.id", index=True)
     commission_type: str = Field(max_length=50)  # 'reseller' or 'affiliate'
     level: Optional[int] = Field(default=None)  # For multi-level commissions
     base_amount: Decimal = Field(decimal_places=2, max_digits=15)
@@ -220,7 +274,7 @@ class Commission(SQLModel, table=True):
     commission_amount: Decimal = Field(decimal_places=2, max_digits=15)
     is_paid: bool = Field(default=False)
     paid_at: Optional[datetime] = Field(default=None)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, primary_key=True)
 
     # Relationships
     user: User = Relationship(back_populates="commissions")
@@ -230,8 +284,12 @@ class Commission(SQLModel, table=True):
 # Stock movement tracking
 class StockMovement(SQLModel, table=True):
     __tablename__ = "stock_movements"  # type: ignore[assignment]
+    __table_args__ = (
+        Index("ix_stock_movements_product_id_created_at", "product_id", "created_at"),
+        MONTHLY_PARTITIONS,
+    )
 
-    id: Optional[int] = Field(default=None, primary_key=True)
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
     product_id: int = Field(foreign_key="products.id")
     movement_type: str = Field(max_length=50)  # 'in', 'out', 'adjustment'
     quantity: int
@@ -240,12 +298,122 @@ class StockMovement(SQLModel, table=True):
     reference_number: Optional[str] = Field(default=None, max_length=100)
     notes: Optional[str] = Field(default=None, max_length=500)
     created_by: int = Field(foreign_key="users.id")
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, primary_key=True)
 
     # Relationships
     product: Product = Relationship(back_populates="stock_movements")
 
 
+@event.listens_for(SQLModel.metadata, "after_create")
+def _create_default_partitions(target, connection, tables=(), **kw) -> None:
+    from app.partitions import create_months, upcoming_months
+
+    for table in tables:
+        if table.dialect_options["postgresql"]["partition_by"]:
+            # rows outside every month that has a partition land here instead of failing the insert
+            connection.execute(
+                text(f"CREATE TABLE IF NOT EXISTS {table.name}_default PARTITION OF {table.name} DEFAULT")
+            )
+            # while the new table is empty, so maintenance never has to fence a month that is being written
+            create_months(connection, table.name, upcoming_months(datetime.utcnow()))
+
+
+# Status changes into or out of a sale, queued by the transactions trigger for app.sales_rollups to fold in.
+# A refunded transaction still counts as sold: sale_sign is +1/-1 when it enters/leaves COMPLETED or REFUNDED,
+# refund_sign when it enters/leaves REFUNDED. No foreign key: rows live only until the next apply run.
+class SalesEvent(SQLModel, table=True):
+    __tablename__ = "sales_events"  # type: ignore[assignment]
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    transaction_id: int
+    sale_sign: int
+    refund_sign: int
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow, sa_column_kwargs={"server_default": text("timezone('utc', now())")}
+    )
+
+
+# Enum values are compared by name, which is how the columns store them
+SALES_EVENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION record_sales_event() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    sales integer := (NEW.status IN ('COMPLETED', 'REFUNDED'))::integer;
+    refunds integer := (NEW.status = 'REFUNDED')::integer;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        sales := sales - (OLD.status IN ('COMPLETED', 'REFUNDED'))::integer;
+        refunds := refunds - (OLD.status = 'REFUNDED')::integer;
+    END IF;
+    IF sales <> 0 OR refunds <> 0 THEN
+        INSERT INTO sales_events (transaction_id, sale_sign, refund_sign) VALUES (NEW.id, sales, refunds);
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+SALES_EVENT_TRIGGER = """
+CREATE OR REPLACE TRIGGER transactions_sales_events
+AFTER INSERT OR UPDATE OF status ON transactions
+FOR EACH ROW EXECUTE FUNCTION record_sales_event()
+"""
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def _create_sales_event_trigger(target, connection, tables=(), **kw) -> None:
+    if any(table.name == "transactions" for table in tables):
+        connection.execute(text(SALES_EVENT_FUNCTION))
+        connection.execute(text(SALES_EVENT_TRIGGER))
+
+
+# Hourly and daily sales per cashier, reseller, product and category, kept by app.sales_rollups.
+# bucket is date_trunc(grain, completed_at) of the sale; refunds count against the sale's bucket.
+class SalesRollup(SQLModel):
+    grain: str = Field(primary_key=True, max_length=10)  # 'hour' or 'day'
+    bucket: datetime = Field(primary_key=True)
+
+
+class TransactionRollup(SalesRollup):
+    transaction_count: int = Field(default=0)
+    subtotal: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=15)
+    discount_amount: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=15)
+    tax_amount: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=15)
+    total_amount: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=15)
+    refund_count: int = Field(default=0)
+    refunded_amount: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=15)
+
+
+class ItemRollup(SalesRollup):
+    quantity: int = Field(default=0)
+    total_price: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=15)
+    discount_amount: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=15)
+    refunded_quantity: int = Field(default=0)
+    refunded_amount: Decimal = Field(default=Decimal("0"), decimal_places=2, max_digits=15)
+
+
+class CashierSalesRollup(TransactionRollup, table=True):
+    __tablename__ = "cashier_sales_rollups"  # type: ignore[assignment]
+
+    cashier_id: int = Field(primary_key=True)
+
+
+class ResellerSalesRollup(TransactionRollup, table=True):
+    __tablename__ = "reseller_sales_rollups"  # type: ignore[assignment]
+
+    reseller_id: int = Field(primary_key=True)
+
+
+class ProductSalesRollup(ItemRollup, table=True):
+    __tablename__ = "product_sales_rollups"  # type: ignore[assignment]
+
+    product_id: int = Field(primary_key=True)
+
+
+class CategorySalesRollup(ItemRollup, table=True):
+    __tablename__ = "category_sales_rollups"  # type: ignore[assignment]
+
+    category_id: int = Field(primary_key=True)
+
+
 # Promotions and discounts
 class Promotion(SQLModel, table=True):
     __tablename__ = "promotions"  # type: ignore[assignment]
@@ -273,23 +441,36 @@ class Promotion(SQLModel, table=True):
 # Many-to-many relationship for promotions and products
 class PromotionProduct(SQLModel, table=True):
     __tablename__ = "promotion_products"  # type: ignore[assignment]
+    __table_args__ = (UniqueConstraint("promotion_id", "product_id", name="uq_promotion_products_promotion_product"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     promotion_id: int = Field(foreign_key="promotions.id")
-    product_id: int = Field(foreign_key="products.id")
+    product_id: int = Field(foreign_key="products.id", index=True)
 
     # Relationships
     promotion: Promotion = Relationship(back_populates="products")
     product: Product = Relationship(back_populates="promotions")
 
 
+# Striped usage counter: each claim touches one random shard, so a hot promotion has no single locked row.
+# Total usage is promotions.usage_count plus the sum of `used`; `remaining` is None without a usage_limit.
+class PromotionUsageCounter(SQLModel, table=True):
+    __tablename__ = "promotion_usage_counters"  # type: ignore[assignment]
+    __table_args__ = (CheckConstraint("remaining >= 0", name="ck_promotion_usage_counters_remaining"),)
+
+    promotion_id: int = Field(foreign_key="promotions.id", primary_key=True)
+    shard: int = Field(primary_key=True, ge=0)
+    used: int = Field(default=0)
+    remaining: Optional[int] = Field(default=None, ge=0)
+
+
 # Track which promotions were applied to transactions
 class TransactionPromotion(SQLModel, table=True):
     __tablename__ = "transaction_promotions"  # type: ignore[assignment]
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    transaction_id: int = Field(foreign_key="transactions.id")
-    promotion_id: int = Field(foreign_key="promotions.id")
+    transaction_id: int = Field(foreign_key="transactions.id", index=True)
+    promotion_id: int = Field(foreign_key="promotions.id", index=True)
     discount_amount: Decimal = Field(decimal_places=2, max_digits=10)
 
     # Relationships
@@ -302,7 +483,7 @@ class AffiliateLink(SQLModel, table=True):
     __tablename__ = "affiliate_links"  # type: ignore[assignment]
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    affiliate_profile_id: int = Field(foreign_key="affiliate_profiles.id")
+    affiliate_profile_id: int = Field(foreign_key="affiliate_profiles.id", index=True)
     product_id: Optional[int] = Field(default=None, foreign_key="products.id")
     link_code: str = Field(unique=True, max_length=100)
     clicks: int = Field(default=0)
@@ -315,6 +496,20 @@ class AffiliateLink(SQLModel, table=True):
     affiliate_profile: AffiliateProfile = Relationship(back_populates="affiliate_links")
 
 
+# Click batches app.click_buffer has added to affiliate_links.clicks, so a journal segment replayed after a
+# crash is not counted twice. Pruned after APP_CLICK_BATCH_RETENTION_DAYS.
+class AffiliateClickBatch(SQLModel, table=True):
+    __tablename__ = "affiliate_click_batches"  # type: ignore[assignment]
+
+    id: str = Field(primary_key=True, max_length=64)
+    clicks: int
+    applied_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        index=True,
+        sa_column_kwargs={"server_default": text("timezone('utc', now())")},
+    )
+
+
 # Receipt/Invoice model
 class Receipt(SQLModel, table=True):
     __tablename__ = "receipts"  # type: ignore[assignment]
@@ -394,6 +589,7 @@ class TransactionCreate(SQLModel, table=False):
     cashier_id: Optional[int] = Field(default=None)
     reseller_id: Optional[int] = Field(default=None)
     affiliate_id: Optional[int] = Field(default=None)
+    affiliate_link_id: Optional[int] = Field(default=None)
     transaction_type: TransactionType = Field(default=TransactionType.POS)
     payment_method: str = Field(max_length=50)
     notes: Optional[str] = Field(default=None, max_length=1000)
@@ -406,6 +602,18 @@ class TransactionItemCreate(SQLModel, table=False):
     unit_price: Optional[Decimal] = Field(default=None, decimal_places=2, max_digits=10)
 
 
+class ProductResellerPriceCreate(SQLModel, table=False):
+    product_id: int
+    reseller_profile_id: Optional[int] = Field(default=None)
+    reseller_level: Optional[int] = Field(default=None, ge=1, le=10)
+    price: Decimal = Field(decimal_places=2, max_digits=10)
+
+
+class ProductResellerPriceUpdate(SQLModel, table=False):
+    price: Optional[Decimal] = Field(default=None, decimal_places=2, max_digits=10)
+    is_active: Optional[bool] = Field(default=None)
+
+
 class CategoryCreate(SQLModel, table=False):
     name: str = Field(max_length=100)
     description: Optional[str] = Field(default=None, max_length=500)
@@ -436,3 +644,37 @@ class PromotionCreate(SQLModel, table=False):
     usage_limit: Optional[int] = Field(default=None)
     applicable_roles: List[str] = Field(default=[])
     product_ids: List[int] = Field(default=[])
+
+
+class SettlementReport(SQLModel, table=False):
+    window_start: datetime
+    window_end: datetime
+    transactions: int = Field(default=0)
+    commissions: int = Field(default=0)
+    base_amount: Decimal = Field(default=Decimal("0"), decimal_places=2)
+    commission_amount: Decimal = Field(default=Decimal("0"), decimal_places=2)
+    db_mismatches: int = Field(default=0)  # rows where commission_amount != round(base_amount * commission_rate, 2)
+    decimal_checked: int = Field(default=0)
+    decimal_mismatches: int = Field(default=0)
+    elapsed_seconds: float = Field(default=0)
+
+
+class CatalogImportRowError(SQLModel, table=False):
+    row: int  # 1-based position in the input
+    sku: Optional[str] = Field(default=None)
+    message: str
+
+
+class CatalogImportReport(SQLModel, table=False):
+    rows: int = Field(default=0)
+    created: int = Field(default=0)
+    updated: int = Field(default=0)
+    unchanged: int = Field(default=0)
+    stock_movements: int = Field(default=0)
+    categories_created: int = Field(default=0)
+    errors: List[CatalogImportRowError] = Field(default=[])
+    elapsed_seconds: float = Field(default=0)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
@@ -0,0 +1,304 @@
+"""Monthly range partitions for the append-only history tables.
+
+A model opts in with `postgresql_partition_by: "RANGE (created_at)"` in its table args and gets a default
+partition plus this month's and the coming months' partitions on create. maintain_partitions() keeps attaching
+the coming months (moving any of their rows out of the default partition first) and detaches months past the
+retention window into an archive schema, where they stay queryable until someone dumps or drops them.
+
+ATTACH scans the default partition under an ACCESS EXCLUSIVE lock unless a valid CHECK already rules the month
+out, so the month is fenced off first: a NOT VALID check added in its own short transaction, validated while
+writes continue. From the fence until the attach commits, rows for that month cannot be written, so only months
+nothing writes to are fenced: future ones, and past ones left in the default partition (e.g. by migration 0003).
+The current month is never fenced; if it has no partition its rows wait in the default partition until the
+month is over. A backlog is copied into the new partition in batches first, so the attach transaction only
+deletes it from the default partition.
+"""
+
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import Connection, Engine, Table, text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel
+
+from app.database import TimeoutClass, get_session
+
+logger = logging.getLogger(__name__)
+
+MONTHS_AHEAD = int(os.environ.get("APP_PARTITION_MONTHS_AHEAD", "3"))
+# months of history kept attached; 0 never archives
+RETENTION_MONTHS = int(os.environ.get("APP_PARTITION_RETENTION_MONTHS", "24"))
+ARCHIVE_SCHEMA = os.environ.get("APP_PARTITION_ARCHIVE_SCHEMA", "archive")
+# ATTACH / DETACH lock the default partition or the parent; give up for this run rather than stall checkouts
+LOCK_TIMEOUT = os.environ.get("APP_PARTITION_LOCK_TIMEOUT", "2s")
+MAINTENANCE_INTERVAL = float(os.environ.get("APP_PARTITION_MAINTENANCE_SECONDS", "86400"))
+# rows per transaction when copying a month's backlog out of the default partition
+MOVE_BATCH = int(os.environ.get("APP_PARTITION_MOVE_BATCH", "10000"))
+
+PARTITIONS = text(
+    """
+    SELECT c.relname
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = CAST(:parent AS regclass)
+    """
+)
+
+
+def partitioned_tables() -> List[Table]:
+    return [table for table in SQLModel.metadata.sorted_tables if table.dialect_options["postgresql"]["partition_by"]]
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def upcoming_months(now: datetime, ahead: int = MONTHS_AHEAD) -> List[datetime]:
+    """The month of `now` and the `ahead` months after it"""
+    return [add_months(month_start(now), offset) for offset in range(ahead + 1)]
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def monthly_partitions(session: Session, table: str) -> Dict[datetime, str]:
+    """Attached monthly partitions of `table` by first day of the month; the default partition is not one"""
+    pattern = re.compile(rf"^{re.escape(table)}_(\d{{4}})_(\d{{2}})$")
+    months: Dict[datetime, str] = {}
+    for (name,) in session.execute(PARTITIONS, {"parent": table}):
+        match = pattern.match(name)
+        if match:
+            months[datetime(int(match[1]), int(match[2]), 1)] = name
+    return months
+
+
+def create_months(connection: Connection, table: str, months: List[datetime]) -> None:
+    """Create the partitions for `months` in one go, for a default partition that holds no rows of them yet.
+
+    The default partition is scanned under an ACCESS EXCLUSIVE lock, so this is for new or empty tables.
+    """
+    for month in months:
+        name = partition_name(table, month)
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES {_bounds(month)}"))
+
+
+def _session(engine: Optional[Engine]) -> Session:
+    return Session(engine) if engine is not None else get_session(TimeoutClass.BATCH)
+
+
+def _lock(session: Session) -> None:
+    # one maintainer at a time when several app instances start together
+    session.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    session.execute(text("SELECT pg_advisory_xact_lock(hashtext('app.partitions'))"))
+
+
+def _in_month(month: datetime) -> str:
+    return f"created_at >= '{month:%Y-%m-%d}' AND created_at < '{add_months(month, 1):%Y-%m-%d}'"
+
+
+def _bounds(month: datetime) -> str:
+    return f"FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+
+
+def _fence_name(table: str, month: datetime) -> str:
+    return f"{table}_default_not_{month:%Y_%m}"
+
+
+def fence_default(session: Session, table: str, month: datetime) -> None:
+    """Keep new rows for `month` out of the default partition; NOT VALID, so only a brief lock and no scan"""
+    fence = _fence_name(table, month)
+    session.execute(
+        text(
+            f"ALTER TABLE {table}_default DROP CONSTRAINT IF EXISTS {fence}, "
+            f"ADD CONSTRAINT {fence} CHECK (NOT ({_in_month(month)})) NOT VALID"
+        )
+    )
+
+
+def drop_fence(session: Session, table: str, month: datetime) -> None:
+    session.execute(text(f"ALTER TABLE {table}_default DROP CONSTRAINT IF EXISTS {_fence_name(table, month)}"))
+
+
+def stage_partition(session: Session, table: str, month: datetime) -> None:
+    """Create the detached table that becomes the partition for `month`, unless an earlier run left it"""
+    name = partition_name(table, month)
+    # with the parent's indexes in place, ATTACH does not build them while it holds the default partition
+    session.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {name} "
+            f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES)"
+        )
+    )
+    # proves the new table's rows are in range, so ATTACH does not scan it either
+    session.execute(
+        text(
+            f"ALTER TABLE {name} DROP CONSTRAINT IF EXISTS {name}_bounds, "
+            f"ADD CONSTRAINT {name}_bounds CHECK ({_in_month(month)})"
+        )
+    )
+
+
+def copy_backlog(table: str, month: datetime, engine: Optional[Engine] = None, batch: int = MOVE_BATCH) -> int:
+    """Copy the default partition's rows for fenced `month` into its staged table, `batch` ids per transaction.
+
+    The rows stay in the default partition, and readers keep seeing them there, until create_partition() deletes
+    them as it attaches the month. Returns the rows copied.
+    """
+    name = partition_name(table, month)
+    with _session(engine) as session:
+        low, high = session.execute(
+            text(f"SELECT min(id), max(id) FROM {table}_default WHERE {_in_month(month)}")
+        ).one()
+    if low is None:
+        return 0
+    copied = 0
+    for after in range(low - 1, high, batch):
+        with _session(engine) as session:
+            copied += session.execute(
+                text(
+                    f"""
+                    INSERT INTO {name} SELECT * FROM {table}_default
+                    WHERE id > :after AND id <= :after + :batch AND {_in_month(month)}
+                    ON CONFLICT DO NOTHING
+                    """
+                ),
+                {"after": after, "batch": batch},
+            ).rowcount
+            session.commit()
+    return copied
+
+
+def create_partition(session: Session, table: str, month: datetime) -> int:
+    """Attach the partition for `month`, first moving its rows out of the default partition; returns rows moved
+    that copy_backlog() had not copied yet.
+
+    Needs the fence_default() of `month` committed; it is validated here and dropped once the month is attached.
+    None of it blocks inserts into other months until the ATTACH itself, which neither scans nor builds indexes.
+    """
+    name = partition_name(table, month)
+    stage_partition(session, table, month)
+    # history rows are never updated, so a copied row is the row
+    moved = session.execute(
+        text(
+            f"""
+            WITH moved AS (DELETE FROM {table}_default WHERE {_in_month(month)} RETURNING *)
+            INSERT INTO {name} SELECT * FROM moved ON CONFLICT DO NOTHING
+            """
+        )
+    ).rowcount
+    # SHARE UPDATE EXCLUSIVE: the scan runs while other months are still written
+    session.execute(text(f"ALTER TABLE {table}_default VALIDATE CONSTRAINT {_fence_name(table, month)}"))
+    session.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {_bounds(month)}"))
+    drop_fence(session, table, month)
+    session.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+    return moved
+
+
+def ensure_partitions(
+    now: Optional[datetime] = None,
+    since: Optional[datetime] = None,
+    ahead: int = MONTHS_AHEAD,
+    engine: Optional[Engine] = None,
+) -> List[str]:
+    """Attach every missing month from `since` (default: last month) to `ahead` months after `now`.
+
+    The month of `now` is skipped: it is being written. Once it is over, the default `since` picks it up.
+    """
+    now = now or datetime.utcnow()
+    current = month_start(now)
+    months = [month_start(since) if since else add_months(current, -1)]
+    while months[-1] < add_months(current, ahead):
+        months.append(add_months(months[-1], 1))
+    created: List[str] = []
+    for table in partitioned_tables():
+        with _session(engine) as session:
+            attached = monthly_partitions(session, table.name)
+        for month in months:
+            name = partition_name(table.name, month)
+            if month in attached:
+                continue
+            if month == current:
+                logger.info(f"{name} is still being written; its rows wait in {table.name}_default until it is over")
+                continue
+            # transactions per partition keep the default partition locked only briefly
+            with _session(engine) as session:
+                _lock(session)
+                if month in monthly_partitions(session, table.name):
+                    continue
+                try:
+                    fence_default(session, table.name, month)
+                    session.commit()
+                except OperationalError as exc:
+                    logger.warning(f"Could not fence off {name}, retrying later: {exc}")
+                    return created
+            with _session(engine) as session:
+                stage_partition(session, table.name, month)
+                session.commit()
+            moved = copy_backlog(table.name, month, engine)
+            with _session(engine) as session:
+                _lock(session)
+                try:
+                    moved += create_partition(session, table.name, month)
+                    session.commit()
+                except OperationalError as exc:
+                    logger.warning(f"Could not attach {name}, retrying later: {exc}")
+                    session.rollback()
+                    _remove_fence(table.name, month, engine)
+                    return created
+            created.append(name)
+            if moved:
+                logger.info(f"Moved {moved} rows from {table.name}_default to {name}")
+    return created
+
+
+def _remove_fence(table: str, month: datetime, engine: Optional[Engine] = None) -> None:
+    # until the next attempt, rows for the month may wait in the default partition again
+    with _session(engine) as session:
+        try:
+            _lock(session)
+            drop_fence(session, table, month)
+            session.commit()
+        except OperationalError as exc:
+            logger.warning(f"Could not drop {_fence_name(table, month)}; its month cannot be written: {exc}")
+
+
+def archive_partitions(now: Optional[datetime] = None, retention: int = RETENTION_MONTHS) -> List[str]:
+    """Detach months older than `retention` months before `now` and move them to the archive schema"""
+    if retention <= 0:
+        return []
+    cutoff = add_months(month_start(now or datetime.utcnow()), -retention)
+    archived: List[str] = []
+    for table in partitioned_tables():
+        with get_session(TimeoutClass.BATCH) as session:
+            expired = [
+                name for month, name in sorted(monthly_partitions(session, table.name).items()) if month < cutoff
+            ]
+        for name in expired:
+            with get_session(TimeoutClass.BATCH) as session:
+                _lock(session)
+                try:
+                    session.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+                    session.execute(text(f"ALTER TABLE {table.name} DETACH PARTITION {name}"))
+                    session.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+                    session.commit()
+                except OperationalError as exc:
+                    logger.warning(f"Could not archive {name}, retrying later: {exc}")
+                    return archived
+            archived.append(f"{ARCHIVE_SCHEMA}.{name}")
+    return archived
+
+
+def maintain_partitions(now: Optional[datetime] = None) -> Dict[str, List[str]]:
+    """Run at startup and then every MAINTENANCE_INTERVAL seconds"""
+    report = {"created": ensure_partitions(now), "archived": archive_partitions(now)}
+    if report["created"] or report["archived"]:
+        logger.info(f"Partition maintenance: {report}")
+    return report
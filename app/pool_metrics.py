@@ -0,0 +1,131 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, PoolProxiedConnection, QueuePool
+
+# upper bounds in milliseconds; the last bucket counts everything slower
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """Counters for one engine's pool; survives pool.recreate() on engine.dispose()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.connections_invalidated = 0
+        self.peak_checked_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_histogram: List[int] = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record_wait(self, seconds: float, checked_out: int) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.wait_histogram[bisect_left(WAIT_BUCKETS_MS, seconds * 1000)] += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.checkout_timeouts += 1
+
+    def record(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            labels = [f"<={bound}ms" for bound in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+            return {
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "peak_checked_out": self.peak_checked_out,
+                "connections_opened": self.connections_opened,
+                "connections_closed": self.connections_closed,
+                "connections_invalidated": self.connections_invalidated,
+                "wait_ms": {
+                    "mean": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                    "max": round(self.wait_max * 1000, 3),
+                    "histogram": dict(zip(labels, self.wait_histogram)),
+                },
+            }
+
+
+class _InstrumentedPool:
+    """Times every checkout, including waits for a free connection and connects of new ones"""
+
+    metrics: PoolMetrics
+
+    def connect(self) -> PoolProxiedConnection:
+        started = time.perf_counter()
+        try:
+            connection = super().connect()  # type: ignore[misc]
+        except PoolTimeout:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait(time.perf_counter() - started, self.checkedout())  # type: ignore[attr-defined]
+        return connection
+
+    def recreate(self) -> Pool:
+        pool = super().recreate()  # type: ignore[misc]
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncPool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument(pool: Pool) -> PoolMetrics:
+    """Attach metrics and churn listeners to an instrumented pool; the listeners carry over to recreated pools"""
+    if not isinstance(pool, _InstrumentedPool):
+        raise TypeError(f"{type(pool).__name__} is not an instrumented pool")
+    metrics = PoolMetrics()
+    pool.metrics = metrics
+
+    @event.listens_for(pool, "connect")
+    def _opened(dbapi_connection: Any, record: Any) -> None:
+        metrics.record("connections_opened")
+
+    @event.listens_for(pool, "close")
+    def _closed(dbapi_connection: Any, record: Any) -> None:
+        metrics.record("connections_closed")
+
+    @event.listens_for(pool, "close_detached")
+    def _closed_detached(dbapi_connection: Any) -> None:
+        metrics.record("connections_closed")
+
+    @event.listens_for(pool, "invalidate")
+    def _invalidated(dbapi_connection: Any, record: Any, exception: Any) -> None:
+        metrics.record("connections_invalidated")
+
+    return metrics
+
+
+def pool_stats(pool: Pool) -> Dict[str, Any]:
+    """Live pool occupancy plus the accumulated metrics"""
+    stats: Dict[str, Any] = {}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            timeout=pool.timeout(),
+        )
+    if isinstance(pool, _InstrumentedPool):
+        stats.update(pool.metrics.snapshot())
+    return stats
@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlmodel import Session, col, select
+
+from app.database import TimeoutClass, get_session, session_scope
+from app.models import Product, ProductResellerPrice, ResellerProfile
+
+PRODUCTS_KEY = "price_resolver_products"
+RESELLERS_KEY = "price_resolver_resellers"
+MAX_LEVEL = 10
+# the after_commit hooks only see this process's writes; a matrix older than this is rebuilt
+MAX_AGE = float(os.environ.get("APP_PRICE_MATRIX_MAX_AGE_SECONDS", "300"))
+
+# effective prices of one product: index 0 is the base price, 1-10 the price seen by that reseller level
+PriceRow = Tuple[Decimal, ...]
+
+
+class PriceResolver:
+    """In-memory effective price matrix by (product, reseller level) plus per-reseller overrides"""
+
+    def __init__(self, max_age: float = MAX_AGE):
+        self.max_age = max_age
+        self.full_loads = 0
+        self.loaded = False
+        self._loaded_at = 0.0
+        self._matrix: Dict[int, PriceRow] = {}
+        self._overrides: Dict[int, Dict[int, Decimal]] = {}
+        # reseller user id -> (profile id, level), None when the user is not an active reseller
+        self._resellers: Dict[int, Optional[Tuple[int, int]]] = {}
+        self._stale_products: Set[int] = set()
+        self._stale_resellers: Set[int] = set()
+        self._stale_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def mark_stale(self, product_ids: Iterable[int] = (), reseller_user_ids: Iterable[int] = ()) -> None:
+        """Queue rows for reloading on the next lookup; never touches the database itself"""
+        with self._stale_lock:
+            self._stale_products.update(product_ids)
+            self._stale_resellers.update(reseller_user_ids)
+
+    def _take_stale(self) -> Tuple[Set[int], Set[int]]:
+        with self._stale_lock:
+            products, resellers = self._stale_products, self._stale_resellers
+            self._stale_products, self._stale_resellers = set(), set()
+            return products, resellers
+
+    def load(self) -> None:
+        """Build the whole matrix; later changes are applied per product"""
+        with self._refresh_lock:
+            self._load()
+
+    def age(self) -> float:
+        return time.monotonic() - self._loaded_at
+
+    def warm(self) -> None:
+        """Build the whole matrix unless a fresh one is built; run on a timer so no sale waits for it"""
+        with self._refresh_lock:
+            # halfway through max_age, so the timer rebuilds it before a sale finds it expired
+            if not self.loaded or self.age() >= self.max_age / 2:
+                self._load()
+
+    def _load(self) -> None:
+        # its own BATCH session: a full read does not fit in a sale's transaction and OLTP statement timeout
+        with get_session(TimeoutClass.BATCH) as db:
+            # anything queued before this read is covered by it
+            self._take_stale()
+            matrix, overrides = _load_prices(db, None)
+            resellers = _load_resellers(db, None)
+            self._matrix, self._overrides, self._resellers = matrix, overrides, resellers
+            self._loaded_at = time.monotonic()
+            self.loaded = True
+            self.full_loads += 1
+
+    def refresh_products(self, product_ids: Iterable[int], session: Optional[Session] = None) -> None:
+        ids = list(set(product_ids))
+        if not ids or not self.loaded:
+            return
+        with self._refresh_lock, session_scope(session) as db:
+            matrix, overrides = _load_prices(db, ids)
+            for product_id in ids:
+                if product_id in matrix:
+                    self._matrix[product_id] = matrix[product_id]
+                else:
+                    self._matrix.pop(product_id, None)
+                if product_id in overrides:
+                    self._overrides[product_id] = overrides[product_id]
+                else:
+                    self._overrides.pop(product_id, None)
+
+    def refresh_resellers(self, user_ids: Iterable[int], session: Optional[Session] = None) -> None:
+        ids = list(set(user_ids))
+        if not ids or not self.loaded:
+            return
+        with self._refresh_lock, session_scope(session) as db:
+            self._resellers.update(_load_resellers(db, ids))
+
+    def _sync(self, session: Optional[Session]) -> None:
+        if not self.loaded or self.age() >= self.max_age:
+            self.warm()
+        if self._stale_products or self._stale_resellers:
+            products, resellers = self._take_stale()
+            self.refresh_products(products, session)
+            self.refresh_resellers(resellers, session)
+
+    def resolve(
+        self, product_ids: Iterable[int], reseller_user_id: Optional[int] = None, session: Optional[Session] = None
+    ) -> Dict[int, Decimal]:
+        """Unit price per product for a sale by `reseller_user_id`; no queries once the matrix is warm"""
+        self._sync(session)
+        ids = list(product_ids)
+        missing = [product_id for product_id in ids if product_id not in self._matrix]
+        if missing:
+            self.refresh_products(missing, session)
+
+        reseller = None
+        if reseller_user_id is not None:
+            if reseller_user_id not in self._resellers:
+                self.refresh_resellers([reseller_user_id], session)
+            reseller = self._resellers.get(reseller_user_id)
+
+        prices: Dict[int, Decimal] = {}
+        for product_id in ids:
+            row = self._matrix.get(product_id)
+            if row is None:
+                raise ValueError(f"Product {product_id} is not available")
+            if reseller is None:
+                prices[product_id] = row[0]
+                continue
+            profile_id, level = reseller
+            overrides = self._overrides.get(product_id)
+            override = overrides.get(profile_id) if overrides is not None else None
+            prices[product_id] = override if override is not None else row[level]
+        return prices
+
+    def clear(self) -> None:
+        with self._refresh_lock:
+            self._take_stale()
+            self._matrix = {}
+            self._overrides = {}
+            self._resellers = {}
+            self.loaded = False
+            self.full_loads = 0
+
+
+def _load_prices(
+    session: Session, product_ids: Optional[List[int]]
+) -> Tuple[Dict[int, PriceRow], Dict[int, Dict[int, Decimal]]]:
+    products = select(Product.id, Product.base_price).where(col(Product.is_active).is_(True))
+    rules = (
+        select(
+            ProductResellerPrice.product_id,
+            ProductResellerPrice.reseller_profile_id,
+            ProductResellerPrice.reseller_level,
+            ProductResellerPrice.price,
+        )
+        .where(col(ProductResellerPrice.is_active).is_(True))
+        # newest rule wins when several target the same level or reseller
+        .order_by(col(ProductResellerPrice.id))
+    )
+    if product_ids is not None:
+        products = products.where(col(Product.id).in_(product_ids))
+        rules = rules.where(col(ProductResellerPrice.product_id).in_(product_ids))
+
+    level_prices: Dict[int, Dict[int, Decimal]] = {}
+    overrides: Dict[int, Dict[int, Decimal]] = {}
+    for product_id, profile_id, level, price in session.execute(rules):
+        if profile_id is not None:
+            overrides.setdefault(product_id, {})[profile_id] = price
+        elif level is not None:
+            level_prices.setdefault(product_id, {})[level] = price
+
+    matrix: Dict[int, PriceRow] = {}
+    for product_id, base_price in session.execute(products):
+        levels = level_prices.get(product_id, {})
+        matrix[product_id] = (base_price, *(levels.get(level, base_price) for level in range(1, MAX_LEVEL + 1)))
+    return matrix, {product_id: rows for product_id, rows in overrides.items() if product_id in matrix}
+
+
+def _load_resellers(session: Session, user_ids: Optional[List[int]]) -> Dict[int, Optional[Tuple[int, int]]]:
+    query = select(ResellerProfile.user_id, ResellerProfile.id, ResellerProfile.level, ResellerProfile.is_active)
+    if user_ids is not None:
+        query = query.where(col(ResellerProfile.user_id).in_(user_ids))
+    resellers: Dict[int, Optional[Tuple[int, int]]] = dict.fromkeys(user_ids or [])
+    for user_id, profile_id, level, is_active in session.execute(query):
+        resellers[user_id] = (profile_id, level) if is_active else None
+    return resellers
+
+
+price_resolver = PriceResolver()
+
+
+def refresh_prices_on_commit(session: Session, product_ids: Iterable[int]) -> None:
+    """Mark these products' rows in the price matrix stale once the session's transaction commits"""
+    pending: Set[int] = session.info.setdefault(PRODUCTS_KEY, set())
+    pending.update(product_ids)
+
+
+def refresh_resellers_on_commit(session: Session, user_ids: Iterable[int]) -> None:
+    """Mark these resellers' profile id and level stale once the session's transaction commits"""
+    pending: Set[int] = session.info.setdefault(RESELLERS_KEY, set())
+    pending.update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _refresh_after_commit(session: Session) -> None:
+    products: Optional[Set[int]] = session.info.pop(PRODUCTS_KEY, None)
+    resellers: Optional[Set[int]] = session.info.pop(RESELLERS_KEY, None)
+    if products or resellers:
+        price_resolver.mark_stale(products or (), resellers or ())
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(PRODUCTS_KEY, None)
+    session.info.pop(RESELLERS_KEY, None)
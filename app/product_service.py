@@ -0,0 +1,58 @@
+from datetime import datetime
+from typing import Optional
+
+from app.catalog_cache import invalidate_on_commit
+from app.database import get_session
+from app.models import (
+    Product,
+    ProductResellerPrice,
+    ProductResellerPriceCreate,
+    ProductResellerPriceUpdate,
+    ProductUpdate,
+)
+from app.price_resolver import refresh_prices_on_commit
+
+
+def update_product(product_id: int, data: ProductUpdate) -> Optional[Product]:
+    with get_session() as session:
+        product = session.get(Product, product_id)
+        if product is None:
+            return None
+
+        for field, value in data.model_dump(exclude_unset=True).items():
+            setattr(product, field, value)
+        product.updated_at = datetime.utcnow()
+        session.add(product)
+        invalidate_on_commit(session, [product_id])
+        refresh_prices_on_commit(session, [product_id])
+        session.commit()
+        session.refresh(product)
+        return product
+
+
+def create_reseller_price(data: ProductResellerPriceCreate) -> ProductResellerPrice:
+    if (data.reseller_profile_id is None) == (data.reseller_level is None):
+        raise ValueError("A reseller price targets either a reseller profile or a reseller level")
+
+    with get_session() as session:
+        price = ProductResellerPrice(**data.model_dump())
+        session.add(price)
+        refresh_prices_on_commit(session, [data.product_id])
+        session.commit()
+        session.refresh(price)
+        return price
+
+
+def update_reseller_price(price_id: int, data: ProductResellerPriceUpdate) -> Optional[ProductResellerPrice]:
+    with get_session() as session:
+        price = session.get(ProductResellerPrice, price_id)
+        if price is None:
+            return None
+
+        for field, value in data.model_dump(exclude_unset=True).items():
+            setattr(price, field, value)
+        session.add(price)
+        refresh_prices_on_commit(session, [price.product_id])
+        session.commit()
+        session.refresh(price)
+        return price
@@ -0,0 +1,193 @@
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import Engine, text
+from sqlmodel import Session
+
+from app.database import TimeoutClass, get_session
+
+logger = logging.getLogger(__name__)
+
+SHARD_COUNT = int(os.environ.get("APP_PROMOTION_COUNTER_SHARDS", "32"))
+CLAIM_ATTEMPTS = 20
+RETRY_DELAY = 0.002
+
+# one random open shard per promotion; SKIP LOCKED moves on to another shard instead of queueing
+_CLAIM = """
+WITH picked AS (
+    SELECT s.promotion_id, s.shard, p.max_discount_amount
+    FROM promotions p
+    CROSS JOIN LATERAL (
+        SELECT c.promotion_id, c.shard FROM promotion_usage_counters c
+        WHERE c.promotion_id = p.id AND (c.remaining IS NULL OR c.remaining > 0)
+        ORDER BY random() LIMIT 1
+        FOR UPDATE {lock}
+    ) AS s
+    WHERE p.id = ANY(CAST(:ids AS integer[])) AND p.is_active AND p.start_date <= :now AND p.end_date >= :now
+)
+UPDATE promotion_usage_counters c
+SET used = c.used + 1, remaining = c.remaining - 1
+FROM picked
+WHERE c.promotion_id = picked.promotion_id AND c.shard = picked.shard
+RETURNING c.promotion_id, picked.max_discount_amount
+"""
+CLAIM_SKIP_LOCKED = text(_CLAIM.format(lock="SKIP LOCKED"))
+CLAIM_WAIT = text(_CLAIM.format(lock=""))
+
+# committed state of promotions whose claim found no free shard
+CLAIM_STATUS = text(
+    """
+    SELECT p.id,
+           p.is_active AND p.start_date <= :now AND p.end_date >= :now AS running,
+           EXISTS (SELECT 1 FROM promotion_usage_counters c WHERE c.promotion_id = p.id) AS initialized,
+           EXISTS (
+               SELECT 1 FROM promotion_usage_counters c
+               WHERE c.promotion_id = p.id AND (c.remaining IS NULL OR c.remaining > 0)
+           ) AS open
+    FROM promotions p WHERE p.id = ANY(CAST(:ids AS integer[]))
+    """
+)
+
+# promotions without shards (inserted outside create_promotion) count on their own row, locked in id order
+CLAIM_ROW = text(
+    """
+    UPDATE promotions p SET usage_count = p.usage_count + 1
+    WHERE p.id IN (
+        SELECT id FROM promotions WHERE id = ANY(CAST(:ids AS integer[])) ORDER BY id FOR NO KEY UPDATE
+    )
+    AND p.is_active AND p.start_date <= :now AND p.end_date >= :now
+    AND (p.usage_limit IS NULL OR p.usage_count < p.usage_limit)
+    RETURNING p.id, p.max_discount_amount
+    """
+)
+
+# the remaining budget (usage_limit - usage_count) is spread evenly over the shards
+_CREATE_COUNTERS = """
+INSERT INTO promotion_usage_counters (promotion_id, shard, used, remaining)
+SELECT p.id, s.shard, 0,
+       CASE WHEN p.usage_limit IS NULL THEN NULL
+            ELSE greatest(p.usage_limit - p.usage_count, 0) / :shards
+                 + CASE WHEN s.shard < greatest(p.usage_limit - p.usage_count, 0) % :shards THEN 1 ELSE 0 END
+       END
+FROM promotions p CROSS JOIN generate_series(0, :shards - 1) AS s(shard)
+WHERE {promotions}
+ON CONFLICT DO NOTHING
+"""
+CREATE_COUNTERS = text(_CREATE_COUNTERS.format(promotions="p.id = ANY(CAST(:ids AS integer[]))"))
+CREATE_MISSING_COUNTERS = text(
+    _CREATE_COUNTERS.format(
+        promotions="NOT EXISTS (SELECT 1 FROM promotion_usage_counters c WHERE c.promotion_id = p.id)"
+    )
+)
+
+USAGE_COUNTS = text(
+    """
+    SELECT p.id, p.usage_count + coalesce(sum(c.used), 0)
+    FROM promotions p LEFT JOIN promotion_usage_counters c ON c.promotion_id = p.id
+    WHERE p.id = ANY(CAST(:ids AS integer[]))
+    GROUP BY p.id
+    """
+)
+
+FOLD_USAGE = text(
+    """
+    WITH old AS (
+        SELECT promotion_id, shard, used FROM promotion_usage_counters WHERE used > 0 FOR UPDATE
+    ),
+    drained AS (
+        UPDATE promotion_usage_counters c SET used = 0
+        FROM old WHERE c.promotion_id = old.promotion_id AND c.shard = old.shard
+        RETURNING old.promotion_id, old.used
+    )
+    UPDATE promotions p SET usage_count = p.usage_count + t.used
+    FROM (SELECT promotion_id, sum(used) AS used FROM drained GROUP BY promotion_id) AS t
+    WHERE p.id = t.promotion_id
+    """
+)
+
+
+def create_counters(session: Session, promotion_ids: Iterable[int], shards: int = SHARD_COUNT) -> None:
+    """Create the counter shards of these promotions unless they already exist"""
+    ids = sorted(set(promotion_ids))
+    if ids:
+        session.execute(CREATE_COUNTERS, {"ids": ids, "shards": shards})
+
+
+def create_missing_counters(engine: Optional[Engine] = None) -> None:
+    """Give promotions written before sharding (or by hand) their shards; run before serving checkouts"""
+    with Session(engine) if engine is not None else get_session(TimeoutClass.BATCH) as session:
+        created = session.execute(CREATE_MISSING_COUNTERS, {"shards": SHARD_COUNT}).rowcount
+        session.commit()
+    if created:
+        logger.info(f"Created {created} promotion usage counter shards")
+
+
+def claim_uses(
+    session: Session, promotion_ids: Iterable[int], now: datetime
+) -> Tuple[Dict[int, Optional[Decimal]], Set[int]]:
+    """Take one use of each running promotion that is under its usage_limit.
+
+    Returns the claimed promotions with their current max_discount_amount, and the ones found exhausted.
+    """
+    pending = sorted(set(promotion_ids))
+    claimed: Dict[int, Optional[Decimal]] = {}
+    exhausted: Set[int] = set()
+    for attempt in range(CLAIM_ATTEMPTS + 1):
+        if not pending:
+            break
+        if attempt < CLAIM_ATTEMPTS:
+            rows = list(session.execute(CLAIM_SKIP_LOCKED, {"ids": pending, "now": now}))
+        else:
+            # out of retries: queue behind the holders, one promotion at a time in id order
+            rows = [
+                row
+                for promotion_id in pending
+                for row in session.execute(CLAIM_WAIT, {"ids": [promotion_id], "now": now})
+            ]
+        for promotion_id, max_discount_amount in rows:
+            claimed[promotion_id] = max_discount_amount
+        pending = [promotion_id for promotion_id in pending if promotion_id not in claimed]
+        if not pending:
+            break
+
+        busy: List[int] = []
+        uninitialized: List[int] = []
+        for promotion_id, running, initialized, is_open in session.execute(CLAIM_STATUS, {"ids": pending, "now": now}):
+            if not running:
+                continue
+            if not initialized:
+                uninitialized.append(promotion_id)
+            elif is_open:
+                busy.append(promotion_id)
+            else:
+                exhausted.add(promotion_id)
+        if uninitialized:
+            # creating shards here would make every concurrent checkout wait on this transaction's insert
+            rows = session.execute(CLAIM_ROW, {"ids": uninitialized, "now": now}).all()
+            claimed.update((promotion_id, max_discount_amount) for promotion_id, max_discount_amount in rows)
+            exhausted.update(set(uninitialized) - set(claimed))
+        if busy:
+            # every open shard is held by an in-flight checkout; one of them frees up within milliseconds
+            time.sleep(RETRY_DELAY * random.uniform(0.5, 1.5))
+        pending = busy
+    return claimed, exhausted
+
+
+def usage_counts(session: Session, promotion_ids: Iterable[int]) -> Dict[int, int]:
+    """Total uses per promotion: the folded usage_count plus every shard"""
+    rows = session.execute(USAGE_COUNTS, {"ids": sorted(set(promotion_ids))})
+    return {promotion_id: int(count) for promotion_id, count in rows}
+
+
+def fold_usage_counts() -> int:
+    """Move shard totals into promotions.usage_count, e.g. from a nightly job; returns promotions updated"""
+    with get_session(TimeoutClass.BATCH) as session:
+        updated = session.execute(FOLD_USAGE).rowcount
+        session.commit()
+    logger.info(f"Folded usage counters of {updated} promotions")
+    return updated
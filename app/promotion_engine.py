@@ -0,0 +1,311 @@
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import Row, and_, event, or_
+from sqlmodel import Session, col, select
+
+from app.database import session_scope
+from app.models import Promotion, PromotionProduct, PromotionType, PromotionUsageCounter
+from app.promotion_counters import claim_uses
+
+REFRESH_KEY = "promotion_engine_refresh"
+# the after_commit hooks only see this process's writes; an index older than this is rebuilt
+MAX_AGE = float(os.environ.get("APP_PROMOTION_INDEX_MAX_AGE_SECONDS", "60"))
+CENT = Decimal("0.01")
+# (low boundary, high boundary, active ids, active basket-wide rules)
+Segment = Tuple[Optional[datetime], Optional[datetime], FrozenSet[int], Tuple["PromotionRule", ...]]
+# end_date is inclusive; intervals are stored half-open so adjacent promotions never share an instant
+RESOLUTION = timedelta(microseconds=1)
+
+
+class BasketLine:
+    __slots__ = ("product_id", "quantity", "unit_price")
+
+    def __init__(self, product_id: int, quantity: int, unit_price: Decimal):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.unit_price = unit_price
+
+
+class Basket:
+    """Lines grouped by product once, so each promotion only visits the lines it covers"""
+
+    __slots__ = ("lines", "subtotal", "by_product")
+
+    def __init__(self, lines: List[BasketLine]):
+        self.lines = lines
+        self.subtotal = sum((line.unit_price * line.quantity for line in lines), Decimal("0"))
+        self.by_product: Dict[int, List[BasketLine]] = {}
+        for line in lines:
+            self.by_product.setdefault(line.product_id, []).append(line)
+
+    def eligible(self, product_ids: FrozenSet[int]) -> Tuple[List[BasketLine], Decimal]:
+        if not product_ids:
+            return self.lines, self.subtotal
+        lines = [line for product_id in product_ids & self.by_product.keys() for line in self.by_product[product_id]]
+        return lines, sum((line.unit_price * line.quantity for line in lines), Decimal("0"))
+
+
+class PromotionRule:
+    """Immutable snapshot of one promotion as the evaluator needs it"""
+
+    __slots__ = (
+        "id",
+        "promotion_type",
+        "discount_value",
+        "min_purchase_amount",
+        "max_discount_amount",
+        "start",
+        "end",
+        "roles",
+        "product_ids",
+    )
+
+    def __init__(self, promotion: Union[Promotion, Row[Any]], product_ids: FrozenSet[int]):
+        if promotion.id is None:
+            raise ValueError("Cannot index a promotion without an id")
+        self.id = promotion.id
+        self.promotion_type = promotion.promotion_type
+        self.discount_value = promotion.discount_value
+        self.min_purchase_amount = promotion.min_purchase_amount
+        self.max_discount_amount = promotion.max_discount_amount
+        self.start = promotion.start_date
+        self.end = promotion.end_date + RESOLUTION
+        self.roles = frozenset(promotion.applicable_roles or [])
+        # empty means the promotion applies to the whole basket
+        self.product_ids = product_ids
+
+    def discount(self, basket: Basket) -> Decimal:
+        if self.min_purchase_amount is not None and basket.subtotal < self.min_purchase_amount:
+            return Decimal("0")
+        eligible, eligible_amount = basket.eligible(self.product_ids)
+
+        match self.promotion_type:
+            case PromotionType.PERCENTAGE:
+                amount = eligible_amount * self.discount_value / 100
+            case PromotionType.FIXED_AMOUNT:
+                amount = min(self.discount_value, eligible_amount)
+            case PromotionType.BUY_X_GET_Y:
+                amount = _buy_x_get_one(eligible, int(self.discount_value))
+
+        if self.max_discount_amount is not None:
+            amount = min(amount, self.max_discount_amount)
+        return amount.quantize(CENT, rounding=ROUND_HALF_UP) if amount > 0 else Decimal("0")
+
+
+def _buy_x_get_one(lines: List[BasketLine], buy: int) -> Decimal:
+    """discount_value is X: every X+1 eligible units, the cheapest one is free"""
+    if buy < 1:
+        return Decimal("0")
+    prices = sorted(line.unit_price for line in lines for _ in range(line.quantity))
+    return sum(prices[: len(prices) // (buy + 1)], Decimal("0"))
+
+
+class PromotionEngine:
+    """Active promotions indexed by time interval, product and role so a basket only touches its candidates"""
+
+    def __init__(self, max_age: float = MAX_AGE):
+        self.max_age = max_age
+        self.loaded = False
+        self.full_loads = 0
+        self._loaded_at = 0.0
+        self._rules: Dict[int, PromotionRule] = {}
+        # copy-on-write frozensets: baskets read these without taking the lock
+        self._by_product: Dict[int, FrozenSet[int]] = {}
+        self._basket_wide: Set[int] = set()
+        # sorted start/end instants; the active set is constant between two neighbours
+        self._boundaries: List[datetime] = []
+        self._segment: Optional[Segment] = None
+        self._stale: Set[int] = set()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def mark_stale(self, promotion_ids: Iterable[int]) -> None:
+        """Queue promotions for re-indexing on the next lookup; never touches the database itself"""
+        with self._lock:
+            self._stale.update(promotion_ids)
+
+    def _take_stale(self) -> Set[int]:
+        with self._lock:
+            stale, self._stale = self._stale, set()
+            return stale
+
+    def load(self, session: Optional[Session] = None) -> None:
+        with self._refresh_lock, session_scope(session) as db:
+            # anything queued before this read is covered by it
+            self._take_stale()
+            self._apply(_load_rules(db, None), None)
+            self._loaded_at = time.monotonic()
+            self.loaded = True
+            self.full_loads += 1
+
+    def refresh(self, promotion_ids: Iterable[int], session: Optional[Session] = None) -> None:
+        ids = list(set(promotion_ids))
+        if not ids or not self.loaded:
+            return
+        with self._refresh_lock, session_scope(session) as db:
+            self._apply(_load_rules(db, ids), ids)
+
+    def _apply(self, rules: List[PromotionRule], promotion_ids: Optional[List[int]]) -> None:
+        with self._lock:
+            if promotion_ids is None:
+                self._rules = {}
+                self._by_product = {}
+                self._basket_wide = set()
+            else:
+                for promotion_id in promotion_ids:
+                    self._unindex(promotion_id)
+            for rule in rules:
+                self._index(rule)
+            self._reset_boundaries()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stale = set()
+            self._rules = {}
+            self._by_product = {}
+            self._basket_wide = set()
+            self._reset_boundaries()
+            self.loaded = False
+            self.full_loads = 0
+
+    def _index(self, rule: PromotionRule) -> None:
+        self._rules[rule.id] = rule
+        if rule.product_ids:
+            for product_id in rule.product_ids:
+                self._by_product[product_id] = self._by_product.get(product_id, frozenset()) | {rule.id}
+        else:
+            self._basket_wide.add(rule.id)
+
+    def _unindex(self, promotion_id: int) -> None:
+        rule = self._rules.pop(promotion_id, None)
+        if rule is None:
+            return
+        self._basket_wide.discard(promotion_id)
+        for product_id in rule.product_ids:
+            promotions = self._by_product.get(product_id, frozenset()) - {promotion_id}
+            if promotions:
+                self._by_product[product_id] = promotions
+            else:
+                self._by_product.pop(product_id, None)
+
+    def _reset_boundaries(self) -> None:
+        self._boundaries = sorted({instant for rule in self._rules.values() for instant in (rule.start, rule.end)})
+        self._segment = None
+
+    def active_at(self, now: datetime) -> Segment:
+        """Promotions running at `now`; recomputed only when `now` crosses some promotion's start or end"""
+        segment = self._segment
+        if segment is not None:
+            low, high = segment[0], segment[1]
+            if (low is None or low <= now) and (high is None or now < high):
+                return segment
+        with self._lock:
+            position = bisect_right(self._boundaries, now)
+            low = self._boundaries[position - 1] if position > 0 else None
+            high = self._boundaries[position] if position < len(self._boundaries) else None
+            active = frozenset(rule.id for rule in self._rules.values() if rule.start <= now < rule.end)
+            basket_wide = tuple(self._rules[promotion_id] for promotion_id in sorted(active & self._basket_wide))
+            segment = (low, high, active, basket_wide)
+            self._segment = segment
+            return segment
+
+    def candidates(
+        self, product_ids: Iterable[int], role: Optional[str], now: datetime, session: Optional[Session] = None
+    ) -> List[PromotionRule]:
+        if not self.loaded or time.monotonic() - self._loaded_at >= self.max_age:
+            self.load(session)
+        if self._stale:
+            self.refresh(self._take_stale(), session)
+        _, _, active, basket_wide = self.active_at(now)
+        ids: Set[int] = set()
+        for product_id in product_ids:
+            ids.update(self._by_product.get(product_id, ()))
+        rules = list(basket_wide)
+        for promotion_id in sorted(ids & active):
+            rule = self._rules.get(promotion_id)
+            if rule is not None:
+                rules.append(rule)
+        return [rule for rule in rules if not rule.roles or role in rule.roles]
+
+    def evaluate(
+        self, lines: List[BasketLine], role: Optional[str], now: datetime, session: Optional[Session] = None
+    ) -> Dict[int, Decimal]:
+        """Discount per applicable promotion, each computed on the undiscounted basket"""
+        basket = Basket(lines)
+        discounts: Dict[int, Decimal] = {}
+        for rule in self.candidates(basket.by_product, role, now, session):
+            amount = rule.discount(basket)
+            if amount > 0:
+                discounts[rule.id] = amount
+        return discounts
+
+
+def _load_rules(session: Session, promotion_ids: Optional[List[int]]) -> List[PromotionRule]:
+    counters = select(PromotionUsageCounter.shard).where(PromotionUsageCounter.promotion_id == Promotion.id)
+    has_counters = counters.exists()
+    has_open_counter = counters.where(col(PromotionUsageCounter.remaining) > 0).exists()
+    # plain rows: a load through the caller's session must not fill its identity map
+    query = select(Promotion.__table__).where(  # type: ignore[attr-defined]
+        col(Promotion.is_active).is_(True),
+        col(Promotion.end_date) >= datetime.utcnow(),
+        or_(
+            col(Promotion.usage_limit).is_(None),
+            # counters not created yet: usage_count is still the whole story
+            and_(~has_counters, col(Promotion.usage_count) < col(Promotion.usage_limit)),
+            has_open_counter,
+        ),
+    )
+    links = select(PromotionProduct.promotion_id, PromotionProduct.product_id)
+    if promotion_ids is not None:
+        query = query.where(col(Promotion.id).in_(promotion_ids))
+        links = links.where(col(PromotionProduct.promotion_id).in_(promotion_ids))
+
+    products: Dict[int, Set[int]] = {}
+    for promotion_id, product_id in session.execute(links):
+        products.setdefault(promotion_id, set()).add(product_id)
+    return [PromotionRule(promotion, frozenset(products.get(promotion.id, ()))) for promotion in session.execute(query)]
+
+
+def claim_promotions(session: Session, discounts: Dict[int, Decimal], now: datetime) -> Dict[int, Decimal]:
+    """Count one use of each promotion, keeping only those still running and under usage_limit"""
+    if not discounts:
+        return {}
+    claimed, exhausted = claim_uses(session, discounts, now)
+    accepted: Dict[int, Decimal] = {}
+    for promotion_id, max_discount_amount in claimed.items():
+        amount = discounts[promotion_id]
+        # the cap is re-read at claim time in case it changed after the engine snapshot
+        accepted[promotion_id] = amount if max_discount_amount is None else min(amount, max_discount_amount)
+    # anything rejected (used up, ended, deactivated) is out of date in the engine
+    refresh_promotions_on_commit(session, exhausted | (set(discounts) - set(claimed)))
+    return accepted
+
+
+promotion_engine = PromotionEngine()
+
+
+def refresh_promotions_on_commit(session: Session, promotion_ids: Iterable[int]) -> None:
+    """Mark these promotions stale once the session's transaction commits"""
+    pending: Set[int] = session.info.setdefault(REFRESH_KEY, set())
+    pending.update(promotion_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _refresh_after_commit(session: Session) -> None:
+    pending: Optional[Set[int]] = session.info.pop(REFRESH_KEY, None)
+    if pending:
+        promotion_engine.mark_stale(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(REFRESH_KEY, None)
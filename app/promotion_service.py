@@ -0,0 +1,41 @@
+from typing import Optional
+
+from app.database import get_session
+from app.models import Promotion, PromotionCreate, PromotionProduct
+from app.promotion_counters import create_counters
+from app.promotion_engine import refresh_promotions_on_commit
+
+
+def create_promotion(data: PromotionCreate) -> Promotion:
+    if data.end_date < data.start_date:
+        raise ValueError("Promotion cannot end before it starts")
+
+    with get_session() as session:
+        promotion = Promotion(**data.model_dump(exclude={"product_ids"}))
+        session.add(promotion)
+        session.flush()
+        if promotion.id is None:
+            raise RuntimeError("Promotion insert returned no id")
+        session.add_all(
+            PromotionProduct(promotion_id=promotion.id, product_id=product_id) for product_id in set(data.product_ids)
+        )
+        session.flush()
+        create_counters(session, [promotion.id])
+        refresh_promotions_on_commit(session, [promotion.id])
+        session.commit()
+        session.refresh(promotion)
+        return promotion
+
+
+def deactivate_promotion(promotion_id: int) -> Optional[Promotion]:
+    with get_session() as session:
+        promotion = session.get(Promotion, promotion_id)
+        if promotion is None:
+            return None
+
+        promotion.is_active = False
+        session.add(promotion)
+        refresh_promotions_on_commit(session, [promotion_id])
+        session.commit()
+        session.refresh(promotion)
+        return promotion
@@ -0,0 +1,149 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import Engine, TextClause, make_url, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# seconds behind the primary; a standby that has replayed everything it received counts as current
+LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class Replica:
+    """One read replica: its engines per timeout class and the last lag probe"""
+
+    def __init__(
+        self,
+        url: str,
+        engine_factory: Callable[[Any, str], Engine],
+        async_engine_factory: Optional[Callable[[Any, str], AsyncEngine]] = None,
+    ):
+        self.url = url
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.lag: Optional[float] = None
+        self.healthy = True
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._engine_factory = engine_factory
+        self._async_engine_factory = async_engine_factory
+        self._engines: Dict[Any, Engine] = {}
+        self._async_engines: Dict[Any, AsyncEngine] = {}
+
+    def engine(self, timeout_class: Any) -> Engine:
+        if timeout_class not in self._engines:
+            self._engines[timeout_class] = self._engine_factory(timeout_class, self.url)
+        return self._engines[timeout_class]
+
+    def async_engine(self, timeout_class: Any) -> AsyncEngine:
+        if self._async_engine_factory is None:
+            raise RuntimeError(f"Replica {self.name} has no async engine factory")
+        if timeout_class not in self._async_engines:
+            self._async_engines[timeout_class] = self._async_engine_factory(timeout_class, self.url)
+        return self._async_engines[timeout_class]
+
+    def dispose(self) -> None:
+        for engine in self._engines.values():
+            engine.dispose()
+        self._engines.clear()
+
+    async def dispose_async(self) -> None:
+        for engine in self._async_engines.values():
+            await engine.dispose()
+        self._async_engines.clear()
+
+
+class ReplicaRouter:
+    """Round-robin over replicas that answer and are at most `max_lag` seconds behind; None means the primary"""
+
+    def __init__(
+        self,
+        urls: List[str],
+        engine_factory: Callable[[Any, str], Engine],
+        async_engine_factory: Optional[Callable[[Any, str], AsyncEngine]] = None,
+        max_lag: float = 5.0,
+        check_interval: float = 1.0,
+        retry_after: float = 10.0,
+        lag_query: TextClause = LAG_QUERY,
+    ):
+        self.replicas = [Replica(url, engine_factory, async_engine_factory) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self.lag_query = lag_query
+        self.routed = 0
+        self.fallbacks = 0
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def _probe(self, replica: Replica, timeout_class: Any) -> None:
+        try:
+            with replica.engine(timeout_class).connect() as connection:
+                lag = connection.execute(self.lag_query).scalar_one()
+        except Exception as exc:
+            if replica.healthy:
+                logger.warning(f"Read replica {replica.name} is unavailable, routing reads elsewhere: {exc}")
+            replica.healthy, replica.error = False, str(exc)
+        else:
+            if not replica.healthy:
+                logger.info(f"Read replica {replica.name} is back")
+            replica.healthy, replica.lag, replica.error = True, float(lag), None
+        replica.checked_at = time.monotonic()
+
+    def _usable(self, replica: Replica, timeout_class: Any) -> bool:
+        interval = self.check_interval if replica.healthy else self.retry_after
+        if replica.checked_at is None or time.monotonic() - replica.checked_at >= interval:
+            self._probe(replica, timeout_class)
+        return replica.healthy and replica.lag is not None and replica.lag <= self.max_lag
+
+    def choose(self, timeout_class: Any) -> Optional[Replica]:
+        """Next usable replica in turn; probes block, so async callers should run this in a thread"""
+        if not self.replicas:
+            return None
+        start = next(self._turn)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._usable(replica, timeout_class):
+                with self._lock:
+                    self.routed += 1
+                return replica
+        with self._lock:
+            self.fallbacks += 1
+        return None
+
+    def mark_failed(self, replica: Replica, error: Exception) -> None:
+        """Take a replica out of rotation after a query on it failed"""
+        replica.healthy, replica.error, replica.checked_at = False, str(error), time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_lag_seconds": self.max_lag,
+            "routed": self.routed,
+            "fallbacks_to_primary": self.fallbacks,
+            "replicas": [
+                {"name": replica.name, "healthy": replica.healthy, "lag_seconds": replica.lag, "error": replica.error}
+                for replica in self.replicas
+            ],
+        }
+
+    def dispose(self) -> None:
+        for replica in self.replicas:
+            replica.dispose()
+
+    async def dispose_async(self) -> None:
+        for replica in self.replicas:
+            await replica.dispose_async()
@@ -0,0 +1,192 @@
+import logging
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Engine, bindparam, text
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, col, func, select
+
+from app.database import TimeoutClass, get_session
+from app.models import ResellerClosure, ResellerProfile, ResellerProfileCreate
+from app.price_resolver import refresh_resellers_on_commit
+
+logger = logging.getLogger(__name__)
+
+MAX_HIERARCHY_DEPTH = 10
+
+# expected closure derived from the parent_reseller_id adjacency list
+EXPECTED_CLOSURE_CTE = """
+WITH RECURSIVE expected(ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM reseller_profiles
+    UNION ALL
+    SELECT p.parent_reseller_id, e.descendant_id, e.depth + 1
+    FROM expected e JOIN reseller_profiles p ON p.id = e.ancestor_id
+    WHERE p.parent_reseller_id IS NOT NULL AND e.depth < :max_depth
+)
+"""
+
+
+def _lock_hierarchy(session: Session) -> None:
+    # hierarchy writes are rare; serializing them keeps subtree moves consistent
+    session.execute(text("SELECT pg_advisory_xact_lock(hashtext('reseller_closure'))"))
+
+
+def _ancestor_count(session: Session, reseller_id: int) -> int:
+    result = session.exec(select(func.count()).where(ResellerClosure.descendant_id == reseller_id)).first()
+    return result if result is not None else 0
+
+
+_seller = aliased(ResellerProfile)
+# built once: constructing the aliased join per call costs more than the indexed lookup itself
+UPLINE_QUERY = (
+    select(
+        ResellerProfile.id,
+        ResellerProfile.user_id,
+        ResellerProfile.commission_rate,
+        ResellerProfile.is_active,
+        (col(ResellerClosure.depth) + 1).label("depth"),
+    )
+    .join(ResellerClosure, col(ResellerClosure.ancestor_id) == ResellerProfile.id)
+    .join(_seller, col(_seller.id) == ResellerClosure.descendant_id)
+    .where(_seller.user_id == bindparam("reseller_user_id"))
+    .order_by(col(ResellerClosure.depth))
+)
+
+
+def get_reseller_upline(session: Session, reseller_user_id: int) -> List[Dict[str, Any]]:
+    """Selling reseller plus every ancestor, nearest first, in one indexed closure lookup"""
+    rows = session.execute(UPLINE_QUERY, {"reseller_user_id": reseller_user_id}).mappings()
+    return [dict(row) for row in rows]
+
+
+def create_reseller_profile(data: ResellerProfileCreate, referral_code: Optional[str] = None) -> ResellerProfile:
+    with get_session() as session:
+        _lock_hierarchy(session)
+        if data.parent_reseller_id is not None:
+            if session.get(ResellerProfile, data.parent_reseller_id) is None:
+                raise ValueError(f"Parent reseller {data.parent_reseller_id} not found")
+            if _ancestor_count(session, data.parent_reseller_id) >= MAX_HIERARCHY_DEPTH:
+                raise ValueError(f"Reseller hierarchy cannot exceed {MAX_HIERARCHY_DEPTH} levels")
+
+        profile = ResellerProfile(**data.model_dump(), referral_code=referral_code or uuid.uuid4().hex[:12].upper())
+        session.add(profile)
+        session.flush()
+        if profile.id is None:
+            raise RuntimeError("Reseller profile insert returned no id")
+
+        session.add(ResellerClosure(ancestor_id=profile.id, descendant_id=profile.id, depth=0))
+        if data.parent_reseller_id is not None:
+            session.execute(
+                text(
+                    "INSERT INTO reseller_closure (ancestor_id, descendant_id, depth) "
+                    "SELECT ancestor_id, :node, depth + 1 FROM reseller_closure WHERE descendant_id = :parent"
+                ),
+                {"node": profile.id, "parent": data.parent_reseller_id},
+            )
+        refresh_resellers_on_commit(session, [data.user_id])
+        session.commit()
+        session.refresh(profile)
+        return profile
+
+
+def change_parent(reseller_id: int, new_parent_id: Optional[int]) -> ResellerProfile:
+    """Re-parent a reseller, moving its whole subtree in the closure table"""
+    with get_session() as session:
+        _lock_hierarchy(session)
+        profile = session.get(ResellerProfile, reseller_id)
+        if profile is None:
+            raise ValueError(f"Reseller {reseller_id} not found")
+
+        if new_parent_id is not None:
+            if session.get(ResellerProfile, new_parent_id) is None:
+                raise ValueError(f"Parent reseller {new_parent_id} not found")
+            in_subtree = session.exec(
+                select(ResellerClosure).where(
+                    ResellerClosure.ancestor_id == reseller_id, ResellerClosure.descendant_id == new_parent_id
+                )
+            ).first()
+            if in_subtree is not None:
+                raise ValueError("A reseller cannot be moved under its own subtree")
+            subtree_height = session.exec(
+                select(func.max(ResellerClosure.depth)).where(ResellerClosure.ancestor_id == reseller_id)
+            ).first()
+            height = subtree_height if subtree_height is not None else 0
+            if _ancestor_count(session, new_parent_id) + height + 1 > MAX_HIERARCHY_DEPTH:
+                raise ValueError(f"Reseller hierarchy cannot exceed {MAX_HIERARCHY_DEPTH} levels")
+
+        params = {"node": reseller_id, "parent": new_parent_id}
+        session.execute(
+            text(
+                "DELETE FROM reseller_closure "
+                "WHERE descendant_id IN (SELECT descendant_id FROM reseller_closure WHERE ancestor_id = :node) "
+                "AND ancestor_id NOT IN (SELECT descendant_id FROM reseller_closure WHERE ancestor_id = :node)"
+            ),
+            params,
+        )
+        if new_parent_id is not None:
+            session.execute(
+                text(
+                    "INSERT INTO reseller_closure (ancestor_id, descendant_id, depth) "
+                    "SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1 "
+                    "FROM reseller_closure above CROSS JOIN reseller_closure below "
+                    "WHERE above.descendant_id = :parent AND below.ancestor_id = :node"
+                ),
+                params,
+            )
+        profile.parent_reseller_id = new_parent_id
+        session.add(profile)
+        session.commit()
+        session.refresh(profile)
+        return profile
+
+
+def check_closure_consistency(repair: bool = False) -> Dict[str, int]:
+    """Compare the closure table with the adjacency list; optionally rebuild it when they drift"""
+    with get_session(TimeoutClass.BATCH) as session:
+        if repair:
+            _lock_hierarchy(session)
+        params = {"max_depth": MAX_HIERARCHY_DEPTH}
+        missing = session.execute(
+            text(
+                EXPECTED_CLOSURE_CTE
+                + "SELECT count(*) FROM (SELECT * FROM expected EXCEPT SELECT * FROM reseller_closure) AS m"
+            ),
+            params,
+        ).scalar_one()
+        extra = session.execute(
+            text(
+                EXPECTED_CLOSURE_CTE
+                + "SELECT count(*) FROM (SELECT * FROM reseller_closure EXCEPT SELECT * FROM expected) AS x"
+            ),
+            params,
+        ).scalar_one()
+        report = {"missing": missing, "extra": extra, "repaired": 0}
+
+        if repair and (missing or extra):
+            logger.warning(f"Reseller closure drift: {missing} missing, {extra} extra rows; rebuilding")
+            report["repaired"] = _rebuild(session)
+        session.commit()
+        return report
+
+
+def _rebuild(session: Session) -> int:
+    session.execute(text("DELETE FROM reseller_closure"))
+    result = session.execute(
+        text(
+            EXPECTED_CLOSURE_CTE
+            + "INSERT INTO reseller_closure (ancestor_id, descendant_id, depth) SELECT * FROM expected"
+        ),
+        {"max_depth": MAX_HIERARCHY_DEPTH},
+    )
+    return result.rowcount
+
+
+def rebuild_closure(engine: Optional[Engine] = None) -> int:
+    """Recompute the whole closure from parent_reseller_id, e.g. after a backfill"""
+    with Session(engine) if engine is not None else get_session(TimeoutClass.BATCH) as session:
+        _lock_hierarchy(session)
+        count = _rebuild(session)
+        session.commit()
+        session.execute(text("ANALYZE reseller_closure"))
+        session.commit()
+        return count
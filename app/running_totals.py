@@ -0,0 +1,181 @@
+"""Running totals on reseller profiles, affiliate profiles and affiliate links.
+
+total_sales is the net (subtotal - discount_amount) of the COMPLETED transactions a profile or link sold,
+total_commission the sum of its commissions of the matching type, conversions the number of those sales.
+Checkout and settlement add their deltas in the transaction that writes the sale or the commissions, so a
+profile page or leaderboard reads one row. verify_running_totals() recomputes them from the history and
+repairs any drift, e.g. from rows written outside these paths or a status changed by hand.
+"""
+
+import logging
+import os
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple, Type, TypeVar
+
+from sqlalchemy import text
+from sqlmodel import Session, col, select
+
+from app.database import TimeoutClass, get_session, read_only
+from app.models import AffiliateProfile, ResellerProfile
+
+logger = logging.getLogger(__name__)
+
+P = TypeVar("P", ResellerProfile, AffiliateProfile)
+
+VERIFY_INTERVAL = float(os.environ.get("APP_TOTALS_VERIFY_SECONDS", "86400"))
+
+# lock in id order, like the stock decrement, so concurrent checkouts sharing an upline cannot deadlock
+_ADD = """
+WITH delta AS (
+    SELECT * FROM unnest(CAST(:keys AS integer[]), CAST(:sales AS numeric[]), CAST(:others AS {other_type}[]))
+        AS d(key, sales, other)
+),
+locked AS (
+    SELECT t.id, t.{key} AS key FROM {table} t
+    WHERE t.{key} IN (SELECT key FROM delta) ORDER BY t.id FOR NO KEY UPDATE
+)
+UPDATE {table} t
+SET total_sales = t.total_sales + delta.sales, {other} = t.{other} + delta.other
+FROM delta JOIN locked ON locked.key = delta.key
+WHERE t.id = locked.id
+"""
+ADD_TO_RESELLERS = text(
+    _ADD.format(table="reseller_profiles", key="user_id", other="total_commission", other_type="numeric")
+)
+ADD_TO_AFFILIATES = text(
+    _ADD.format(table="affiliate_profiles", key="user_id", other="total_commission", other_type="numeric")
+)
+ADD_TO_LINKS = text(_ADD.format(table="affiliate_links", key="id", other="conversions", other_type="integer"))
+
+# expected totals from the history, for the rows in :only (every row when NULL)
+_EXPECTED_PROFILES = """
+    SELECT p.id, coalesce(s.total_sales, 0) AS total_sales, coalesce(c.total_commission, 0) AS total_commission
+    FROM {table} p
+    LEFT JOIN (
+        SELECT {seller} AS user_id, sum(subtotal - discount_amount) AS total_sales
+        FROM transactions WHERE status = 'COMPLETED' AND {seller} IS NOT NULL
+        GROUP BY {seller}
+    ) s ON s.user_id = p.user_id
+    LEFT JOIN (
+        SELECT user_id, sum(commission_amount) AS total_commission
+        FROM commissions WHERE commission_type = '{commission_type}'
+        GROUP BY user_id
+    ) c ON c.user_id = p.user_id
+    WHERE CAST(:only AS integer[]) IS NULL OR p.id = ANY(CAST(:only AS integer[]))
+"""
+EXPECTED = {
+    "reseller_profiles": _EXPECTED_PROFILES.format(
+        table="reseller_profiles", seller="reseller_id", commission_type="reseller"
+    ),
+    "affiliate_profiles": _EXPECTED_PROFILES.format(
+        table="affiliate_profiles", seller="affiliate_id", commission_type="affiliate"
+    ),
+    "affiliate_links": """
+        SELECT l.id, coalesce(s.total_sales, 0) AS total_sales, coalesce(s.conversions, 0) AS conversions
+        FROM affiliate_links l
+        LEFT JOIN (
+            SELECT affiliate_link_id, sum(subtotal - discount_amount) AS total_sales, count(*) AS conversions
+            FROM transactions WHERE status = 'COMPLETED' AND affiliate_link_id IS NOT NULL
+            GROUP BY affiliate_link_id
+        ) s ON s.affiliate_link_id = l.id
+        WHERE CAST(:only AS integer[]) IS NULL OR l.id = ANY(CAST(:only AS integer[]))
+    """,
+}
+OTHER_TOTAL = {
+    "reseller_profiles": "total_commission",
+    "affiliate_profiles": "total_commission",
+    "affiliate_links": "conversions",
+}
+_DRIFTED = """
+    WITH expected AS ({expected})
+    SELECT t.id FROM {table} t JOIN expected e ON e.id = t.id
+    WHERE t.total_sales <> e.total_sales OR t.{other} <> e.{other}
+"""
+_LOCK = "SELECT id FROM {table} WHERE id = ANY(CAST(:only AS integer[])) ORDER BY id FOR NO KEY UPDATE"
+_REPAIR = """
+    WITH expected AS ({expected})
+    UPDATE {table} t SET total_sales = e.total_sales, {other} = e.{other}
+    FROM expected e
+    WHERE e.id = t.id AND (t.total_sales <> e.total_sales OR t.{other} <> e.{other})
+    RETURNING t.id, t.total_sales, t.{other}
+"""
+
+
+class TotalsDelta:
+    """What one checkout or settlement chunk adds to the running totals, keyed by user id (links by link id)"""
+
+    __slots__ = ("resellers", "affiliates", "links")
+
+    def __init__(self):
+        self.resellers: Dict[int, List[Decimal]] = {}  # user_id -> [sales, commission]
+        self.affiliates: Dict[int, List[Decimal]] = {}
+        self.links: Dict[int, Tuple[Decimal, int]] = {}  # link id -> (sales, conversions)
+
+    def add_sale(
+        self, reseller_id: Optional[int], affiliate_id: Optional[int], link_id: Optional[int], amount: Decimal
+    ) -> None:
+        if reseller_id is not None:
+            self.resellers.setdefault(reseller_id, [Decimal("0"), Decimal("0")])[0] += amount
+        if affiliate_id is not None:
+            self.affiliates.setdefault(affiliate_id, [Decimal("0"), Decimal("0")])[0] += amount
+        if link_id is not None:
+            sales, conversions = self.links.get(link_id, (Decimal("0"), 0))
+            self.links[link_id] = (sales + amount, conversions + 1)
+
+    def add_commission(self, commission_type: str, user_id: int, amount: Decimal) -> None:
+        totals = self.resellers if commission_type == "reseller" else self.affiliates
+        totals.setdefault(user_id, [Decimal("0"), Decimal("0")])[1] += amount
+
+
+def add_to_totals(session: Session, delta: TotalsDelta) -> None:
+    """Apply `delta` in the caller's transaction; rows without a profile (or link) are skipped"""
+    for statement, totals in (
+        (ADD_TO_RESELLERS, delta.resellers),
+        (ADD_TO_AFFILIATES, delta.affiliates),
+        (ADD_TO_LINKS, delta.links),
+    ):
+        if not totals:
+            continue
+        keys = sorted(totals)
+        session.execute(
+            statement,
+            {
+                "keys": keys,
+                "sales": [totals[key][0] for key in keys],
+                "others": [totals[key][1] for key in keys],
+            },
+        )
+
+
+def verify_running_totals(repair: bool = True) -> Dict[str, int]:
+    """Compare every running total with the history; returns how many rows of each table had drifted.
+
+    The comparison reads without locks. Drifted rows are then locked, and only then recomputed and
+    overwritten: that statement's snapshot sees every sale committed before the lock, and sales still in
+    flight add their deltas after this commit, so none is lost or counted twice.
+    """
+    drifted: Dict[str, int] = {}
+    for table, other in OTHER_TOTAL.items():
+        names = {"expected": EXPECTED[table], "table": table, "other": other}
+        with get_session(TimeoutClass.BATCH) as session:
+            suspects = list(session.execute(text(_DRIFTED.format(**names)), {"only": None}).scalars())
+            if not suspects or not repair:
+                drifted[table] = len(suspects)
+                continue
+            session.execute(text(_LOCK.format(**names)), {"only": suspects})
+            repaired = session.execute(text(_REPAIR.format(**names)), {"only": suspects}).all()
+            session.commit()
+        drifted[table] = len(repaired)
+        for row_id, total_sales, other_total in repaired:
+            logger.warning(f"Repaired drifted running totals of {table} {row_id}: {total_sales}, {other}={other_total}")
+    return drifted
+
+
+def leaderboard(model: Type[P], limit: int = 10) -> List[P]:
+    """Profiles with the highest total_sales, read from the profile rows alone"""
+
+    def work(session: Session) -> List[P]:
+        query = select(model).order_by(col(model.total_sales).desc(), col(model.id)).limit(limit)
+        return list(session.exec(query).all())
+
+    return read_only(work)
@@ -0,0 +1,208 @@
+"""Hourly and daily sales rollups per cashier, reseller, product and category.
+
+A trigger on transactions queues a sales_events row whenever a transaction enters or leaves COMPLETED or
+REFUNDED. apply_sales_events() folds the queue into the rollup tables with delta upserts, so dashboards read
+one row per bucket and key however long the history is. rebuild_rollups() recomputes them from the
+transactions themselves, for backfills and repairs: `python -m app.sales_rollups rebuild --since 2026-01-01`.
+
+Both go through the same statement, fed either by queued events or by every sold transaction, so an
+incremental rollup equals a rebuilt one, but for the all-zero rows a sale taken back can leave. Amounts are
+read when the event is applied; they are expected to be final once a transaction is sold, as checkout writes
+them. Categories are the products' current ones.
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Type, TypeVar
+
+from sqlalchemy import text
+from sqlmodel import Session, col, select
+
+from app.database import ENGINES, TimeoutClass, get_session, read_only
+from app.models import (
+    CashierSalesRollup,
+    CategorySalesRollup,
+    ProductSalesRollup,
+    ResellerSalesRollup,
+    SalesRollup,
+)
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R", bound=SalesRollup)
+
+GRAINS = ("hour", "day")
+APPLY_BATCH = int(os.environ.get("APP_SALES_ROLLUP_BATCH", "5000"))
+APPLY_INTERVAL = float(os.environ.get("APP_SALES_ROLLUP_SECONDS", "10"))
+
+TRANSACTION_MEASURES = {
+    "transaction_count": "sales",
+    "subtotal": "sales * subtotal",
+    "discount_amount": "sales * discount_amount",
+    "tax_amount": "sales * tax_amount",
+    "total_amount": "sales * total_amount",
+    "refund_count": "refunds",
+    "refunded_amount": "refunds * total_amount",
+}
+ITEM_MEASURES = {
+    "quantity": "sales * quantity",
+    "total_price": "sales * total_price",
+    "discount_amount": "sales * discount_amount",
+    "refunded_quantity": "refunds * quantity",
+    "refunded_amount": "refunds * total_price",
+}
+# (model, key column, CTE it is aggregated from, measures)
+ROLLUPS = [
+    (CashierSalesRollup, "cashier_id", "sold", TRANSACTION_MEASURES),
+    (ResellerSalesRollup, "reseller_id", "sold", TRANSACTION_MEASURES),
+    (ProductSalesRollup, "product_id", "lines", ITEM_MEASURES),
+    (CategorySalesRollup, "category_id", "lines", ITEM_MEASURES),
+]
+
+# `changes` holds (transaction_id, sales, refunds): how many times each transaction is added to the
+# sales and to the refunds, -1 taking it back out
+SOLD = """
+sold AS (
+    SELECT t.id, t.created_at, t.cashier_id, t.reseller_id, t.subtotal, t.discount_amount, t.tax_amount,
+           t.total_amount, c.sales, c.refunds, g.grain,
+           date_trunc(g.grain, coalesce(t.completed_at, t.created_at)) AS bucket
+    FROM changes c
+    JOIN transactions t ON t.id = c.transaction_id
+    CROSS JOIN (VALUES ('hour'), ('day')) AS g(grain)
+    WHERE c.sales <> 0 OR c.refunds <> 0
+),
+lines AS (
+    SELECT s.grain, s.bucket, s.sales, s.refunds, i.product_id, p.category_id, i.quantity, i.total_price,
+           i.discount_amount
+    FROM sold s
+    JOIN transaction_items i ON i.transaction_id = s.id
+    JOIN products p ON p.id = i.product_id
+)"""
+
+QUEUED = """
+taken AS (
+    DELETE FROM sales_events WHERE id IN (SELECT id FROM sales_events ORDER BY id LIMIT :batch)
+    RETURNING transaction_id, sale_sign, refund_sign
+),
+changes AS (
+    SELECT transaction_id, sum(sale_sign) AS sales, sum(refund_sign) AS refunds FROM taken GROUP BY transaction_id
+)"""
+
+HISTORY = """
+changes AS (
+    SELECT id AS transaction_id, 1 AS sales, CAST(status = 'REFUNDED' AS integer) AS refunds
+    FROM transactions
+    WHERE status IN ('COMPLETED', 'REFUNDED') AND coalesce(completed_at, created_at) >= :since
+)"""
+
+
+def _upsert(table: str, key: str, source: str, measures: Dict[str, str]) -> str:
+    columns = ", ".join(measures)
+    sums = ", ".join(f"sum({expression})" for expression in measures.values())
+    updates = ", ".join(f"{name} = r.{name} + excluded.{name}" for name in measures)
+    return f"""
+upsert_{table} AS (
+    INSERT INTO {table} AS r (grain, bucket, {key}, {columns})
+    SELECT grain, bucket, {key}, {sums}
+    FROM {source} WHERE {key} IS NOT NULL
+    GROUP BY grain, bucket, {key}
+    ON CONFLICT (grain, bucket, {key}) DO UPDATE SET {updates}
+)"""
+
+
+def _rollup_statement(changes: str, counted: str):
+    upserts = ",".join(
+        _upsert(model.__tablename__, key, source, measures)  # type: ignore[arg-type]
+        for model, key, source, measures in ROLLUPS
+    )
+    return text(f"WITH {changes},{SOLD},{upserts}\nSELECT count(*) FROM {counted}")
+
+
+APPLY = _rollup_statement(QUEUED, "taken")
+REBUILD = _rollup_statement(HISTORY, "changes")
+
+LOCK_KEY = "hashtext('app.sales_rollups')"
+TRY_LOCK = text(f"SELECT pg_try_advisory_xact_lock({LOCK_KEY})")
+DROP_EVENTS = text(
+    """
+    DELETE FROM sales_events e USING transactions t
+    WHERE t.id = e.transaction_id AND coalesce(t.completed_at, t.created_at) >= :since
+    """
+)
+
+
+def apply_sales_events(batch: int = APPLY_BATCH) -> int:
+    """Fold queued sales events into the rollups, `batch` events per transaction; returns how many were applied"""
+    applied = 0
+    while True:
+        with get_session(TimeoutClass.BATCH) as session:
+            # one applier at a time across instances, and none while a rebuild runs
+            if not session.execute(TRY_LOCK).scalar_one():
+                return applied
+            taken = session.execute(APPLY, {"batch": batch}).scalar_one()
+            session.commit()
+        applied += taken
+        if taken < batch:
+            return applied
+
+
+def rebuild_rollups(since: Optional[datetime] = None) -> int:
+    """Recompute the rollups for sales from the day of `since` on (all of them when None); returns transactions"""
+    start = datetime(since.year, since.month, since.day) if since is not None else datetime.min
+    engine = ENGINES[TimeoutClass.BATCH]
+    with engine.connect() as lock:
+        # taken before the rebuild's snapshot, so no apply run commits between the two
+        lock.execute(text(f"SELECT pg_advisory_lock({LOCK_KEY})"))
+        lock.commit()
+        try:
+            # one snapshot: events committed after it stay queued for transactions the rebuild did not see
+            with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+                with connection.begin():
+                    for model, _, _, _ in ROLLUPS:
+                        connection.execute(
+                            text(f"DELETE FROM {model.__tablename__} WHERE bucket >= :since"), {"since": start}
+                        )
+                    connection.execute(DROP_EVENTS, {"since": start})
+                    rebuilt = connection.execute(REBUILD, {"since": start}).scalar_one()
+        finally:
+            lock.execute(text(f"SELECT pg_advisory_unlock({LOCK_KEY})"))
+            lock.commit()
+    scope = f"from {start:%Y-%m-%d}" if since is not None else "for all history"
+    logger.info(f"Rebuilt sales rollups {scope} out of {rebuilt} transactions")
+    return rebuilt
+
+
+def sales_rollups(model: Type[R], grain: str, start: datetime, end: datetime) -> List[R]:
+    """Rollup rows of `model` with buckets in [start, end), oldest first; the cost is buckets times keys"""
+    if grain not in GRAINS:
+        raise ValueError(f"grain must be one of {GRAINS}, not {grain!r}")
+
+    def work(session: Session) -> List[R]:
+        query = (
+            select(model)
+            .where(model.grain == grain, col(model.bucket) >= start, col(model.bucket) < end)
+            .order_by(col(model.bucket))
+        )
+        return list(session.exec(query).all())
+
+    return read_only(work)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.sales_rollups", description="Sales rollup tables")
+    parser.add_argument("command", choices=["rebuild", "apply"])
+    parser.add_argument("--since", type=datetime.fromisoformat, help="first day to rebuild (default: all history)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    match args.command:
+        case "rebuild":
+            rebuild_rollups(args.since)
+        case "apply":
+            logger.info(f"Applied {apply_sales_events()} sales events")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,24 @@
-from app.database import create_tables
-from nicegui import ui
+from app.click_buffer import FLUSH_INTERVAL, click_buffer
+from app.migrations import ensure_schema
+from app.partitions import MAINTENANCE_INTERVAL, maintain_partitions
+from app.price_resolver import price_resolver
+from app.promotion_counters import create_missing_counters
+from app.running_totals import VERIFY_INTERVAL, verify_running_totals
+from app.sales_rollups import APPLY_INTERVAL, apply_sales_events
+from nicegui import app, run, ui
 
 
 def startup() -> None:
     # this function is called before the first request
-    create_tables()
+    ensure_schema()
+    create_missing_counters()
+    # rebuilt from time to time for price changes made by other processes
+    app.timer(price_resolver.max_age / 4, lambda: run.io_bound(price_resolver.warm))
+    # off the startup path: until it runs, new months' rows wait in the default partitions
+    app.timer(MAINTENANCE_INTERVAL, lambda: run.io_bound(maintain_partitions))
+    app.timer(APPLY_INTERVAL, lambda: run.io_bound(apply_sales_events))
+    app.timer(VERIFY_INTERVAL, lambda: run.io_bound(verify_running_totals))
+    app.timer(FLUSH_INTERVAL, lambda: run.io_bound(click_buffer.flush))
 
     @ui.page("/")
     def index():
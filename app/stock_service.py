@@ -0,0 +1,109 @@
+import os
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Mapping, Optional
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.database import bulk_insert
+from app.models import StockMovement
+
+
+class OversellPolicy(str, Enum):
+    REJECT = "reject"  # never sell below zero
+    BACKORDER = "backorder"  # sell down to -OVERSELL_ALLOWANCE, e.g. goods on the truck
+    ALLOW = "allow"  # always sell; the ledger flags the shortfall
+
+
+OVERSELL_POLICY = OversellPolicy(os.environ.get("APP_OVERSELL_POLICY", OversellPolicy.REJECT.value))
+OVERSELL_ALLOWANCE = int(os.environ.get("APP_OVERSELL_ALLOWANCE", "0"))
+
+# lock in id order so two baskets sharing products cannot deadlock, and only decrement rows that stay above
+# the floor; the whole basket is one statement and RETURNING gives the ledger its before/after quantities.
+# NO KEY UPDATE, like the UPDATE itself: other sales' item rows hold KEY SHARE on these products.
+DECREMENT = text(
+    """
+    WITH basket AS (
+        SELECT id, quantity FROM unnest(CAST(:ids AS integer[]), CAST(:quantities AS integer[])) AS b(id, quantity)
+    ),
+    locked AS (
+        SELECT p.id FROM products p WHERE p.id IN (SELECT id FROM basket) ORDER BY p.id FOR NO KEY UPDATE
+    )
+    UPDATE products p
+    SET stock_quantity = p.stock_quantity - basket.quantity, updated_at = :now
+    FROM basket JOIN locked ON locked.id = basket.id
+    WHERE p.id = basket.id AND p.is_active
+      AND (CAST(:floor AS integer) IS NULL OR p.stock_quantity - basket.quantity >= :floor)
+    RETURNING p.id, p.stock_quantity
+    """
+)
+
+
+def stock_floor(policy: OversellPolicy, allowance: int = OVERSELL_ALLOWANCE) -> Optional[int]:
+    """Lowest stock level a sale may leave behind, None when unbounded"""
+    match policy:
+        case OversellPolicy.REJECT:
+            return 0
+        case OversellPolicy.BACKORDER:
+            return -allowance
+        case OversellPolicy.ALLOW:
+            return None
+
+
+def can_sell(on_hand: int, quantity: int, policy: OversellPolicy = OVERSELL_POLICY) -> bool:
+    floor = stock_floor(policy)
+    return floor is None or on_hand - quantity >= floor
+
+
+def decrement_stock(
+    session: Session,
+    quantities: Mapping[int, int],
+    reference_number: Optional[str],
+    created_by: int,
+    now: datetime,
+    policy: OversellPolicy = OVERSELL_POLICY,
+) -> Dict[int, int]:
+    """Take a basket out of stock and write its ledger rows; returns the new quantity per product.
+
+    Raises ValueError, leaving the caller to roll back, when a product is inactive or would fall below the floor.
+    """
+    ids = sorted(quantities)
+    if not ids:
+        return {}
+    updated: Dict[int, int] = dict(
+        session.execute(
+            DECREMENT,
+            {
+                "ids": ids,
+                "quantities": [quantities[product_id] for product_id in ids],
+                "floor": stock_floor(policy),
+                "now": now,
+            },
+        ).all()
+    )
+    for product_id in ids:
+        if product_id not in updated:
+            available = session.execute(
+                text("SELECT is_active FROM products WHERE id = :id"), {"id": product_id}
+            ).scalar_one_or_none()
+            if not available:
+                raise ValueError(f"Product {product_id} is not available")
+            raise ValueError(f"Insufficient stock for product {product_id}")
+
+    rows: List[Dict[str, Any]] = [
+        {
+            "product_id": product_id,
+            "movement_type": "out",
+            "quantity": quantities[product_id],
+            "previous_quantity": updated[product_id] + quantities[product_id],
+            "new_quantity": updated[product_id],
+            "reference_number": reference_number,
+            "notes": "oversold" if updated[product_id] < 0 else None,
+            "created_by": created_by,
+            "created_at": now,
+        }
+        for product_id in ids
+    ]
+    bulk_insert(session, StockMovement, rows)
+    return updated
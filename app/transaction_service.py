@@ -0,0 +1,44 @@
+from typing import List, Optional
+
+from sqlmodel import col, select
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.database import TimeoutClass, read_only, read_only_async
+from app.models import Transaction
+
+HISTORY_PAGE_SIZE = 50
+
+
+def _history_query(
+    cashier_id: Optional[int], user_id: Optional[int], before_id: Optional[int], limit: int
+) -> SelectOfScalar[Transaction]:
+    # keyset pagination: pass the last id of a page as `before_id` for the next one
+    query = select(Transaction).order_by(col(Transaction.id).desc()).limit(limit)
+    if cashier_id is not None:
+        query = query.where(Transaction.cashier_id == cashier_id)
+    if user_id is not None:
+        query = query.where(Transaction.user_id == user_id)
+    if before_id is not None:
+        query = query.where(col(Transaction.id) < before_id)
+    return query
+
+
+def get_transaction_history(
+    cashier_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> List[Transaction]:
+    """Newest transactions first, optionally for one cashier or customer; served by a replica when available"""
+    query = _history_query(cashier_id, user_id, before_id, limit)
+    return read_only(lambda session: list(session.exec(query).all()), TimeoutClass.OLTP)
+
+
+async def get_transaction_history_async(
+    cashier_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> List[Transaction]:
+    query = _history_query(cashier_id, user_id, before_id, limit)
+    return await read_only_async(lambda session: list(session.exec(query).all()), TimeoutClass.OLTP)
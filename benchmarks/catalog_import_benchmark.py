@@ -0,0 +1,102 @@
+"""Throughput of the bulk catalog import on a 100k-row supplier catalog, vs one ORM upsert per row.
+
+Runs the import three times: a fresh catalog (every row created), a re-import where a tenth of the rows
+change price and a tenth change stock, and an identical re-import. One row in a hundred is invalid. The
+baseline looks each SKU up and adds or updates a Product through the ORM, committing every BATCH rows, on
+BASELINE_ROWS rows only.
+Run against a scratch database: `python -m benchmarks.catalog_import_benchmark`
+"""
+
+import random
+import time
+from decimal import Decimal
+from typing import Dict, List
+
+from sqlmodel import select
+
+from app.catalog_import import BATCH_SIZE, import_catalog
+from app.database import TimeoutClass, get_session
+from app.models import Category, Product
+from benchmarks.common import logger, run_id, seed_catalog, setup_logging
+
+ROWS = 100_000
+CATEGORIES = 20
+BASELINE_ROWS = 5_000
+
+
+def catalog(tag: str, categories: List[str]) -> List[Dict[str, str]]:
+    rows = [
+        {
+            "sku": f"IMP-{tag}-{i}",
+            "name": f"Imported product {i}",
+            "category": categories[i % len(categories)],
+            "barcode": f"{tag}{i:09d}",
+            "base_price": f"{1 + i % 50}.99",
+            "cost_price": f"{i % 50}.49",
+            "stock_quantity": str(i % 200),
+            "description": "Supplier catalog row",
+        }
+        for i in range(ROWS)
+    ]
+    for i in range(0, ROWS, 100):
+        rows[i]["base_price"] = "n/a"
+    return rows
+
+
+def changed(rows: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    random.seed(7)
+    rows = [dict(row) for row in rows]
+    for row in random.sample(rows, ROWS // 10):
+        row["base_price"] = "99.99"
+    for row in random.sample(rows, ROWS // 10):
+        row["stock_quantity"] = "500"
+    return rows
+
+
+def orm_upserts(rows: List[Dict[str, str]], category_ids: Dict[str, int]) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        with get_session(TimeoutClass.BATCH) as session:
+            for row in rows[start : start + BATCH_SIZE]:
+                product = session.exec(select(Product).where(Product.sku == row["sku"])).first()
+                if product is None:
+                    product = Product(sku=row["sku"], name=row["name"], category_id=0, base_price=0, cost_price=0)
+                product.name = row["name"]
+                product.category_id = category_ids[row["category"]]
+                product.base_price = Decimal(row["base_price"])
+                product.cost_price = Decimal(row["cost_price"])
+                product.stock_quantity = int(row["stock_quantity"])
+                session.add(product)
+            session.commit()
+
+
+def run() -> None:
+    user_id = seed_catalog(1)["cashier"][0]
+    tag = run_id()
+    names = [f"import-{tag}-{i}" for i in range(CATEGORIES)]
+    with get_session() as session:
+        categories = [Category(name=name) for name in names]
+        session.add_all(categories)
+        session.commit()
+        category_ids = {category.name: category.id or 0 for category in categories}
+
+    rows = catalog(tag, names)
+    for label, batch in [("fresh catalog", rows), ("20% changed", changed(rows)), ("unchanged", changed(rows))]:
+        report = import_catalog(batch, created_by=user_id, reference_number=f"bench-{tag}")
+        logger.info(
+            f"{label}: {report.rows:,} rows in {report.elapsed_seconds:.1f}s -> {report.rows_per_second:,.0f} rows/s "
+            f"({report.created:,} created, {report.updated:,} updated, {report.unchanged:,} unchanged, "
+            f"{report.stock_movements:,} stock movements, {len(report.errors):,} errors)"
+        )
+
+    baseline = [row | {"sku": f"ORM-{row['sku']}"} for row in rows[1:BASELINE_ROWS] if row["base_price"] != "n/a"]
+    started = time.perf_counter()
+    orm_upserts(baseline, category_ids)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"ORM upsert per row: {len(baseline):,} rows in {elapsed:.1f}s -> {len(baseline) / elapsed:,.0f} rows/s"
+    )
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
@@ -0,0 +1,36 @@
+"""Baskets per second for the bulk checkout path.
+
+Run against a scratch database: `python -m benchmarks.checkout_benchmark`
+"""
+
+from app.checkout_service import checkout
+from app.models import TransactionCreate
+from benchmarks.common import logger, measure, seed_catalog, setup_logging
+
+BASKET_SIZES = [1, 10, 50, 200]
+BASKETS_PER_SIZE = 50
+
+
+def run() -> None:
+    seeded = seed_catalog(max(BASKET_SIZES))
+    cashier_id = seeded["cashier"][0]
+    product_ids = seeded["products"]
+
+    for size in BASKET_SIZES:
+        basket = TransactionCreate(
+            cashier_id=cashier_id,
+            payment_method="cash",
+            items=[{"product_id": product_id, "quantity": 1} for product_id in product_ids[:size]],
+        )
+
+        def run_baskets() -> None:
+            for _ in range(BASKETS_PER_SIZE):
+                checkout(basket)
+
+        measure(f"checkout {size:>3} lines", BASKETS_PER_SIZE, run_baskets)
+    logger.info("checkout benchmark finished")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
@@ -0,0 +1,145 @@
+"""Sustained affiliate click ingestion: one UPDATE per click vs the write-behind click buffer.
+
+LANES threads click for DURATION seconds each, mostly on one hot link as a viral link would get them. The
+baseline increments affiliate_links.clicks per click; the buffered runs record into a ClickBuffer that a flusher
+thread drains every FLUSH_INTERVAL, or as soon as FLUSH_CLICKS are waiting, in each durability mode. Each run
+checks that the links gained exactly the clicks acknowledged.
+
+Run against a scratch database: `python -m benchmarks.click_benchmark`
+"""
+
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from sqlalchemy import create_engine, text
+from sqlmodel import Session
+
+from app.click_buffer import ClickBuffer, ClickDurability
+from app.database import DATABASE_URL, create_tables, get_session
+from app.models import AffiliateLink, AffiliateProfile, User, UserRole
+from benchmarks.common import logger, run_id, setup_logging
+
+LANES = 16
+LINKS = 10
+DURATION = 10.0
+FLUSH_INTERVAL = 0.5
+FLUSH_CLICKS = 10_000
+
+engine = create_engine(DATABASE_URL, pool_size=LANES, max_overflow=0)
+
+INCREMENT = text("UPDATE affiliate_links SET clicks = clicks + 1 WHERE id = :id")
+TOTAL_CLICKS = text("SELECT sum(clicks) FROM affiliate_links WHERE id = ANY(CAST(:ids AS integer[]))")
+
+
+def seed_links() -> List[int]:
+    create_tables()
+    tag = run_id()
+    with get_session() as session:
+        user = User(
+            username=f"bench-clicks-{tag}",
+            email=f"bench-clicks-{tag}@example.com",
+            password_hash="x",
+            full_name="Click Affiliate",
+            role=UserRole.AFFILIATE,
+        )
+        session.add(user)
+        session.flush()
+        profile = AffiliateProfile(user_id=user.id or 0, affiliate_code=f"BENCH-{tag}")
+        session.add(profile)
+        session.flush()
+        links = [
+            AffiliateLink(affiliate_profile_id=profile.id or 0, link_code=f"bench-{tag}-{i}") for i in range(LINKS)
+        ]
+        session.add_all(links)
+        session.commit()
+        return [link.id or 0 for link in links]
+
+
+def link_for(links: List[int], click: int) -> int:
+    # 3 of 4 clicks on the hot link
+    return links[0] if click % 4 else links[click % len(links)]
+
+
+def total_clicks(links: List[int]) -> int:
+    with get_session() as session:
+        return session.execute(TOTAL_CLICKS, {"ids": links}).scalar_one()
+
+
+def run_lanes(click) -> int:
+    deadline = time.perf_counter() + DURATION
+
+    def lane(_: int) -> int:
+        clicks = 0
+        while time.perf_counter() < deadline:
+            click(clicks)
+            clicks += 1
+        return clicks
+
+    with ThreadPoolExecutor(max_workers=LANES) as pool:
+        return sum(pool.map(lane, range(LANES)))
+
+
+def per_click_updates(links: List[int]) -> int:
+    def click(n: int) -> None:
+        with Session(engine) as session:
+            session.execute(INCREMENT, {"id": link_for(links, n)})
+            session.commit()
+
+    return run_lanes(click)
+
+
+def buffered(links: List[int], durability: ClickDurability) -> int:
+    with tempfile.TemporaryDirectory() as journal:
+        buffer = ClickBuffer(flush_clicks=FLUSH_CLICKS, durability=durability, journal_dir=journal)
+        due = threading.Event()
+        stopped = threading.Event()
+        flushes = 0
+
+        def flusher() -> None:
+            nonlocal flushes
+            while not stopped.is_set():
+                due.wait(FLUSH_INTERVAL)
+                due.clear()
+                buffer.flush()
+                flushes += 1
+
+        def click(n: int) -> None:
+            if buffer.record(link_for(links, n)):
+                due.set()
+
+        thread = threading.Thread(target=flusher)
+        thread.start()
+        clicks = run_lanes(click)
+        stopped.set()
+        thread.join()
+        buffer.close()
+    logger.info(f"  {flushes} flushes, {clicks / max(flushes, 1):,.0f} clicks per flush")
+    return clicks
+
+
+def run() -> None:
+    links = seed_links()
+    runs = [("one UPDATE per click", per_click_updates)] + [
+        (f"buffered, {durability.value}", lambda links, d=durability: buffered(links, d))
+        for durability in ClickDurability
+    ]
+    for label, clicker in runs:
+        before = total_clicks(links)
+        started = time.perf_counter()
+        clicks = clicker(links)
+        elapsed = time.perf_counter() - started
+        counted = total_clicks(links) - before
+        logger.info(
+            f"{label}: {clicks:,} clicks in {elapsed:.1f}s -> {clicks / elapsed:,.0f} clicks/s "
+            f"over {LANES} lanes; links gained {counted:,}"
+        )
+        if counted != clicks:
+            raise RuntimeError(f"{label}: acknowledged {clicks} clicks but the links gained {counted}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
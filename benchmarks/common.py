@@ -0,0 +1,68 @@
+import logging
+import time
+import uuid
+from decimal import Decimal
+from typing import Callable, Dict, List
+
+from app.database import create_tables, get_session
+from app.models import Category, Product, User, UserRole
+
+logger = logging.getLogger("benchmarks")
+
+
+def setup_logging() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logging.getLogger("sqlalchemy.engine.Engine").setLevel(logging.WARNING)
+
+
+def run_id() -> str:
+    return uuid.uuid4().hex[:8]
+
+
+def seed_catalog(product_count: int, stock_quantity: int = 1_000_000) -> Dict[str, List[int]]:
+    """Create a cashier, a category and `product_count` products tagged with a unique run id"""
+    create_tables()
+    tag = run_id()
+    with get_session() as session:
+        cashier = User(
+            username=f"bench-cashier-{tag}",
+            email=f"bench-{tag}@example.com",
+            password_hash="x",
+            full_name="Benchmark Cashier",
+            role=UserRole.CASHIER,
+        )
+        category = Category(name=f"bench-{tag}")
+        session.add_all([cashier, category])
+        session.commit()
+        session.refresh(cashier)
+        session.refresh(category)
+        cashier_id, category_id = cashier.id, category.id
+        if cashier_id is None or category_id is None:
+            raise RuntimeError("Seeding failed")
+
+        products = [
+            Product(
+                name=f"Bench product {i}",
+                sku=f"BENCH-{tag}-{i}",
+                barcode=f"{tag}{i:08d}",
+                category_id=category_id,
+                base_price=Decimal("1.99"),
+                cost_price=Decimal("0.99"),
+                stock_quantity=stock_quantity,
+            )
+            for i in range(product_count)
+        ]
+        session.add_all(products)
+        session.commit()
+        product_ids = [product.id for product in products if product.id is not None]
+    return {"cashier": [cashier_id], "category": [category_id], "products": product_ids}
+
+
+def measure(label: str, operations: int, func: Callable[[], None]) -> float:
+    """Run `func` once, log and return operations per second"""
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    rate = operations / elapsed if elapsed > 0 else float("inf")
+    logger.info(f"{label}: {operations} ops in {elapsed:.3f}s -> {rate:,.1f} ops/s")
+    return rate
@@ -0,0 +1,122 @@
+"""Per-query latency of execute_databricks_query: a client and warehouse lookup per query vs the shared client,
+a dashboard's queries run one after another vs concurrently through the async API, and peak memory of a
+large result read as one list vs streamed chunk by chunk, and dashboard refreshes with and without the
+result cache.
+
+Runs against the in-process fake workspace from tests/, with round trips simulated by sleeps, so it needs
+neither the SDK nor credentials: `python -m benchmarks.dbrx_client_benchmark`
+"""
+
+import asyncio
+import logging
+import time
+import tracemalloc
+
+from app.dbrx import DatabricksClient, fetch_concurrently
+from app.dbrx_cache import ResultCache
+from benchmarks.common import logger, setup_logging
+from tests.fake_databricks import FakeWorkspace
+
+QUERIES = 20
+QUERY = "SELECT sku, units FROM main.pos.sales"
+# seconds: client construction (config and auth), warehouses.list(), execute_statement()
+CONNECT_LATENCY = 0.15
+LIST_LATENCY = 0.08
+STATEMENT_LATENCY = 0.05
+# warehouse seconds per query of a dashboard that pulls several tables
+EXPORT_ROWS = 200_000
+EXPORT_CHUNK_ROWS = 10_000
+REFRESHES = 10
+REFRESH_TTL = 60.0
+DASHBOARD = {f"SELECT * FROM main.pos.panel_{panel}": seconds for panel, seconds in enumerate([0.8, 0.5, 0.5, 0.3])}
+
+
+def mean_latency_ms(label: str, workspace: FakeWorkspace, shared: bool) -> float:
+    databricks = DatabricksClient(workspace.client)
+    started = time.perf_counter()
+    for _ in range(QUERIES):
+        # a fresh client per query is what every query paid before the client was shared
+        (databricks if shared else DatabricksClient(workspace.client)).execute(QUERY)
+    latency = (time.perf_counter() - started) / QUERIES * 1000
+    logger.info(
+        f"{label}: {latency:.1f} ms per query ({workspace.clients} clients, {workspace.lists} warehouse lists, "
+        f"{len(workspace.statements)} statements)"
+    )
+    return latency
+
+
+async def dashboard_seconds(concurrent: bool) -> float:
+    workspace = FakeWorkspace(statement_latency=STATEMENT_LATENCY)
+    for query, seconds in DASHBOARD.items():
+        workspace.add_result(query, ["n"], [["1"]], seconds=seconds)
+    databricks = DatabricksClient(workspace.client, poll_initial=0.05, poll_max=0.2)
+    started = time.perf_counter()
+    if concurrent:
+        await fetch_concurrently(*(databricks.execute_async(query) for query in DASHBOARD))
+    else:
+        for query in DASHBOARD:
+            await asyncio.to_thread(databricks.execute, query)
+    elapsed = time.perf_counter() - started
+    label = "concurrent async" if concurrent else "one after another"
+    logger.info(f"dashboard of {len(DASHBOARD)} queries, {label}: {elapsed:.2f}s")
+    return elapsed
+
+
+def export_peak_mb(streamed: bool) -> float:
+    workspace = FakeWorkspace()
+    query = "SELECT sku, units, revenue FROM main.pos.sales"
+    rows = [[f"SKU-{n}", str(n % 50), f"{n % 997}.25"] for n in range(EXPORT_ROWS)]
+    workspace.add_result(query, ["sku", "units", "revenue"], rows, chunk_rows=EXPORT_CHUNK_ROWS)
+    databricks = DatabricksClient(workspace.client)
+    tracemalloc.start()
+    if streamed:
+        count = sum(1 for _ in databricks.stream_rows(query))
+    else:
+        count = len(databricks.execute(query))
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    label = "streamed typed rows" if streamed else "one list of dicts"
+    logger.info(f"export of {count:,} rows, {label}: peak {peak:.1f} MB")
+    return peak
+
+
+def refreshes_seconds(cached: bool) -> float:
+    workspace = FakeWorkspace(statement_latency=STATEMENT_LATENCY)
+    for query, seconds in DASHBOARD.items():
+        workspace.add_result(query, ["n"], [["1"]], seconds=seconds / 10)
+    databricks, cache = DatabricksClient(workspace.client), ResultCache(directory=None)
+    started = time.perf_counter()
+    for _ in range(REFRESHES):
+        for query in DASHBOARD:
+            cache.get(query, REFRESH_TTL if cached else 0, lambda: databricks.execute(query))
+    elapsed = time.perf_counter() - started
+    label = f"cached for {REFRESH_TTL:.0f}s" if cached else "uncached"
+    logger.info(
+        f"{REFRESHES} dashboard refreshes, {label}: {elapsed / REFRESHES * 1000:.0f} ms per refresh, "
+        f"{len(workspace.statements)} warehouse statements"
+    )
+    return elapsed
+
+
+def run() -> None:
+    logging.getLogger("app.dbrx").setLevel(logging.WARNING)
+    results = {}
+    for label, shared in (("client per query", False), ("shared client", True)):
+        workspace = FakeWorkspace(
+            connect_latency=CONNECT_LATENCY, list_latency=LIST_LATENCY, statement_latency=STATEMENT_LATENCY
+        )
+        workspace.add_result(QUERY, ["sku", "units"], [["COLA", "3"]])
+        results[label] = mean_latency_ms(label, workspace, shared)
+    logger.info(f"speedup: {results['client per query'] / results['shared client']:.1f}x")
+    logger.info(f"slowest dashboard query: {max(DASHBOARD.values()):.2f}s, sum: {sum(DASHBOARD.values()):.2f}s")
+    for concurrent in (False, True):
+        asyncio.run(dashboard_seconds(concurrent))
+    for streamed in (False, True):
+        export_peak_mb(streamed)
+    for cached in (False, True):
+        refreshes_seconds(cached)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
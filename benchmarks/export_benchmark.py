@@ -0,0 +1,82 @@
+"""A month of line items exported as CSV and Parquet through the streaming export vs loaded as ORM objects.
+
+Seeds ITEMS one-item transactions into a month far in the future, then times each way of reading them and,
+in a second pass under tracemalloc, records its peak Python memory.
+Run against a scratch database: `python -m benchmarks.export_benchmark`
+"""
+
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from sqlmodel import col, select
+
+from app.database import TimeoutClass, get_read_session, get_session
+from app.models import TransactionItem
+from app.transaction_export import export_rows
+from benchmarks.common import logger, run_id, seed_catalog, setup_logging
+from benchmarks.sales_rollup_benchmark import SEED_MONTH
+
+ITEMS = 500_000
+
+
+def timed(read: Callable[[], int]) -> float:
+    started = time.perf_counter()
+    read()
+    return time.perf_counter() - started
+
+
+def peak_mb(read: Callable[[], int]) -> float:
+    tracemalloc.start()
+    try:
+        read()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def run() -> None:
+    catalog = seed_catalog(100)
+    start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0) + timedelta(days=400)
+    end = start + timedelta(days=30)
+    with get_session(TimeoutClass.BATCH) as session:
+        session.execute(
+            SEED_MONTH,
+            {
+                "tag": f"export-{run_id()}",
+                "cashiers": catalog["cashier"],
+                "products": catalog["products"],
+                "count": ITEMS,
+                "start": start,
+            },
+        )
+        session.commit()
+
+    def orm_objects() -> int:
+        query = select(TransactionItem).where(
+            col(TransactionItem.created_at) >= start, col(TransactionItem.created_at) < end
+        )
+        with get_read_session(TimeoutClass.REPORTING) as session:
+            items: List[TransactionItem] = list(session.exec(query).all())
+            return len(items)
+
+    def export(file_format: str) -> Callable[[], int]:
+        return lambda: sum(len(chunk) for chunk in export_rows("items", file_format, start, end))
+
+    for label, read in [
+        ("ORM objects", orm_objects),
+        ("CSV export", export("csv")),
+        ("Parquet export", export("parquet")),
+    ]:
+        seconds = timed(read)
+        logger.info(
+            f"{label}: {ITEMS:,} items in {seconds:.1f}s -> {ITEMS / seconds:,.0f} rows/s, "
+            f"peak Python memory {peak_mb(read):,.1f} MB"
+        )
+    logger.info(f"export sizes: CSV {export('csv')() / 1e6:.1f} MB, Parquet {export('parquet')() / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
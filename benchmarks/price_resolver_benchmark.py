@@ -0,0 +1,101 @@
+"""100-line reseller baskets priced per line from the database vs from the in-memory price matrix.
+
+Run against a scratch database: `python -m benchmarks.price_resolver_benchmark`
+"""
+
+import random
+import time
+from decimal import Decimal
+from typing import List, Optional
+
+from sqlmodel import Session, col, select
+
+from app.database import bulk_insert, get_session
+from app.models import Product, ProductResellerPrice, ResellerProfile, User, UserRole
+from app.price_resolver import price_resolver
+from benchmarks.common import logger, measure, run_id, seed_catalog, setup_logging
+
+PRODUCT_COUNT = 10_000
+BASKETS = 200
+BASKET_LINES = 100
+RESELLER_LEVEL = 3
+
+
+def seed(product_ids: List[int]) -> int:
+    """A level-3 reseller, level prices on half the catalog and personal overrides on a tenth"""
+    tag = run_id()
+    with get_session() as session:
+        user = User(
+            username=f"bench-pricing-{tag}",
+            email=f"bench-pricing-{tag}@example.com",
+            password_hash="x",
+            full_name="Pricing Reseller",
+            role=UserRole.RESELLER,
+        )
+        session.add(user)
+        session.flush()
+        profile = ResellerProfile(user_id=user.id or 0, level=RESELLER_LEVEL, referral_code=f"P{tag}")
+        session.add(profile)
+        session.flush()
+        rows = [
+            {"product_id": product_id, "reseller_profile_id": None, "reseller_level": level, "price": Decimal("1.50")}
+            for product_id in product_ids[::2]
+            for level in range(1, 11)
+        ] + [
+            {
+                "product_id": product_id,
+                "reseller_profile_id": profile.id,
+                "reseller_level": None,
+                "price": Decimal("1.25"),
+            }
+            for product_id in product_ids[::10]
+        ]
+        bulk_insert(session, ProductResellerPrice, rows)
+        session.commit()
+        return user.id or 0
+
+
+def price_per_line(session: Session, product_id: int, profile: ResellerProfile) -> Optional[Decimal]:
+    """The pre-resolver lookup: reseller override, then level price, then base price"""
+    for condition in (
+        ProductResellerPrice.reseller_profile_id == profile.id,
+        ProductResellerPrice.reseller_level == profile.level,
+    ):
+        price = session.exec(
+            select(ProductResellerPrice.price)
+            .where(ProductResellerPrice.product_id == product_id, condition, col(ProductResellerPrice.is_active))
+            .order_by(col(ProductResellerPrice.id).desc())
+        ).first()
+        if price is not None:
+            return price
+    product = session.get(Product, product_id)
+    return product.base_price if product is not None else None
+
+
+def run() -> None:
+    product_ids = seed_catalog(PRODUCT_COUNT)["products"]
+    reseller_user_id = seed(product_ids)
+    rng = random.Random(3)
+    baskets = [rng.sample(product_ids, BASKET_LINES) for _ in range(BASKETS)]
+
+    def per_line_queries() -> None:
+        with get_session() as session:
+            profile = session.exec(select(ResellerProfile).where(ResellerProfile.user_id == reseller_user_id)).one()
+            for basket in baskets:
+                for product_id in basket:
+                    price_per_line(session, product_id, profile)
+
+    def resolver() -> None:
+        for basket in baskets:
+            price_resolver.resolve(basket, reseller_user_id)
+
+    measure("100-line basket, per-line queries", BASKETS, per_line_queries)
+    started = time.perf_counter()
+    price_resolver.load()
+    logger.info(f"price matrix load: {time.perf_counter() - started:.3f}s")
+    measure("100-line basket, warm price matrix", BASKETS, resolver)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
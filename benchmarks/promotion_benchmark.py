@@ -0,0 +1,160 @@
+"""Promotion evaluation with 10k simultaneously running promotions: indexed engine vs scanning every promotion.
+
+Run against a scratch database: `python -m benchmarks.promotion_benchmark`
+"""
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Set
+
+from sqlalchemy import insert, text
+from sqlmodel import col, select
+
+from app.checkout_service import checkout
+from app.database import bulk_insert, get_session
+from app.models import Promotion, PromotionProduct, PromotionType, TransactionCreate
+from app.promotion_engine import Basket, BasketLine, PromotionRule, promotion_engine
+from benchmarks.common import logger, measure, run_id, seed_catalog, setup_logging
+
+PRODUCT_COUNT = 10_000
+PROMOTION_COUNT = 10_000
+BASKET_WIDE = 100
+BASKETS = 1_000
+SCAN_BASKETS = 50
+BASKET_LINES = 20
+CHECKOUT_WORKERS = 16
+CHECKOUTS_PER_WORKER = 25
+
+
+def seed_promotions(product_ids: List[int]) -> List[int]:
+    tag = run_id()
+    rng = random.Random(11)
+    now = datetime.utcnow()
+    types = list(PromotionType)
+    with get_session() as session:
+        promotion_ids = list(
+            session.scalars(
+                insert(Promotion.__table__).returning(  # type: ignore[attr-defined]
+                    Promotion.__table__.c.id,  # type: ignore[attr-defined]
+                    sort_by_parameter_order=True,
+                ),
+                [
+                    {
+                        "name": f"bench-{tag}-{i}",
+                        "promotion_type": types[i % len(types)],
+                        "discount_value": Decimal("2")
+                        if types[i % len(types)] == PromotionType.BUY_X_GET_Y
+                        else Decimal("5"),
+                        "max_discount_amount": Decimal("3.00"),
+                        "start_date": now - timedelta(hours=rng.randint(1, 1000)),
+                        "end_date": now + timedelta(hours=rng.randint(1, 1000)),
+                        "usage_limit": 50 if i % 10 == 0 else None,
+                        # basket-wide promotions but the first are staff-only so the role filter does real work
+                        "applicable_roles": ["admin"] if 0 < i < BASKET_WIDE else [],
+                    }
+                    for i in range(PROMOTION_COUNT)
+                ],
+            )
+        )
+        bulk_insert(
+            session,
+            PromotionProduct,
+            [
+                {"promotion_id": promotion_id, "product_id": product_id}
+                for promotion_id in promotion_ids[BASKET_WIDE:]
+                for product_id in rng.sample(product_ids, rng.randint(1, 5))
+            ],
+        )
+        session.commit()
+        session.execute(text("ANALYZE promotions"))
+        session.execute(text("ANALYZE promotion_products"))
+        session.commit()
+    return promotion_ids
+
+
+def scan_all(rules: List[PromotionRule], lines: List[BasketLine], role: str, now: datetime) -> None:
+    """The naive evaluator: test every promotion against the basket"""
+    basket = Basket(lines)
+    for rule in rules:
+        if not (rule.start <= now < rule.end) or (rule.roles and role not in rule.roles):
+            continue
+        if rule.product_ids and not rule.product_ids & basket.by_product.keys():
+            continue
+        rule.discount(basket)
+
+
+def run() -> None:
+    catalog = seed_catalog(PRODUCT_COUNT)
+    product_ids = catalog["products"]
+    promotion_ids = seed_promotions(product_ids)
+    rng = random.Random(5)
+    baskets = [
+        [
+            BasketLine(product_id, rng.randint(1, 4), Decimal("1.99"))
+            for product_id in rng.sample(product_ids, BASKET_LINES)
+        ]
+        for _ in range(BASKETS)
+    ]
+
+    started = time.perf_counter()
+    promotion_engine.load()
+    logger.info(f"indexed {len(promotion_engine)} promotions in {time.perf_counter() - started:.2f}s")
+    now = datetime.utcnow()
+
+    with get_session() as session:
+        links: Dict[int, Set[int]] = {}
+        for link in session.exec(
+            select(PromotionProduct).where(col(PromotionProduct.promotion_id).in_(promotion_ids))
+        ).all():
+            links.setdefault(link.promotion_id, set()).add(link.product_id)
+        scan_rules = [
+            PromotionRule(promotion, frozenset(links.get(promotion.id or 0, ())))
+            for promotion in session.exec(select(Promotion).where(col(Promotion.id).in_(promotion_ids))).all()
+        ]
+
+    def scan() -> None:
+        for lines in baskets[:SCAN_BASKETS]:
+            scan_all(scan_rules, lines, "consumer", now)
+
+    def indexed() -> None:
+        for lines in baskets:
+            promotion_engine.evaluate(lines, "consumer", now)
+
+    measure(f"{BASKET_LINES}-line basket, scan all promotions", SCAN_BASKETS, scan)
+    measure(f"{BASKET_LINES}-line basket, indexed engine", BASKETS, indexed)
+
+    limited = promotion_ids[0]
+
+    def lane(worker: int) -> None:
+        lane_rng = random.Random(worker)
+        for _ in range(CHECKOUTS_PER_WORKER):
+            checkout(
+                TransactionCreate(
+                    cashier_id=catalog["cashier"][0],
+                    payment_method="cash",
+                    items=[{"product_id": pid, "quantity": 1} for pid in lane_rng.sample(product_ids, BASKET_LINES)],
+                ),
+                apply_promotions=True,
+            )
+
+    def concurrent_checkouts() -> None:
+        with ThreadPoolExecutor(max_workers=CHECKOUT_WORKERS) as pool:
+            list(pool.map(lane, range(CHECKOUT_WORKERS)))
+
+    measure(
+        f"checkout with promotions, {CHECKOUT_WORKERS} lanes",
+        CHECKOUT_WORKERS * CHECKOUTS_PER_WORKER,
+        concurrent_checkouts,
+    )
+    with get_session() as session:
+        promotion = session.get(Promotion, limited)
+        if promotion is not None:
+            logger.info(f"basket-wide promotion with usage_limit {promotion.usage_limit}: used {promotion.usage_count}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
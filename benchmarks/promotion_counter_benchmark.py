@@ -0,0 +1,96 @@
+"""Claims on one hot usage-limited promotion: a single counter row vs 32 counter shards, at 1, 8 and 64 lanes.
+
+Each claim stays in a transaction for HOLD seconds afterwards, standing in for the rest of a checkout,
+so the lock on the counter row is held as long as it would be in production.
+
+Run against a scratch database: `python -m benchmarks.promotion_counter_benchmark`
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+from sqlalchemy import create_engine, text
+from sqlmodel import Session
+
+from app.database import DATABASE_URL, create_tables, get_session
+from app.models import Promotion, PromotionType
+from app.promotion_counters import claim_uses, create_counters, usage_counts
+from benchmarks.common import logger, measure, run_id, setup_logging
+
+LANES = [1, 8, 64]
+CLAIMS_PER_LANE = 20
+HOLD = 0.005
+SHARDS = 32
+
+# one connection per lane; generous timeout so the single-row baseline queues instead of failing
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=max(LANES),
+    max_overflow=0,
+    connect_args={"connect_timeout": 15, "options": "-c statement_timeout=60000"},
+)
+
+
+def seed_promotion(usage_limit: int, shards: int) -> int:
+    now = datetime.utcnow()
+    with get_session() as session:
+        promotion = Promotion(
+            name=f"bench-counter-{run_id()}",
+            promotion_type=PromotionType.FIXED_AMOUNT,
+            discount_value=Decimal("1.00"),
+            start_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=1),
+            usage_limit=usage_limit,
+        )
+        session.add(promotion)
+        session.flush()
+        if promotion.id is None:
+            raise RuntimeError("Seeding failed")
+        create_counters(session, [promotion.id], shards)
+        session.commit()
+        return promotion.id
+
+
+def run_lanes(promotion_id: int, lanes: int) -> List[int]:
+    def lane(_: int) -> int:
+        claimed = 0
+        for _ in range(CLAIMS_PER_LANE):
+            with Session(engine) as session:
+                uses, _exhausted = claim_uses(session, [promotion_id], datetime.utcnow())
+                time.sleep(HOLD)
+                session.commit()
+                claimed += len(uses)
+        return claimed
+
+    with ThreadPoolExecutor(max_workers=lanes) as pool:
+        return list(pool.map(lane, range(lanes)))
+
+
+def run() -> None:
+    create_tables()
+    with engine.connect() as connection:
+        logger.info(f"max_connections: {connection.execute(text('SHOW max_connections')).scalar()}")
+
+    for lanes in LANES:
+        claims = lanes * CLAIMS_PER_LANE
+        for shards in (1, SHARDS):
+            # the limit sits just under the demand so the last claims race for the final uses
+            usage_limit = claims - lanes
+            promotion_id = seed_promotion(usage_limit, shards)
+            claimed: List[int] = []
+            measure(
+                f"{lanes} lanes, {shards} counter shard(s)",
+                claims,
+                lambda: claimed.extend(run_lanes(promotion_id, lanes)),
+            )
+            with get_session() as session:
+                used = usage_counts(session, [promotion_id])[promotion_id]
+            logger.info(f"  usage_limit {usage_limit}: claimed {sum(claimed)}, recorded {used}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
@@ -0,0 +1,125 @@
+"""Upline lookups on a synthetic 100k-reseller tree: closure table vs lazy parent walk vs recursive CTE.
+
+Run against a scratch database: `python -m benchmarks.reseller_hierarchy_benchmark`
+"""
+
+import random
+import time
+from decimal import Decimal
+from typing import List
+
+from sqlalchemy import insert, text
+from sqlmodel import select
+
+from app.database import TimeoutClass, create_tables, get_session
+from app.models import ResellerProfile, User, UserRole
+from app.reseller_service import MAX_HIERARCHY_DEPTH, check_closure_consistency, get_reseller_upline, rebuild_closure
+from benchmarks.common import logger, measure, run_id, setup_logging
+
+RESELLER_COUNT = 100_000
+LOOKUPS = 2_000
+
+RECURSIVE_UPLINE = text(
+    """
+    WITH RECURSIVE upline AS (
+        SELECT id, user_id, parent_reseller_id, commission_rate, 1 AS depth
+        FROM reseller_profiles WHERE user_id = :user_id
+        UNION ALL
+        SELECT p.id, p.user_id, p.parent_reseller_id, p.commission_rate, u.depth + 1
+        FROM reseller_profiles p JOIN upline u ON p.id = u.parent_reseller_id
+    )
+    SELECT * FROM upline ORDER BY depth
+    """
+)
+
+
+def seed_tree(count: int) -> List[int]:
+    """Insert `count` resellers level by level, each attached to a random node one level up"""
+    tag = run_id()
+    rng = random.Random(42)
+    with get_session(TimeoutClass.BATCH) as session:
+        user_ids = list(
+            session.scalars(
+                insert(User.__table__).returning(User.__table__.c.id, sort_by_parameter_order=True),  # type: ignore[attr-defined]
+                [
+                    {
+                        "username": f"bench-reseller-{tag}-{i}",
+                        "email": f"bench-reseller-{tag}-{i}@example.com",
+                        "password_hash": "x",
+                        "full_name": f"Reseller {i}",
+                        "role": UserRole.RESELLER,
+                    }
+                    for i in range(count)
+                ],
+            )
+        )
+
+        per_level = count // MAX_HIERARCHY_DEPTH
+        previous_level: List[int] = []
+        for level in range(1, MAX_HIERARCHY_DEPTH + 1):
+            chunk = user_ids[(level - 1) * per_level : level * per_level if level < MAX_HIERARCHY_DEPTH else count]
+            previous_level = list(
+                session.scalars(
+                    insert(ResellerProfile.__table__).returning(  # type: ignore[attr-defined]
+                        ResellerProfile.__table__.c.id,  # type: ignore[attr-defined]
+                        sort_by_parameter_order=True,
+                    ),
+                    [
+                        {
+                            "user_id": user_id,
+                            "level": level,
+                            "parent_reseller_id": rng.choice(previous_level) if previous_level else None,
+                            "referral_code": f"B{tag}{user_id}",
+                            "commission_rate": Decimal("0.0100"),
+                        }
+                        for user_id in chunk
+                    ],
+                )
+            )
+        session.commit()
+    return user_ids
+
+
+def run() -> None:
+    create_tables()
+    started = time.perf_counter()
+    user_ids = seed_tree(RESELLER_COUNT)
+    logger.info(f"seeded {RESELLER_COUNT} resellers in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    rows = rebuild_closure()
+    logger.info(f"rebuilt closure ({rows} rows) in {time.perf_counter() - started:.1f}s")
+
+    # deepest resellers exercise the full 10-level upline
+    sample = random.Random(7).sample(user_ids[-RESELLER_COUNT // MAX_HIERARCHY_DEPTH :], LOOKUPS)
+
+    def closure_lookups() -> None:
+        with get_session() as session:
+            for user_id in sample:
+                get_reseller_upline(session, user_id)
+
+    def lazy_walk_lookups() -> None:
+        with get_session() as session:
+            for user_id in sample:
+                profile = session.exec(select(ResellerProfile).where(ResellerProfile.user_id == user_id)).first()
+                while profile is not None:
+                    profile = profile.parent_reseller
+                session.expunge_all()
+
+    def recursive_cte_lookups() -> None:
+        with get_session() as session:
+            for user_id in sample:
+                session.execute(RECURSIVE_UPLINE, {"user_id": user_id}).all()
+
+    measure("upline via closure table", LOOKUPS, closure_lookups)
+    measure("upline via lazy parent walk", LOOKUPS, lazy_walk_lookups)
+    measure("upline via recursive CTE", LOOKUPS, recursive_cte_lookups)
+
+    started = time.perf_counter()
+    report = check_closure_consistency()
+    logger.info(f"consistency check {report} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
@@ -0,0 +1,126 @@
+"""Dashboard reads from the sales rollups vs aggregating the raw transactions, as history grows.
+
+Each round adds a month of sales (one line item each, spread over the cashiers, the products and the month's
+hours), applies the queued events, then times the 30-day per-cashier daily totals both ways.
+Run against a scratch database: `python -m benchmarks.sales_rollup_benchmark`
+"""
+
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import text
+
+from app.database import TimeoutClass, get_session
+from app.models import CashierSalesRollup, User, UserRole
+from app.sales_rollups import apply_sales_events, sales_rollups
+from benchmarks.common import logger, run_id, seed_catalog, setup_logging
+
+CASHIERS = 20
+PRODUCTS = 200
+TRANSACTIONS_PER_MONTH = 200_000
+MONTHS = 4
+READS = 20
+
+SEED_MONTH = text(
+    """
+    WITH sold AS (
+        INSERT INTO transactions
+            (transaction_number, cashier_id, transaction_type, status, subtotal, discount_amount, tax_amount,
+             total_amount, payment_method, created_at, completed_at)
+        SELECT :tag || '-' || g, (:cashiers)[1 + g % cardinality(:cashiers)], 'POS', 'COMPLETED', 1.99, 0, 0.10,
+               2.09, 'cash', s.at, s.at
+        FROM generate_series(1, :count) AS g,
+             LATERAL (SELECT CAST(:start AS timestamp) + (g % (30 * 24)) * interval '1 hour' AS at) AS s
+        RETURNING id, created_at
+    )
+    INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, discount_amount, total_price,
+                                   created_at)
+    SELECT id, (:products)[1 + id % cardinality(:products)], 1, 1.99, 0, 1.99, created_at FROM sold
+    """
+)
+
+RAW_DAILY_TOTALS = text(
+    """
+    SELECT date_trunc('day', coalesce(completed_at, created_at)) AS day, cashier_id, count(*), sum(total_amount)
+    FROM transactions
+    WHERE status IN ('COMPLETED', 'REFUNDED') AND coalesce(completed_at, created_at) >= :start
+      AND coalesce(completed_at, created_at) < :end
+    GROUP BY 1, 2
+    """
+)
+
+
+def seed_cashiers(tag: str) -> List[int]:
+    with get_session() as session:
+        cashiers = [
+            User(
+                username=f"bench-rollup-{tag}-{i}",
+                email=f"bench-rollup-{tag}-{i}@example.com",
+                password_hash="x",
+                full_name="Rollup Cashier",
+                role=UserRole.CASHIER,
+            )
+            for i in range(CASHIERS)
+        ]
+        session.add_all(cashiers)
+        session.commit()
+        return [cashier.id for cashier in cashiers if cashier.id is not None]
+
+
+def timed_reads(read) -> float:
+    started = time.perf_counter()
+    for _ in range(READS):
+        read()
+    return (time.perf_counter() - started) / READS * 1000
+
+
+def run() -> None:
+    tag = run_id()
+    products = seed_catalog(PRODUCTS)["products"]
+    cashiers = seed_cashiers(tag)
+    apply_sales_events()
+    first_month = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=365)
+
+    for month in range(MONTHS):
+        start = first_month + timedelta(days=30 * month)
+        with get_session(TimeoutClass.BATCH) as session:
+            seeding = time.perf_counter()
+            session.execute(
+                SEED_MONTH,
+                {
+                    "tag": f"{tag}-{month}",
+                    "cashiers": cashiers,
+                    "products": products,
+                    "count": TRANSACTIONS_PER_MONTH,
+                    "start": start,
+                },
+            )
+            session.commit()
+            seeded = time.perf_counter() - seeding
+            session.execute(text("ANALYZE transactions"))
+            session.commit()
+        applying = time.perf_counter()
+        applied = apply_sales_events()
+        applied_seconds = time.perf_counter() - applying
+
+        end = start + timedelta(days=30)
+
+        def raw() -> None:
+            with get_session(TimeoutClass.REPORTING) as session:
+                session.execute(RAW_DAILY_TOTALS, {"start": start, "end": end}).all()
+
+        def rolled_up() -> None:
+            sales_rollups(CashierSalesRollup, "day", start, end)
+
+        history = TRANSACTIONS_PER_MONTH * (month + 1)
+        logger.info(
+            f"{history:,} transactions: seeded a month in {seeded:.1f}s (trigger included), "
+            f"applied {applied:,} events at {applied / applied_seconds:,.0f}/s; 30-day cashier dashboard "
+            f"raw {timed_reads(raw):.1f} ms, rollups {timed_reads(rolled_up):.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
@@ -0,0 +1,119 @@
+"""Batch commission settlement vs the per-transaction Decimal loop used at checkout.
+
+Run against a scratch database: `python -m benchmarks.settlement_benchmark`
+"""
+
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import text
+from sqlmodel import select
+
+from app.checkout_service import _commission_rows
+from app.database import TimeoutClass, bulk_insert, get_session
+from app.models import AffiliateProfile, Commission, Transaction, TransactionCreate, User, UserRole
+from app.reseller_service import rebuild_closure
+from app.settlement_service import settle_commissions
+from benchmarks.common import logger, measure, run_id, setup_logging
+from benchmarks.reseller_hierarchy_benchmark import seed_tree
+
+RESELLER_COUNT = 10_000
+TRANSACTION_COUNT = 500_000
+LOOP_SAMPLE = 2_000
+
+SEED_TRANSACTIONS = text(
+    """
+    INSERT INTO transactions
+        (transaction_number, cashier_id, reseller_id, affiliate_id, transaction_type, status, subtotal,
+         discount_amount, tax_amount, total_amount, payment_method, created_at, completed_at)
+    SELECT :tag || '-' || g, :cashier, (:sellers)[1 + g % cardinality(:sellers)],
+           CASE WHEN g % 3 = 0 THEN :affiliate END, 'POS', 'COMPLETED', s.subtotal, 0, 0, s.subtotal, 'cash',
+           :completed_at, :completed_at
+    FROM generate_series(1, :count) AS g,
+         LATERAL (SELECT round((1 + (g::bigint * 7919) % 50000) / 100.0, 2) AS subtotal) AS s
+    """
+)
+
+
+def seed(window_start: datetime) -> None:
+    tag = run_id()
+    seller_ids = seed_tree(RESELLER_COUNT)
+    rebuild_closure()
+    with get_session(TimeoutClass.BATCH) as session:
+        cashier = User(
+            username=f"bench-settle-{tag}",
+            email=f"bench-settle-{tag}@example.com",
+            password_hash="x",
+            full_name="Settlement Cashier",
+            role=UserRole.CASHIER,
+        )
+        affiliate = User(
+            username=f"bench-aff-{tag}",
+            email=f"bench-aff-{tag}@example.com",
+            password_hash="x",
+            full_name="Settlement Affiliate",
+            role=UserRole.AFFILIATE,
+        )
+        session.add_all([cashier, affiliate])
+        session.flush()
+        session.add(AffiliateProfile(user_id=affiliate.id, affiliate_code=f"A{tag}", commission_rate=Decimal("0.0375")))
+        session.execute(
+            SEED_TRANSACTIONS,
+            {
+                "tag": tag,
+                "cashier": cashier.id,
+                "sellers": seller_ids,
+                "affiliate": affiliate.id,
+                "count": TRANSACTION_COUNT,
+                "completed_at": window_start + timedelta(minutes=1),
+            },
+        )
+        session.commit()
+        session.execute(text("ANALYZE transactions"))
+        session.commit()
+
+
+def run() -> None:
+    window_start = datetime.utcnow() + timedelta(days=365)
+    window_end = window_start + timedelta(days=1)
+    started = time.perf_counter()
+    seed(window_start)
+    logger.info(f"seeded {TRANSACTION_COUNT} transactions in {time.perf_counter() - started:.1f}s")
+
+    def decimal_loop() -> None:
+        # the checkout path, one transaction at a time; rolled back so settlement still sees every row
+        with get_session() as session:
+            transactions = session.exec(
+                select(Transaction)
+                .where(Transaction.completed_at >= window_start, Transaction.completed_at < window_end)
+                .limit(LOOP_SAMPLE)
+            ).all()
+            now = datetime.utcnow()
+            for transaction in transactions:
+                data = TransactionCreate(
+                    cashier_id=transaction.cashier_id,
+                    reseller_id=transaction.reseller_id,
+                    affiliate_id=transaction.affiliate_id,
+                    payment_method="cash",
+                    items=[],
+                )
+                if transaction.id is not None:
+                    base_amount = transaction.subtotal - transaction.discount_amount
+                    bulk_insert(session, Commission, _commission_rows(session, data, transaction.id, base_amount, now))
+            session.rollback()
+
+    loop_rate = measure("per-transaction Decimal loop", LOOP_SAMPLE, decimal_loop)
+
+    report = settle_commissions(window_start, window_end)
+    batch_rate = report.transactions / report.elapsed_seconds
+    logger.info(
+        f"batch settlement: {report.transactions} transactions, {report.commissions} commissions in "
+        f"{report.elapsed_seconds:.2f}s -> {batch_rate:,.1f} ops/s ({batch_rate / loop_rate:.1f}x), "
+        f"db mismatches {report.db_mismatches}, decimal mismatches {report.decimal_mismatches}"
+    )
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
@@ -0,0 +1,92 @@
+"""Cold start: where import time goes, and seconds from `python main.py` to the first healthy /health.
+
+The autoscaler starts containers under load, so this is time during which sessions can be dropped.
+Run against a scratch database: `python -m benchmarks.startup_benchmark`
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Tuple
+
+from benchmarks.common import logger, setup_logging
+
+# what main.py loads before the server binds, and the app modules its startup hook imports
+IMPORTS = ["main:server", "app.startup"]
+TOP_PACKAGES = 15
+RUNS = 3
+TARGET_SECONDS = float(os.environ.get("APP_STARTUP_TARGET_SECONDS", "3"))
+HEALTH_TIMEOUT = 60.0
+
+
+def import_profile(module: str) -> List[Tuple[str, float]]:
+    """Import milliseconds per third-party package and per app module, from `python -X importtime`"""
+    statement = "import nicegui, fastapi, starlette" if module == "main:server" else f"import {module}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, check=True
+    )
+    totals: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, _, name = line.removeprefix("import time:").split("|")
+        # self times add up without double counting; our own modules are listed one by one
+        name = name.strip()
+        key = name if name.startswith("app.") else name.split(".")[0]
+        totals[key] = totals.get(key, 0.0) + int(own) / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def time_to_health() -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "main.py"],
+        env={**os.environ, "NICEGUI_PORT": str(port)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < HEALTH_TIMEOUT:
+            if server.poll() is not None:
+                raise RuntimeError(f"main.py exited with {server.returncode} before /health answered")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"/health did not answer within {HEALTH_TIMEOUT}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run() -> None:
+    for module in IMPORTS:
+        profile = import_profile(module)
+        logger.info(f"{module}: {sum(ms for _, ms in profile):,.0f} ms of imports")
+        for package, ms in profile[:TOP_PACKAGES]:
+            logger.info(f"  {package:<24} {ms:>8,.1f} ms")
+
+    seconds = sorted(time_to_health() for _ in range(RUNS))
+    median = seconds[len(seconds) // 2]
+    verdict = "within" if median <= TARGET_SECONDS else "OVER"
+    logger.info(
+        f"first /health after {median:.2f}s (median of {RUNS}, runs {', '.join(f'{s:.2f}' for s in seconds)}), "
+        f"{verdict} the {TARGET_SECONDS:.1f}s target"
+    )
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
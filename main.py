@@ -1,8 +1,13 @@
 import logging
 import os
+from datetime import datetime
+from typing import Optional
+from app.click_buffer import click_buffer, track_click
+from app.database import database_stats
+from app.transaction_export import export_response
 from app.startup import startup
 from nicegui import app, ui
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
@@ -26,10 +31,32 @@ async def health():
     return {"status": "healthy", "service": "nicegui-app"}
 
 
+@app.get("/health/stats")
+async def health_stats():
+    return database_stats()
+
+
+@app.get("/go/{link_code}")
+async def affiliate_click(link_code: str):
+    return await track_click(link_code)
+
+
+@app.get("/exports/{dataset}")
+async def export(
+    dataset: str,
+    start: datetime,
+    end: datetime,
+    file_format: str = Query("csv", alias="format"),
+    authorization: Optional[str] = Header(None),
+):
+    return export_response(dataset, file_format, start, end, authorization)
+
+
 # suppress sqlalchemy engine logs below warning level
 logging.getLogger("sqlalchemy.engine.Engine").setLevel(logging.WARNING)
 
 app.on_startup(startup)
+app.on_shutdown(click_buffer.close)
 
 # Add security headers middleware
 app.add_middleware(SecurityHeadersMiddleware)
@@ -1,5 +1,22 @@
-from typing import Generator
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Generator
 import pytest
+from app.database import get_session, reset_db
+from app.migrations import upgrade
+from app.models import (
+    AffiliateProfile,
+    Category,
+    Product,
+    Promotion,
+    PromotionType,
+    ResellerProfileCreate,
+    User as AppUser,
+    UserRole,
+)
+from app.price_resolver import price_resolver
+from app.promotion_engine import promotion_engine
+from app.reseller_service import create_reseller_profile
 from app.startup import startup
 from nicegui.testing import User
 
@@ -8,5 +25,92 @@ pytest_plugins = ["nicegui.testing.plugin"]
 
 @pytest.fixture
 def user(user: User) -> Generator[User, None, None]:
+    # as a deploy does: migrate first, then start
+    upgrade()
     startup()
     yield user
+
+
+@pytest.fixture()
+def clean_db() -> Generator[None, None, None]:
+    """Reset database for each test"""
+    reset_db()
+    price_resolver.clear()
+    promotion_engine.clear()
+    yield
+    reset_db()
+    price_resolver.clear()
+    promotion_engine.clear()
+
+
+@pytest.fixture()
+def sample_data(clean_db) -> Dict[str, int]:
+    with get_session() as session:
+        users = {
+            name: AppUser(
+                username=name, email=f"{name}@example.com", password_hash="x", full_name=name.title(), role=role
+            )
+            for name, role in [
+                ("cashier", UserRole.CASHIER),
+                ("top", UserRole.RESELLER),
+                ("seller", UserRole.RESELLER),
+                ("affiliate", UserRole.AFFILIATE),
+            ]
+        }
+        session.add_all(users.values())
+        category = Category(name="Drinks")
+        session.add(category)
+        session.commit()
+        for user in users.values():
+            session.refresh(user)
+        session.refresh(category)
+
+        top = create_reseller_profile(
+            ResellerProfileCreate(user_id=users["top"].id or 0, level=1, commission_rate=Decimal("0.0200"))
+        )
+        create_reseller_profile(
+            ResellerProfileCreate(
+                user_id=users["seller"].id or 0,
+                level=2,
+                parent_reseller_id=top.id,
+                commission_rate=Decimal("0.0500"),
+            )
+        )
+        affiliate = AffiliateProfile(
+            user_id=users["affiliate"].id, affiliate_code="AFF", commission_rate=Decimal("0.0300")
+        )
+        cola = Product(
+            name="Cola",
+            sku="COLA",
+            barcode="111",
+            category_id=category.id,
+            base_price=Decimal("1.50"),
+            cost_price=Decimal("0.70"),
+            stock_quantity=10,
+        )
+        water = Product(
+            name="Water",
+            sku="WATER",
+            category_id=category.id,
+            base_price=Decimal("0.99"),
+            cost_price=Decimal("0.20"),
+            stock_quantity=5,
+        )
+        promotion = Promotion(
+            name="Two off",
+            promotion_type=PromotionType.FIXED_AMOUNT,
+            discount_value=Decimal("2.00"),
+            start_date=datetime.utcnow() - timedelta(days=1),
+            end_date=datetime.utcnow() + timedelta(days=1),
+        )
+        session.add_all([affiliate, cola, water, promotion])
+        session.commit()
+        return {
+            "cashier": users["cashier"].id or 0,
+            "top": users["top"].id or 0,
+            "seller": users["seller"].id or 0,
+            "affiliate": users["affiliate"].id or 0,
+            "cola": cola.id or 0,
+            "water": water.id or 0,
+            "promotion": promotion.id or 0,
+        }
@@ -0,0 +1,243 @@
+"""In-process stand-in for databricks.sdk.WorkspaceClient: the calls app.dbrx makes, with optional latency.
+
+Results are split into chunks of `chunk_rows` like the Statement Execution API does. EXTERNAL_LINKS results
+are Arrow IPC streams written to a temporary directory and linked with file:// URLs (needs pyarrow).
+"""
+
+import itertools
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Databricks column types the fake can serve as Arrow
+ARROW_TYPES = {
+    "STRING": "string",
+    "INT": "int32",
+    "LONG": "int64",
+    "DOUBLE": "float64",
+    "BOOLEAN": "bool",
+    "DATE": "date32",
+}
+
+
+class FakeResult:
+    def __init__(
+        self, columns: List[str], rows: List[List[Any]], seconds: float, types: Optional[List[str]], chunk_rows: int
+    ):
+        self.columns = columns
+        self.rows = rows
+        self.seconds = seconds
+        self.types = types or ["STRING"] * len(columns)
+        self.chunk_rows = chunk_rows
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-len(self.rows) // self.chunk_rows))
+
+    def chunk(self, index: int) -> List[List[Any]]:
+        return self.rows[index * self.chunk_rows : (index + 1) * self.chunk_rows]
+
+
+class Submitted:
+    def __init__(self, warehouse_id: str, statement: str, done_at: float, disposition: Any, format: Any):
+        self.warehouse_id = warehouse_id
+        self.statement = statement
+        self.done_at = done_at
+        self.external = getattr(disposition, "value", disposition) == "EXTERNAL_LINKS"
+        self.format = getattr(format, "value", format)
+
+
+def not_found(message: str) -> Exception:
+    """What the SDK raises for a missing resource, as app.dbrx expects it"""
+    try:
+        from databricks.sdk.errors import NotFound
+    except ImportError:
+        return LookupError(message)
+    return NotFound(message)
+
+
+class FakeWorkspace:
+    """Warehouses and query results shared by every client it builds; counts the calls they receive"""
+
+    def __init__(
+        self,
+        warehouses: Sequence[Tuple[str, str]] = (("wh-1", "RUNNING"),),
+        connect_latency: float = 0.0,
+        list_latency: float = 0.0,
+        statement_latency: float = 0.0,
+    ):
+        self.states: Dict[str, str] = dict(warehouses)
+        self.results: Dict[str, FakeResult] = {}
+        self.connect_latency = connect_latency
+        self.list_latency = list_latency
+        self.statement_latency = statement_latency
+        self.clients = 0
+        self.lists = 0
+        self.statements: List[Tuple[str, str]] = []
+        self.cancelled: List[str] = []
+        self.polls = 0
+        # raised by warehouses.get() when set, e.g. PermissionError for a revoked token
+        self.warehouse_error: Optional[Exception] = None
+        self.chunk_requests: List[int] = []
+        self.submitted: Dict[str, Submitted] = {}
+        self.link_directory = Path(tempfile.mkdtemp(prefix="fake-databricks-"))
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def client(self) -> "FakeWorkspaceClient":
+        """Use as DatabricksClient(client_factory=workspace.client)"""
+        time.sleep(self.connect_latency)
+        with self._lock:
+            self.clients += 1
+        return FakeWorkspaceClient(self)
+
+    def add_result(
+        self,
+        statement: str,
+        columns: List[str],
+        rows: List[List[Any]],
+        seconds: float = 0.0,
+        types: Optional[List[str]] = None,
+        chunk_rows: int = 1000,
+    ) -> None:
+        """`rows` hold JSON_ARRAY values (strings or None); `seconds` is how long the warehouse takes"""
+        self.results[statement] = FakeResult(columns, rows, seconds, types, chunk_rows)
+
+
+class FakeWorkspaceClient:
+    def __init__(self, workspace: FakeWorkspace):
+        self.warehouses = _Warehouses(workspace)
+        self.statement_execution = _StatementExecution(workspace)
+
+
+class _Warehouses:
+    def __init__(self, workspace: FakeWorkspace):
+        self._workspace = workspace
+
+    def list(self) -> List[SimpleNamespace]:
+        workspace = self._workspace
+        time.sleep(workspace.list_latency)
+        with workspace._lock:
+            workspace.lists += 1
+            return [SimpleNamespace(id=id, state=state) for id, state in workspace.states.items()]
+
+    def get(self, id: str) -> SimpleNamespace:
+        with self._workspace._lock:
+            state = self._workspace.states.get(id)
+        if self._workspace.warehouse_error is not None:
+            raise self._workspace.warehouse_error
+        if state is None:
+            raise not_found(f"Warehouse {id} does not exist")
+        return SimpleNamespace(id=id, state=state)
+
+
+class _StatementExecution:
+    def __init__(self, workspace: FakeWorkspace):
+        self._workspace = workspace
+
+    def execute_statement(
+        self,
+        warehouse_id: str,
+        statement: str,
+        wait_timeout: Optional[str] = None,
+        disposition: Any = "INLINE",
+        format: Any = "JSON_ARRAY",
+    ):
+        workspace = self._workspace
+        time.sleep(workspace.statement_latency)
+        with workspace._lock:
+            workspace.statements.append((warehouse_id, statement))
+            statement_id = f"stmt-{next(workspace._ids)}"
+            state = workspace.states.get(warehouse_id)
+        if state is None:
+            raise not_found(f"Warehouse {warehouse_id} does not exist")
+        result = workspace.results.get(statement)
+        seconds = result.seconds if result is not None else 0.0
+        with workspace._lock:
+            workspace.submitted[statement_id] = Submitted(
+                warehouse_id, statement, time.monotonic() + seconds, disposition, format
+            )
+        if wait_timeout != "0s" and state == "RUNNING":
+            # a real warehouse starts up instead, and the statement is still queued when wait_timeout runs out
+            time.sleep(seconds)
+        return self.get_statement(statement_id, poll=False)
+
+    def get_statement(self, statement_id: str, poll: bool = True):
+        workspace = self._workspace
+        with workspace._lock:
+            if poll:
+                workspace.polls += 1
+            submitted = workspace.submitted[statement_id]
+            cancelled = statement_id in workspace.cancelled
+            running = workspace.states.get(submitted.warehouse_id) == "RUNNING"
+        if cancelled:
+            return _response(statement_id, "CANCELED")
+        if not running:
+            return _response(statement_id, "PENDING")
+        if time.monotonic() < submitted.done_at:
+            return _response(statement_id, "RUNNING")
+        result = workspace.results.get(submitted.statement)
+        if result is None:
+            message = f"Unknown statement: {submitted.statement}"
+            return _response(statement_id, "FAILED", SimpleNamespace(message=message))
+        columns = [
+            SimpleNamespace(name=name, type_name=type_name, position=position)
+            for position, (name, type_name) in enumerate(zip(result.columns, result.types))
+        ]
+        return SimpleNamespace(
+            statement_id=statement_id,
+            status=SimpleNamespace(state="SUCCEEDED", error=None),
+            manifest=SimpleNamespace(
+                schema=SimpleNamespace(columns=columns),
+                total_chunk_count=result.chunk_count,
+                total_row_count=len(result.rows),
+            ),
+            result=self._chunk(statement_id, submitted, result, 0),
+        )
+
+    def get_statement_result_chunk_n(self, statement_id: str, chunk_index: int):
+        workspace = self._workspace
+        with workspace._lock:
+            workspace.chunk_requests.append(chunk_index)
+            submitted = workspace.submitted[statement_id]
+        return self._chunk(statement_id, submitted, workspace.results[submitted.statement], chunk_index)
+
+    def _chunk(self, statement_id: str, submitted: Submitted, result: FakeResult, index: int) -> SimpleNamespace:
+        following = index + 1 if index + 1 < result.chunk_count else None
+        rows = result.chunk(index)
+        if not submitted.external:
+            return SimpleNamespace(chunk_index=index, next_chunk_index=following, row_count=len(rows), data_array=rows)
+        path = self._workspace.link_directory / f"{statement_id}-{index}.arrows"
+        _write_arrow(path, result, rows)
+        link = SimpleNamespace(
+            external_link=path.as_uri(), chunk_index=index, next_chunk_index=following, row_count=len(rows)
+        )
+        return SimpleNamespace(
+            chunk_index=index, next_chunk_index=following, row_count=len(rows), data_array=None, external_links=[link]
+        )
+
+    def cancel_execution(self, statement_id: str) -> None:
+        with self._workspace._lock:
+            self._workspace.cancelled.append(statement_id)
+
+
+def _write_arrow(path: Path, result: FakeResult, rows: List[List[Any]]) -> None:
+    import pyarrow
+    import pyarrow.ipc
+
+    columns = {
+        name: pyarrow.array([row[position] for row in rows], pyarrow.string()).cast(ARROW_TYPES[type_name])
+        for position, (name, type_name) in enumerate(zip(result.columns, result.types))
+    }
+    table = pyarrow.table(columns)
+    with pyarrow.ipc.new_stream(str(path), table.schema) as writer:
+        # several record batches per link, as Databricks sends them
+        for batch in table.to_batches(max_chunksize=max(1, result.chunk_rows // 4)):
+            writer.write_batch(batch)
+
+
+def _response(statement_id: str, state: str, error: Any = None) -> SimpleNamespace:
+    return SimpleNamespace(statement_id=statement_id, status=SimpleNamespace(state=state, error=error))
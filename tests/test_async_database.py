@@ -0,0 +1,92 @@
+import asyncio
+import time
+from decimal import Decimal
+from typing import AsyncGenerator, Dict
+
+import pytest
+from sqlalchemy import text
+
+from app.catalog_cache import catalog_cache
+from app.checkout_service import checkout, checkout_async
+from app.database import ASYNC_ENGINE, get_async_session, get_session
+from app.models import Product, TransactionCreate, TransactionStatus
+from app.transaction_service import get_transaction_history, get_transaction_history_async
+
+
+@pytest.fixture()
+async def async_data(sample_data) -> AsyncGenerator[Dict[str, int], None]:
+    catalog_cache.clear()
+    yield sample_data
+    catalog_cache.clear()
+    # pooled asyncpg connections belong to this test's event loop
+    await ASYNC_ENGINE.dispose()
+
+
+def sale(data: Dict[str, int], quantity: int) -> TransactionCreate:
+    return TransactionCreate(
+        cashier_id=data["cashier"],
+        payment_method="cash",
+        items=[{"product_id": data["cola"], "quantity": quantity}],
+    )
+
+
+async def test_async_lookup_fills_the_shared_cache(async_data):
+    entry = await catalog_cache.get_by_barcode_async("111")
+
+    assert entry is not None and entry.id == async_data["cola"]
+    assert catalog_cache.get_by_sku("COLA") is entry
+    assert await catalog_cache.get_by_sku_async("MISSING") is None
+
+
+async def test_async_checkout_commits_and_invalidates(async_data):
+    before = await catalog_cache.get_by_barcode_async("111")
+    transaction = await checkout_async(sale(async_data, 2), tax_rate=Decimal("0.10"), apply_promotions=True)
+
+    assert transaction.status == TransactionStatus.COMPLETED
+    assert transaction.subtotal == Decimal("3.00")
+    assert transaction.discount_amount == Decimal("2.00")
+    assert transaction.total_amount == Decimal("1.10")
+    after = await catalog_cache.get_by_barcode_async("111")
+    assert before is not None and before.stock_quantity == 10
+    assert after is not None and after.stock_quantity == 8
+    with get_session() as session:
+        product = session.get(Product, async_data["cola"])
+        assert product is not None and product.stock_quantity == 8
+
+
+async def test_async_checkout_rolls_back_on_error(async_data):
+    with pytest.raises(ValueError, match="Insufficient stock"):
+        await checkout_async(sale(async_data, 11))
+
+    assert await get_transaction_history_async() == []
+
+
+async def test_async_history_pages_like_the_sync_one(async_data):
+    ids = [checkout(sale(async_data, 1)).id for _ in range(3)]
+    await checkout_async(sale(async_data, 1))
+
+    first = await get_transaction_history_async(cashier_id=async_data["cashier"], limit=2)
+    rest = await get_transaction_history_async(cashier_id=async_data["cashier"], before_id=first[-1].id)
+
+    assert [t.id for t in first + rest] == [t.id for t in get_transaction_history(cashier_id=async_data["cashier"])]
+    assert [t.id for t in rest] == ids[1::-1]
+
+
+async def test_slow_query_does_not_block_the_event_loop(async_data):
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    async with get_async_session() as session:
+        await session.execute(text("SELECT pg_sleep(0.3)"))
+    elapsed = time.perf_counter() - started
+    task.cancel()
+
+    assert elapsed >= 0.3
+    assert ticks >= 10
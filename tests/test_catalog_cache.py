@@ -0,0 +1,171 @@
+import time
+from decimal import Decimal
+from typing import Dict, Generator
+
+import pytest
+from sqlalchemy import text
+
+from app.catalog_cache import ProductCatalogCache, catalog_cache
+from app.checkout_service import checkout
+from app.database import ENGINE, get_session
+from app.models import Category, Product, ProductUpdate, TransactionCreate, User, UserRole
+from app.product_service import update_product
+
+
+@pytest.fixture()
+def cache(clean_db) -> Generator[ProductCatalogCache, None, None]:
+    catalog_cache.clear()
+    yield catalog_cache
+    catalog_cache.clear()
+
+
+@pytest.fixture()
+def products(cache) -> Dict[str, int]:
+    with get_session() as session:
+        cashier = User(
+            username="cashier",
+            email="cashier@example.com",
+            password_hash="x",
+            full_name="Cashier",
+            role=UserRole.CASHIER,
+        )
+        category = Category(name="Snacks")
+        session.add_all([cashier, category])
+        session.commit()
+        session.refresh(cashier)
+        session.refresh(category)
+        if category.id is None:
+            raise ValueError("Category ID cannot be None")
+
+        chips = Product(
+            name="Chips",
+            sku="CHIPS",
+            barcode="4000001",
+            category_id=category.id,
+            base_price=Decimal("2.49"),
+            cost_price=Decimal("1.00"),
+            stock_quantity=20,
+        )
+        retired = Product(
+            name="Retired",
+            sku="OLD",
+            barcode="4000002",
+            category_id=category.id,
+            base_price=Decimal("1.00"),
+            cost_price=Decimal("0.50"),
+            is_active=False,
+        )
+        session.add_all([chips, retired])
+        session.commit()
+        return {"cashier": cashier.id or 0, "chips": chips.id or 0}
+
+
+def test_lookup_reads_through_then_hits_memory(cache, products):
+    entry = cache.get_by_barcode("4000001")
+
+    assert entry is not None
+    assert entry.id == products["chips"]
+    assert entry.base_price == Decimal("2.49")
+    assert cache.misses == 1
+
+    assert cache.get_by_barcode("4000001") is entry
+    assert cache.get_by_sku("CHIPS") is entry
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+
+def test_inactive_and_unknown_products_are_not_cached(cache, products):
+    assert cache.get_by_barcode("4000002") is None
+    assert cache.get_by_sku("missing") is None
+    assert len(cache) == 0
+
+
+def test_product_update_invalidates_entry(cache, products):
+    assert cache.get_by_sku("CHIPS") is not None
+
+    update_product(products["chips"], ProductUpdate(base_price=Decimal("1.99")))
+
+    assert len(cache) == 0
+    entry = cache.get_by_sku("CHIPS")
+    assert entry is not None
+    assert entry.base_price == Decimal("1.99")
+
+
+def test_changes_from_other_processes_show_once_the_entry_expires(products):
+    cache = ProductCatalogCache(max_age=0.2)
+    assert cache.get_by_sku("CHIPS") is not None
+
+    # as another process would write it: no session, so no after_commit hook
+    with ENGINE.begin() as connection:
+        connection.execute(text("UPDATE products SET base_price = 2.99 WHERE id = :id"), {"id": products["chips"]})
+
+    entry = cache.get_by_sku("CHIPS")
+    assert entry is not None and entry.base_price == Decimal("2.49")
+    time.sleep(0.2)
+    entry = cache.get_by_barcode("4000001")
+    assert entry is not None and entry.base_price == Decimal("2.99")
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_checkout_stock_movement_invalidates_entry(cache, products):
+    assert cache.get_by_barcode("4000001") is not None
+
+    checkout(
+        TransactionCreate(
+            cashier_id=products["cashier"],
+            payment_method="cash",
+            items=[{"product_id": products["chips"], "quantity": 3}],
+        )
+    )
+
+    entry = cache.get_by_barcode("4000001")
+    assert entry is not None
+    assert entry.stock_quantity == 17
+
+
+def test_failed_checkout_keeps_entry(cache, products):
+    cached = cache.get_by_barcode("4000001")
+
+    with pytest.raises(ValueError):
+        checkout(
+            TransactionCreate(
+                cashier_id=products["cashier"],
+                payment_method="cash",
+                items=[{"product_id": products["chips"], "quantity": 500}],
+            )
+        )
+
+    assert cache.get_by_barcode("4000001") is cached
+
+
+def test_eviction_is_size_bounded(clean_db):
+    small = ProductCatalogCache(max_size=2)
+    with get_session() as session:
+        category = Category(name="Bulk")
+        session.add(category)
+        session.commit()
+        session.refresh(category)
+        if category.id is None:
+            raise ValueError("Category ID cannot be None")
+        session.add_all(
+            [
+                Product(
+                    name=f"Item {i}",
+                    sku=f"SKU{i}",
+                    barcode=f"B{i}",
+                    category_id=category.id,
+                    base_price=Decimal("1.00"),
+                    cost_price=Decimal("0.50"),
+                )
+                for i in range(3)
+            ]
+        )
+        session.commit()
+
+    for i in range(3):
+        assert small.get_by_barcode(f"B{i}") is not None
+
+    assert len(small) == 2
+    misses = small.misses
+    small.get_by_barcode("B0")
+    assert small.misses == misses + 1
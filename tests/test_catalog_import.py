@@ -0,0 +1,106 @@
+from decimal import Decimal
+from typing import Dict, List
+
+from sqlmodel import select
+
+from app.catalog_import import import_catalog
+from app.database import get_session
+from app.models import Product, StockMovement
+
+
+def row(sku: str, **fields: str) -> Dict[str, str]:
+    """A CSV row as csv.DictReader yields it"""
+    return {
+        "sku": sku,
+        "name": f"Product {sku}",
+        "category": "drinks",
+        "base_price": "2.50",
+        "cost_price": "1.00",
+    } | fields
+
+
+def products() -> Dict[str, Product]:
+    with get_session() as session:
+        return {product.sku: product for product in session.exec(select(Product)).all()}
+
+
+def movements() -> List[tuple]:
+    with get_session() as session:
+        return [
+            (movement.quantity, movement.previous_quantity, movement.new_quantity)
+            for movement in session.exec(select(StockMovement).where(StockMovement.notes == "catalog import")).all()
+        ]
+
+
+def test_import_upserts_by_sku_and_records_stock_changes(sample_data):
+    report = import_catalog(
+        [row("COLA", base_price="1.75", stock_quantity="30"), row("JUICE", stock_quantity="12"), row("TEA")],
+        created_by=sample_data["cashier"],
+    )
+
+    assert (report.rows, report.created, report.updated, report.errors) == (3, 2, 1, [])
+    catalog = products()
+    assert catalog["COLA"].base_price == Decimal("1.75")
+    assert catalog["COLA"].barcode == "111"  # left empty, so kept
+    assert (catalog["JUICE"].stock_quantity, catalog["TEA"].stock_quantity) == (12, 0)
+    assert catalog["JUICE"].category_id == catalog["COLA"].category_id
+    # cola had 10 in stock
+    assert sorted(movements()) == [(12, 0, 12), (20, 10, 30)]
+
+
+def test_reimport_without_stock_keeps_stock_and_skips_unchanged_rows(sample_data):
+    import_catalog([row("COLA", stock_quantity="30"), row("TEA")], created_by=sample_data["cashier"])
+
+    report = import_catalog([row("COLA"), row("TEA", name="Green tea")], created_by=sample_data["cashier"])
+
+    assert (report.created, report.updated, report.unchanged, report.stock_movements) == (0, 1, 1, 0)
+    assert products()["COLA"].stock_quantity == 30
+    assert products()["TEA"].name == "Green tea"
+
+
+def test_bad_rows_are_reported_and_the_rest_imported(sample_data):
+    report = import_catalog(
+        [
+            row("A1"),
+            row("A2", base_price="cheap"),
+            row("A3", category="Nowhere"),
+            row("A1", name="Again"),
+            row("A4", name="x" * 300),
+            row("A5", barcode="9" * 100, stock_quantity="-"),
+            row("A6"),
+        ],
+        created_by=sample_data["cashier"],
+        batch_size=3,
+    )
+
+    assert [(error.row, error.sku) for error in report.errors] == [
+        (2, "A2"),
+        (3, "A3"),
+        (4, "A1"),
+        (5, "A4"),
+        (6, "A5"),
+    ]
+    assert report.errors[1].message == "unknown category 'Nowhere'"
+    assert report.errors[2].message == "duplicate sku, already imported from row 1"
+    assert report.created == 2
+    assert {"A1", "A6"} <= set(products())
+
+
+def test_database_errors_only_fail_their_row(sample_data):
+    report = import_catalog([row("B1"), row("B2", category_id="999999"), row("B3")], created_by=sample_data["cashier"])
+
+    assert [(error.row, error.sku) for error in report.errors] == [(2, "B2")]
+    assert "foreign key" in report.errors[0].message
+    assert report.created == 2
+
+
+def test_missing_categories_can_be_created(sample_data):
+    report = import_catalog(
+        [row("C1", category="Snacks"), row("C2", category="snacks ")],
+        created_by=sample_data["cashier"],
+        create_categories=True,
+    )
+
+    assert (report.created, report.categories_created) == (2, 1)
+    catalog = products()
+    assert catalog["C1"].category_id == catalog["C2"].category_id
@@ -0,0 +1,119 @@
+from decimal import Decimal
+
+import pytest
+from sqlmodel import select
+
+from app.checkout_service import checkout
+from app.database import get_session
+from app.models import (
+    Commission,
+    Product,
+    Receipt,
+    StockMovement,
+    Transaction,
+    TransactionCreate,
+    TransactionItem,
+    TransactionPromotion,
+    TransactionStatus,
+)
+from app.promotion_counters import usage_counts
+
+
+def test_checkout_writes_every_table(sample_data):
+    data = TransactionCreate(
+        cashier_id=sample_data["cashier"],
+        reseller_id=sample_data["seller"],
+        affiliate_id=sample_data["affiliate"],
+        payment_method="cash",
+        items=[
+            {"product_id": sample_data["cola"], "quantity": 2},
+            {"product_id": sample_data["water"], "quantity": 3},
+            {"product_id": sample_data["cola"], "quantity": 1, "unit_price": Decimal("1.00")},
+        ],
+    )
+
+    transaction = checkout(data, promotion_discounts={sample_data["promotion"]: Decimal("2.00")})
+
+    # 3.00 + 2.97 + 1.00 = 6.97 subtotal, 2.00 off
+    assert transaction.id is not None
+    assert transaction.status == TransactionStatus.COMPLETED
+    assert transaction.subtotal == Decimal("6.97")
+    assert transaction.discount_amount == Decimal("2.00")
+    assert transaction.total_amount == Decimal("4.97")
+
+    with get_session() as session:
+        items = session.exec(select(TransactionItem).where(TransactionItem.transaction_id == transaction.id)).all()
+        assert len(items) == 3
+
+        cola = session.get(Product, sample_data["cola"])
+        water = session.get(Product, sample_data["water"])
+        assert cola is not None and cola.stock_quantity == 7
+        assert water is not None and water.stock_quantity == 2
+
+        movements = session.exec(select(StockMovement).where(StockMovement.product_id == sample_data["cola"])).all()
+        assert [(m.quantity, m.previous_quantity, m.new_quantity) for m in movements] == [(3, 10, 7)]
+        assert movements[0].reference_number == transaction.transaction_number
+
+        commissions = {
+            c.user_id: c
+            for c in session.exec(select(Commission).where(Commission.transaction_id == transaction.id)).all()
+        }
+        assert commissions[sample_data["seller"]].level == 1
+        assert commissions[sample_data["seller"]].commission_amount == Decimal("0.25")
+        assert commissions[sample_data["top"]].level == 2
+        assert commissions[sample_data["top"]].commission_amount == Decimal("0.10")
+        assert commissions[sample_data["affiliate"]].commission_type == "affiliate"
+        assert commissions[sample_data["affiliate"]].commission_amount == Decimal("0.15")
+
+        applied = session.exec(
+            select(TransactionPromotion).where(TransactionPromotion.transaction_id == transaction.id)
+        ).all()
+        assert [p.promotion_id for p in applied] == [sample_data["promotion"]]
+        assert usage_counts(session, [sample_data["promotion"]]) == {sample_data["promotion"]: 1}
+
+        receipt = session.exec(select(Receipt).where(Receipt.transaction_id == transaction.id)).first()
+        assert receipt is not None
+
+
+def test_checkout_applies_tax_after_discount(sample_data):
+    data = TransactionCreate(
+        cashier_id=sample_data["cashier"],
+        payment_method="card",
+        items=[{"product_id": sample_data["cola"], "quantity": 4}],
+    )
+
+    transaction = checkout(data, tax_rate=Decimal("0.10"))
+
+    assert transaction.subtotal == Decimal("6.00")
+    assert transaction.tax_amount == Decimal("0.60")
+    assert transaction.total_amount == Decimal("6.60")
+
+
+def test_checkout_insufficient_stock_rolls_back(sample_data):
+    data = TransactionCreate(
+        cashier_id=sample_data["cashier"],
+        payment_method="cash",
+        items=[{"product_id": sample_data["water"], "quantity": 6}],
+    )
+
+    with pytest.raises(ValueError, match="Insufficient stock"):
+        checkout(data)
+
+    with get_session() as session:
+        assert session.exec(select(Transaction)).first() is None
+        water = session.get(Product, sample_data["water"])
+        assert water is not None and water.stock_quantity == 5
+
+
+def test_checkout_rejects_unknown_product(sample_data):
+    data = TransactionCreate(
+        cashier_id=sample_data["cashier"], payment_method="cash", items=[{"product_id": 9999, "quantity": 1}]
+    )
+
+    with pytest.raises(ValueError, match="not available"):
+        checkout(data)
+
+
+def test_checkout_rejects_empty_basket(sample_data):
+    with pytest.raises(ValueError, match="empty"):
+        checkout(TransactionCreate(cashier_id=sample_data["cashier"], payment_method="cash"))
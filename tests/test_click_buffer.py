@@ -0,0 +1,118 @@
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncGenerator, Dict, List
+
+import pytest
+from sqlmodel import select
+
+from app.click_buffer import ClickBuffer, ClickDurability, click_buffer, link_codes, redirect_url, track_click
+from app.database import ASYNC_ENGINE, get_session
+from app.models import AffiliateLink, AffiliateProfile
+
+CRASH = """
+import os, sys
+from app.click_buffer import ClickBuffer, ClickDurability
+buffer = ClickBuffer(durability=ClickDurability.JOURNAL, journal_dir=sys.argv[1])
+for link_id in sys.argv[2:]:
+    buffer.record(int(link_id))
+os._exit(1)
+"""
+
+
+@pytest.fixture()
+def links(sample_data) -> List[int]:
+    with get_session() as session:
+        profile = session.exec(
+            select(AffiliateProfile).where(AffiliateProfile.user_id == sample_data["affiliate"])
+        ).one()
+        links = [AffiliateLink(affiliate_profile_id=profile.id, link_code=code) for code in ("AFF-A", "AFF-B")]
+        links[1].product_id = sample_data["cola"]
+        links.append(AffiliateLink(affiliate_profile_id=profile.id, link_code="AFF-OFF", is_active=False))
+        session.add_all(links)
+        session.commit()
+        return [link.id or 0 for link in links]
+
+
+@pytest.fixture()
+async def tracking(links) -> AsyncGenerator[List[int], None]:
+    link_codes.clear()
+    click_buffer.flush()
+    yield links
+    # pooled asyncpg connections belong to this test's event loop
+    await ASYNC_ENGINE.dispose()
+
+
+def clicks() -> Dict[str, int]:
+    with get_session() as session:
+        return {link.link_code: link.clicks for link in session.exec(select(AffiliateLink)).all()}
+
+
+def test_flush_adds_aggregated_clicks(links):
+    buffer = ClickBuffer(flush_clicks=5)
+
+    due = [buffer.record(link_id) for link_id in [links[0]] * 3 + [links[1]] * 2]
+
+    assert due == [False, False, False, False, True]
+    assert clicks() == {"AFF-A": 0, "AFF-B": 0, "AFF-OFF": 0}
+    assert buffer.flush() == 5
+    assert buffer.flush() == 0
+    assert clicks() == {"AFF-A": 3, "AFF-B": 2, "AFF-OFF": 0}
+
+
+def test_concurrent_fsync_clicks_are_all_counted(links, tmp_path: Path):
+    buffer = ClickBuffer(durability=ClickDurability.FSYNC, journal_dir=str(tmp_path))
+
+    def lane(link_id: int) -> None:
+        for _ in range(50):
+            buffer.record(link_id)
+            if buffer.pending > 60:
+                buffer.flush()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lane, [links[0], links[1], links[0], links[1]]))
+    buffer.close()
+
+    assert buffer.flushed == 200
+    assert clicks() == {"AFF-A": 100, "AFF-B": 100, "AFF-OFF": 0}
+    assert os.listdir(tmp_path) == []
+
+
+def test_journal_of_a_crashed_process_is_applied_once(links, tmp_path: Path):
+    journal = tmp_path / "journal"
+    crashed = subprocess.run([sys.executable, "-c", CRASH, str(journal), str(links[0]), str(links[0]), str(links[1])])
+    assert crashed.returncode == 1
+    [segment] = journal.iterdir()
+    shutil.copy(segment, tmp_path / "copy")
+
+    assert ClickBuffer(durability=ClickDurability.JOURNAL, journal_dir=str(journal)).flush() == 3
+    assert list(journal.iterdir()) == []
+
+    # replayed again, e.g. after a crash between the commit and the deletion
+    shutil.copy(tmp_path / "copy", segment)
+    assert ClickBuffer(durability=ClickDurability.JOURNAL, journal_dir=str(journal)).flush() == 0
+    assert list(journal.iterdir()) == []
+    assert clicks() == {"AFF-A": 2, "AFF-B": 1, "AFF-OFF": 0}
+
+
+async def test_tracking_endpoint_counts_active_links(tracking):
+    responses = [await track_click(code) for code in ("AFF-A", "AFF-A", "AFF-OFF", "AFF-NONE")]
+
+    assert [response.status_code for response in responses] == [302, 302, 404, 404]
+    assert responses[0].headers["location"] == "/"
+    assert click_buffer.flush() == 2
+    assert clicks()["AFF-A"] == 2
+
+
+async def test_product_links_go_to_the_shops_product_page(tracking, sample_data):
+    # without APP_AFFILIATE_PRODUCT_URL there is no product page to send the visitor to
+    response = await track_click("AFF-B")
+    assert response.headers["location"] == "/"
+    click_buffer.flush()
+
+    shop = "https://shop.example.com/products/{product_id}"
+    assert redirect_url(sample_data["cola"], shop) == f"https://shop.example.com/products/{sample_data['cola']}"
+    assert redirect_url(None, shop, "https://shop.example.com/") == "https://shop.example.com/"
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from typing import Any, Callable, ClassVar, Dict, List, Sequence
+
+import pytest
+
+from app.dbrx import DatabricksClient, DatabricksModel, cancel_on_disconnect, fetch_concurrently
+from app.dbrx_cache import result_cache
+from fake_databricks import FakeWorkspace
+
+SLOW = "SELECT * FROM main.pos.daily_sales"
+SLOWER = "SELECT * FROM main.pos.stock_levels"
+FAST = "SELECT * FROM main.pos.top_products"
+
+
+@pytest.fixture()
+def workspace() -> FakeWorkspace:
+    workspace = FakeWorkspace()
+    workspace.add_result(SLOW, ["day", "total"], [["2026-10-01", "120.50"]], seconds=0.4)
+    workspace.add_result(SLOWER, ["sku", "units"], [["COLA", "8"]], seconds=0.5)
+    workspace.add_result(FAST, ["sku"], [["COLA"]], seconds=0.1)
+    return workspace
+
+
+@pytest.fixture()
+def databricks(workspace) -> DatabricksClient:
+    return DatabricksClient(workspace.client, poll_initial=0.01, poll_max=0.05)
+
+
+class Disconnectable:
+    """The part of nicegui.Client that cancel_on_disconnect() uses"""
+
+    def __init__(self):
+        self.disconnect_handlers: List[Callable[..., Any]] = []
+
+    def on_disconnect(self, handler: Callable[..., Any]) -> None:
+        self.disconnect_handlers.append(handler)
+
+    def disconnect(self) -> None:
+        for handler in self.disconnect_handlers:
+            handler()
+
+
+async def test_async_query_polls_until_done(workspace, databricks):
+    assert await databricks.execute_async(SLOW) == [{"day": "2026-10-01", "total": "120.50"}]
+    assert 2 <= workspace.polls <= 15
+
+
+async def test_concurrent_fetches_take_as_long_as_the_slowest(databricks):
+    started = time.monotonic()
+    results = await fetch_concurrently(
+        databricks.execute_async(SLOW), databricks.execute_async(SLOWER), databricks.execute_async(FAST)
+    )
+
+    assert time.monotonic() - started < 0.9
+    assert [len(rows) for rows in results] == [1, 1, 1]
+    assert results[2] == [{"sku": "COLA"}]
+
+
+async def test_one_failed_fetch_cancels_the_others(workspace, databricks):
+    with pytest.raises(ExceptionGroup) as failure:
+        await fetch_concurrently(databricks.execute_async(SLOWER), databricks.execute_async("SELECT nope"))
+
+    assert failure.group_contains(RuntimeError, match="FAILED")
+    assert [workspace.submitted[id].statement for id in workspace.cancelled] == [SLOWER]
+
+
+async def test_closed_page_cancels_its_statements(workspace, databricks):
+    workspace.add_result("SELECT * FROM main.pos.everything", ["n"], [["1"]], seconds=30)
+    client = Disconnectable()
+    page = asyncio.ensure_future(
+        cancel_on_disconnect(client, databricks.execute_async("SELECT * FROM main.pos.everything"))
+    )
+    await asyncio.sleep(0.1)
+
+    client.disconnect()
+
+    with pytest.raises(asyncio.CancelledError):
+        await page
+    assert workspace.cancelled == ["stmt-1"]
+
+
+async def test_finished_page_work_leaves_no_disconnect_handler(databricks):
+    client = Disconnectable()
+
+    assert await cancel_on_disconnect(client, databricks.execute_async(FAST)) == [{"sku": "COLA"}]
+    assert client.disconnect_handlers == []
+
+
+async def test_query_timeout_cancels_the_statement(workspace, databricks):
+    workspace.states["wh-1"] = "STOPPED"
+
+    with pytest.raises(TimeoutError, match="PENDING"):
+        await databricks.execute_async(FAST, timeout=0.1)
+    assert workspace.cancelled == ["stmt-1"]
+
+
+async def test_cancelled_model_fetch_cancels_its_statement(workspace, databricks):
+    workspace.add_result("SELECT * FROM main.pos.everything", ["n"], [["1"]], seconds=30)
+
+    class Everything(DatabricksModel):
+        __catalog__, __schema__, __table__ = "main", "pos", "everything"
+        __cache_ttl__: ClassVar[float] = 60
+        n: int
+
+        @classmethod
+        def query(cls, **params) -> str:
+            return f"SELECT * FROM {cls.table_name()}"
+
+        @classmethod
+        async def execute_async(cls, query: str) -> List[Dict[str, Any]]:
+            return await databricks.execute_async(query)
+
+    fetch = asyncio.ensure_future(Everything.fetch_async())
+    await asyncio.sleep(0.1)
+    fetch.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await fetch
+    assert workspace.cancelled == ["stmt-1"]
+    # the cancelled load left no refresh behind, and the next one fills the cache fetch() reads
+    workspace.add_result("SELECT * FROM main.pos.everything", ["n"], [["1"]])
+    try:
+        assert await Everything.fetch_async() == [Everything(n=1)]
+        assert Everything.fetch() == [Everything(n=1)]
+        assert len(workspace.statements) == 2
+    finally:
+        result_cache.clear()
+
+
+async def test_models_overriding_fetch_run_it_in_a_worker_thread():
+    class Region(DatabricksModel):
+        __catalog__, __schema__, __table__ = "main", "pos", "regions"
+        name: str
+
+        @classmethod
+        def fetch(cls, **params) -> Sequence["Region"]:
+            time.sleep(0.3)
+            return [cls(name="north")]
+
+    started = time.monotonic()
+    first, second = await fetch_concurrently(Region.fetch_async(), Region.fetch_async())
+
+    assert time.monotonic() - started < 0.55
+    assert first == second == [Region(name="north")]
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, ClassVar, Dict, List
+
+import pytest
+
+from app.dbrx import DatabricksClient, DatabricksModel
+from app.dbrx_cache import ResultCache, cache_key, result_cache
+from fake_databricks import FakeWorkspace
+
+workspace = FakeWorkspace()
+workspace.add_result(
+    "SELECT region, revenue FROM main.pos.region_sales WHERE day = '2026-10-01'",
+    ["region", "revenue"],
+    [["north", "120.50"], ["south", "80.00"]],
+)
+workspace.add_result(
+    "SELECT region, revenue FROM main.pos.region_sales WHERE day = '2026-10-02'",
+    ["region", "revenue"],
+    [["north", "9"]],
+)
+
+
+class RegionSales(DatabricksModel):
+    __catalog__, __schema__, __table__ = "main", "pos", "region_sales"
+    __cache_ttl__: ClassVar[float] = 60
+    databricks: ClassVar[DatabricksClient] = DatabricksClient(workspace.client)
+
+    region: str
+    revenue: Decimal
+
+    @classmethod
+    def query(cls, **params) -> str:
+        return f"SELECT region, revenue FROM {cls.table_name()} WHERE day = '{params['day']}'"
+
+    @classmethod
+    def execute(cls, query: str) -> List[Dict[str, Any]]:
+        return cls.databricks.execute(query)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    result_cache.clear()
+    yield
+    result_cache.clear()
+
+
+class Loader:
+    def __init__(self, rows: Any, seconds: float = 0.0):
+        self.rows = rows
+        self.seconds = seconds
+        self.calls = 0
+
+    def __call__(self) -> List[Dict[str, Any]]:
+        self.calls += 1
+        time.sleep(self.seconds)
+        if isinstance(self.rows, Exception):
+            raise self.rows
+        return self.rows
+
+
+def test_model_fetch_is_cached_per_parameters():
+    before = len(workspace.statements)
+
+    first = RegionSales.fetch(day="2026-10-01")
+    assert RegionSales.fetch(day="2026-10-01") == first
+    assert RegionSales.fetch(day="2026-10-02") == [RegionSales(region="north", revenue=Decimal("9"))]
+
+    assert first[0] == RegionSales(region="north", revenue=Decimal("120.50"))
+    assert len(workspace.statements) - before == 2
+    assert result_cache.stats()["hits"] == 1
+
+
+def test_keys_ignore_parameter_order():
+    assert cache_key("t", "q", {"a": 1, "b": 2}) == cache_key("t", "q", {"b": 2, "a": 1})
+    assert cache_key("t", "q", {"a": 1}) != cache_key("u", "q", {"a": 1})
+
+
+def test_zero_ttl_always_loads():
+    cache, load = ResultCache(), Loader([{"n": 1}])
+
+    cache.get("k", 0, load)
+    cache.get("k", 0, load)
+
+    assert load.calls == 2
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.get(key, 60, Loader([{"key": key}]))
+    cache.get("a", 60, Loader([]))
+    cache.get("c", 60, Loader([{"key": "c"}]))
+
+    reload = Loader([{"key": "b", "reloaded": True}])
+    cache.get("b", 60, reload)
+    assert reload.calls == 1
+    assert cache.get("c", 60, Loader([])) == [{"key": "c"}]
+
+
+def test_concurrent_misses_run_one_load():
+    cache, load = ResultCache(), Loader([{"n": 1}], seconds=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", 60, load))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert load.calls == 1
+    assert results == [[{"n": 1}]] * 8
+
+
+async def test_concurrent_async_misses_run_one_load():
+    cache = ResultCache(directory=None)
+    loads: List[int] = []
+
+    async def load() -> List[Dict[str, Any]]:
+        loads.append(1)
+        await asyncio.sleep(0.2)
+        return [{"region": "north"}]
+
+    results = await asyncio.gather(*(cache.get_async("key", 60, load) for _ in range(3)))
+
+    assert results == [[{"region": "north"}]] * 3
+    assert len(loads) == 1
+    assert cache.get("key", 60, Loader([])) == [{"region": "north"}]
+
+
+def test_expired_entry_is_served_stale_while_one_caller_refreshes():
+    cache = ResultCache(max_stale=60)
+    cache.put("k", [{"n": "old"}], ttl=-1)
+    refresh = Loader([{"n": "new"}], seconds=0.3)
+    refreshed = threading.Thread(target=cache.get, args=("k", 60, refresh))
+    refreshed.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    assert cache.get("k", 60, Loader([{"n": "unexpected"}])) == [{"n": "old"}]
+    assert time.monotonic() - started < 0.1
+
+    refreshed.join()
+    assert cache.get("k", 60, Loader([])) == [{"n": "new"}]
+    assert refresh.calls == 1
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_failed_refresh_falls_back_to_stale_rows_within_max_stale():
+    cache = ResultCache(max_stale=60)
+    cache.put("k", [{"n": "old"}], ttl=-1)
+
+    assert cache.get("k", 60, Loader(RuntimeError("warehouse down"))) == [{"n": "old"}]
+
+    cache.put("k", [{"n": "old"}], ttl=-120)
+    with pytest.raises(RuntimeError, match="warehouse down"):
+        cache.get("k", 60, Loader(RuntimeError("warehouse down")))
+
+
+def test_disk_entries_survive_a_new_process(tmp_path):
+    ResultCache(directory=str(tmp_path)).get("k", 60, Loader([{"n": 1}]))
+
+    restarted, load = ResultCache(directory=str(tmp_path)), Loader([{"n": 2}])
+    assert restarted.get("k", 60, load) == [{"n": 1}]
+    assert load.calls == 0
+
+    restarted.invalidate("k")
+    assert ResultCache(directory=str(tmp_path)).get("k", 60, load) == [{"n": 2}]
+
+
+def test_disk_entries_keep_decimals_and_dates(tmp_path):
+    rows = [{"day": date(2026, 10, 1), "at": datetime(2026, 10, 1, 9, 30), "revenue": Decimal("120.50"), "n": 3}]
+    ResultCache(directory=str(tmp_path)).put("k", rows, 60)
+
+    assert ResultCache(directory=str(tmp_path)).get("k", 60, Loader([])) == rows
+
+
+def test_unreadable_disk_entry_is_logged_and_reloaded(tmp_path, caplog):
+    cache = ResultCache(directory=str(tmp_path))
+    cache.put("k", [{"n": 1}], 60)
+    [path] = tmp_path.glob("*.json")
+    path.write_text('{"key": "k", "rows": [')
+    caplog.set_level(logging.WARNING, logger="app.dbrx_cache")
+
+    assert ResultCache(directory=str(tmp_path)).get("k", 60, Loader([{"n": 2}])) == [{"n": 2}]
+    assert f"Ignoring the unreadable cached Databricks result {path}" in caplog.text
+    assert ResultCache(directory=str(tmp_path)).get("k", 60, Loader([])) == [{"n": 2}]
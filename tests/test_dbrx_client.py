@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+from app.dbrx import DatabricksClient
+from fake_databricks import FakeWorkspace, not_found
+
+QUERY = "SELECT sku, units FROM main.pos.sales"
+
+
+@pytest.fixture()
+def workspace() -> FakeWorkspace:
+    workspace = FakeWorkspace(warehouses=[("wh-stopped", "STOPPED"), ("wh-1", "RUNNING"), ("wh-2", "RUNNING")])
+    workspace.add_result(QUERY, ["sku", "units"], [["COLA", "3"], ["CHIPS", "1"]])
+    return workspace
+
+
+def test_queries_share_one_client_and_one_warehouse_lookup(workspace):
+    databricks = DatabricksClient(workspace.client)
+
+    for _ in range(5):
+        assert databricks.execute(QUERY) == [{"sku": "COLA", "units": "3"}, {"sku": "CHIPS", "units": "1"}]
+
+    assert workspace.clients == 1
+    assert workspace.lists == 1
+    assert {warehouse for warehouse, _ in workspace.statements} == {"wh-1"}
+
+
+def test_warehouse_choice_expires_after_its_ttl(workspace):
+    databricks = DatabricksClient(workspace.client, warehouse_ttl=0)
+
+    databricks.execute(QUERY)
+    databricks.execute(QUERY)
+
+    assert workspace.clients == 1
+    assert workspace.lists == 2
+
+
+def test_stopped_warehouse_is_replaced_and_the_query_retried(workspace):
+    databricks = DatabricksClient(workspace.client)
+    databricks.execute(QUERY)
+    workspace.states["wh-1"] = "STOPPED"
+
+    assert len(databricks.execute(QUERY)) == 2
+
+    assert [warehouse for warehouse, _ in workspace.statements] == ["wh-1", "wh-1", "wh-2"]
+    assert workspace.cancelled == ["stmt-2"]
+    assert workspace.lists == 2
+    databricks.execute(QUERY)
+    assert workspace.lists == 2
+
+
+def test_deleted_warehouse_is_replaced_and_the_query_retried(workspace):
+    databricks = DatabricksClient(workspace.client)
+    databricks.execute(QUERY)
+    # deleted while the statement was queued on it
+    workspace.states["wh-1"] = "STOPPED"
+    workspace.warehouse_error = not_found("Warehouse wh-1 does not exist")
+
+    assert len(databricks.execute(QUERY)) == 2
+
+    assert [warehouse for warehouse, _ in workspace.statements] == ["wh-1", "wh-1", "wh-2"]
+
+
+def test_warehouse_lookup_errors_are_not_taken_for_a_deleted_warehouse(workspace):
+    databricks = DatabricksClient(workspace.client)
+    databricks.execute(QUERY)
+    workspace.states["wh-1"] = "STOPPED"
+    workspace.warehouse_error = PermissionError("token expired")
+
+    with pytest.raises(PermissionError, match="token expired"):
+        databricks.execute(QUERY)
+
+    assert [warehouse for warehouse, _ in workspace.statements] == ["wh-1", "wh-1"]
+    assert workspace.lists == 1
+
+
+def test_without_a_running_warehouse_the_first_one_is_rechecked_soon():
+    workspace = FakeWorkspace(warehouses=[("wh-1", "STOPPED")])
+    databricks = DatabricksClient(workspace.client, stopped_ttl=0)
+
+    with pytest.raises(RuntimeError, match="PENDING"):
+        databricks.execute(QUERY)
+    workspace.states["wh-1"] = "RUNNING"
+    workspace.add_result(QUERY, ["sku"], [["COLA"]])
+
+    assert databricks.execute(QUERY) == [{"sku": "COLA"}]
+
+
+def test_query_outlasting_the_inline_wait_is_polled_to_completion(workspace):
+    workspace.add_result("SELECT slow", ["sku"], [["COLA"]], seconds=0.2)
+    databricks = DatabricksClient(workspace.client, poll_initial=0.01, statement_wait="0s")
+
+    assert databricks.execute("SELECT slow") == [{"sku": "COLA"}]
+
+    assert workspace.statements == [("wh-1", "SELECT slow")]
+    assert workspace.cancelled == []
+    assert workspace.polls > 0
+
+
+def test_failed_query_keeps_the_warehouse(workspace):
+    databricks = DatabricksClient(workspace.client)
+
+    with pytest.raises(RuntimeError, match="FAILED - Unknown statement"):
+        databricks.execute("SELECT nope")
+    databricks.execute(QUERY)
+
+    assert workspace.lists == 1
+
+
+def test_concurrent_first_queries_build_one_client(workspace):
+    databricks = DatabricksClient(workspace.client)
+    threads = [threading.Thread(target=databricks.execute, args=(QUERY,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert workspace.clients == 1
+    assert len(workspace.statements) == 8
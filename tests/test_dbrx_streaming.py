@@ -0,0 +1,100 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from app.dbrx import DatabricksClient
+from fake_databricks import FakeWorkspace
+
+SALES = "SELECT day, sku, units, revenue, refunded, sold_at FROM main.pos.sales"
+TYPES = ["DATE", "STRING", "LONG", "DECIMAL", "BOOLEAN", "TIMESTAMP"]
+
+
+@pytest.fixture()
+def workspace() -> FakeWorkspace:
+    workspace = FakeWorkspace()
+    rows = [
+        ["2026-10-01", f"SKU-{n}", str(n), f"{n}.50", "false" if n % 2 else "true", "2026-10-01T10:00:00.000Z"]
+        for n in range(25)
+    ]
+    rows[3][3] = None
+    workspace.add_result(
+        SALES, ["day", "sku", "units", "revenue", "refunded", "sold_at"], rows, types=TYPES, chunk_rows=10
+    )
+    return workspace
+
+
+@pytest.fixture()
+def databricks(workspace) -> DatabricksClient:
+    return DatabricksClient(workspace.client, poll_initial=0.01)
+
+
+def test_execute_returns_rows_from_every_chunk(workspace, databricks):
+    rows = databricks.execute(SALES)
+
+    assert len(rows) == 25
+    assert rows[24]["sku"] == "SKU-24"
+    assert rows[24]["units"] == "24"
+    assert workspace.chunk_requests == [1, 2]
+
+
+def test_rows_stream_typed_and_chunks_are_fetched_lazily(workspace, databricks):
+    rows = databricks.stream_rows(SALES)
+
+    first = next(rows)
+    assert first == {
+        "day": date(2026, 10, 1),
+        "sku": "SKU-0",
+        "units": 0,
+        "revenue": Decimal("0.50"),
+        "refunded": True,
+        "sold_at": datetime(2026, 10, 1, 10, tzinfo=timezone.utc),
+    }
+    assert workspace.chunk_requests == []
+    rest = list(rows)
+    assert len(rest) == 24
+    assert rest[2]["revenue"] is None
+    assert workspace.chunk_requests == [1, 2]
+
+
+def test_untyped_rows_keep_the_api_strings(databricks):
+    assert next(databricks.stream_rows(SALES, typed=False))["units"] == "0"
+
+
+def test_batches_are_columns_per_chunk(databricks):
+    batches = list(databricks.stream_batches(SALES))
+
+    assert [len(batch["sku"]) for batch in batches] == [10, 10, 5]
+    assert batches[2]["units"] == [20, 21, 22, 23, 24]
+
+
+def test_failed_statement_raises_before_streaming(databricks):
+    with pytest.raises(RuntimeError, match="FAILED"):
+        next(databricks.stream_rows("SELECT nope"))
+
+
+def test_long_statement_is_polled_until_it_finishes(workspace, databricks):
+    workspace.add_result("SELECT 1 AS n", ["n"], [["1"]], seconds=0.2, types=["INT"])
+
+    assert list(databricks.stream_rows("SELECT 1 AS n")) == [{"n": 1}]
+
+
+def test_arrow_batches_stream_from_external_links(workspace, databricks):
+    pyarrow = pytest.importorskip("pyarrow")
+    workspace.add_result(
+        "SELECT sku, units FROM main.pos.stock",
+        ["sku", "units"],
+        [[f"SKU-{n}", str(n)] for n in range(100)],
+        types=["STRING", "LONG"],
+        chunk_rows=40,
+    )
+
+    batches = databricks.stream_arrow("SELECT sku, units FROM main.pos.stock")
+
+    first = next(batches)
+    assert first.schema.field("units").type == pyarrow.int64()
+    assert workspace.chunk_requests == []
+    table = pyarrow.Table.from_batches([first, *batches])
+    assert table.num_rows == 100
+    assert table.column("units").to_pylist() == list(range(100))
+    assert workspace.chunk_requests == [1, 2]
@@ -0,0 +1,198 @@
+"""Migrations against scratch databases on the test server: the migrated schema must match create_all()."""
+
+from datetime import datetime
+from typing import Dict, Generator, List
+
+import pytest
+from sqlalchemy import Engine, event, make_url, text
+from sqlmodel import SQLModel
+
+from app.database import DATABASE_URL, ENGINES, TimeoutClass, _create_engine, get_session
+from app.migrations import HEAD, SchemaOutOfDate, ensure_schema, r0001_baseline, upgrade
+from app.migrations.online import autocommit, create_index
+from app.partitions import ensure_partitions, monthly_partitions
+from app.promotion_counters import SHARD_COUNT
+
+SNAPSHOT = {
+    "columns": """
+        SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull,
+               pg_get_expr(d.adbin, d.adrelid)
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+          AND c.relname <> 'schema_migrations' AND a.attnum > 0 AND NOT a.attisdropped
+        """,
+    "indexes": """
+        SELECT i.tablename, i.indexname, i.indexdef
+        FROM pg_indexes i JOIN pg_class c ON c.oid = to_regclass(i.tablename)
+        WHERE i.schemaname = 'public' AND NOT c.relispartition AND i.tablename <> 'schema_migrations'
+        """,
+    "constraints": """
+        SELECT r.relname, c.conname, pg_get_constraintdef(c.oid)
+        FROM pg_constraint c JOIN pg_class r ON r.oid = c.conrelid
+        WHERE r.relnamespace = 'public'::regnamespace AND NOT r.relispartition AND r.relname <> 'schema_migrations'
+        """,
+    "partitions": """
+        SELECT i.inhparent::regclass::text, i.inhrelid::regclass::text
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE c.relkind IN ('r', 'p')
+        """,
+    "enums": "SELECT t.typname, e.enumlabel, e.enumsortorder FROM pg_enum e JOIN pg_type t ON t.oid = e.enumtypid",
+    "triggers": "SELECT tgrelid::regclass::text, pg_get_triggerdef(oid) FROM pg_trigger WHERE NOT tgisinternal",
+    "functions": "SELECT proname, prosrc FROM pg_proc WHERE pronamespace = 'public'::regnamespace",
+}
+
+PARTITIONED = ("transaction_items", "commissions", "stock_movements")
+
+LEGACY_ROWS = """
+    INSERT INTO users (username, email, password_hash, full_name, role, is_active, created_at, updated_at)
+    VALUES ('cashier', 'cashier@example.com', 'x', 'Cashier', 'CASHIER', true, '2025-03-01', '2025-03-01'),
+           ('top', 'top@example.com', 'x', 'Top', 'RESELLER', true, '2025-03-01', '2025-03-01'),
+           ('seller', 'seller@example.com', 'x', 'Seller', 'RESELLER', true, '2025-03-01', '2025-03-01');
+    INSERT INTO reseller_profiles (user_id, level, parent_reseller_id, referral_code, commission_rate, total_sales,
+                                   total_commission, is_active, created_at)
+    VALUES (2, 1, NULL, 'TOP', 0.05, 0, 0, true, '2025-03-01'), (3, 2, 1, 'SELLER', 0.10, 0, 0, true, '2025-03-01');
+    INSERT INTO promotions (name, promotion_type, discount_value, start_date, end_date, is_active, usage_limit,
+                            usage_count, created_at)
+    VALUES ('Launch', 'PERCENTAGE', 10, '2025-03-01', '2026-03-01', true, 100, 40, '2025-03-01');
+    INSERT INTO categories (name, is_active, created_at) VALUES ('Drinks', true, '2025-03-01');
+    INSERT INTO products (name, sku, category_id, base_price, cost_price, stock_quantity, min_stock_level, is_active,
+                          created_at, updated_at)
+    VALUES ('Cola', 'COLA', 1, 1.50, 0.70, 8, 0, true, '2025-03-01', '2025-03-01');
+    INSERT INTO transactions (transaction_number, cashier_id, transaction_type, status, subtotal, discount_amount,
+                              tax_amount, total_amount, payment_method, created_at, completed_at)
+    VALUES ('TRX-1', 1, 'POS', 'COMPLETED', 3.00, 0, 0, 3.00, 'cash', '2025-03-02 10:00', '2025-03-02 10:00');
+    INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, discount_amount, total_price)
+    VALUES (1, 1, 1, 1.50, 0, 1.50), (1, 1, 1, 1.50, 0, 1.50);
+    INSERT INTO commissions (user_id, transaction_id, commission_type, base_amount, commission_rate, commission_amount,
+                             is_paid, created_at)
+    VALUES (1, 1, 'affiliate', 3.00, 0.03, 0.09, false, '2025-03-02 10:00');
+    INSERT INTO stock_movements (product_id, movement_type, quantity, previous_quantity, new_quantity, created_by,
+                                 created_at)
+    VALUES (1, 'out', 2, 10, 8, 1, '2025-03-02 10:00');
+"""
+
+
+def admin(statement: str) -> None:
+    with ENGINES[TimeoutClass.BATCH].connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(statement))
+
+
+def scratch_database(name: str) -> Engine:
+    admin(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+    admin(f"CREATE DATABASE {name}")
+    url = make_url(DATABASE_URL).set(database=name).render_as_string(hide_password=False)
+    return _create_engine(TimeoutClass.BATCH, url)
+
+
+def snapshot(engine: Engine) -> Dict[str, List[tuple]]:
+    with engine.connect() as connection:
+        return {key: sorted(tuple(row) for row in connection.execute(text(query))) for key, query in SNAPSHOT.items()}
+
+
+@pytest.fixture(scope="module")
+def model_schema() -> Generator[Dict[str, List[tuple]], None, None]:
+    engine = scratch_database("pos_schema_models")
+    SQLModel.metadata.create_all(engine)
+    yield snapshot(engine)
+    engine.dispose()
+    admin("DROP DATABASE IF EXISTS pos_schema_models WITH (FORCE)")
+
+
+@pytest.fixture()
+def empty_database() -> Generator[Engine, None, None]:
+    engine = scratch_database("pos_schema_migrated")
+    yield engine
+    engine.dispose()
+    admin("DROP DATABASE IF EXISTS pos_schema_migrated WITH (FORCE)")
+
+
+def test_revisions_build_the_model_schema(empty_database, model_schema):
+    assert upgrade(empty_database) == ["0001", "0002", "0003", "0004", "0005", "0006", "0007"]
+
+    assert snapshot(empty_database) == model_schema
+    assert upgrade(empty_database) == []
+
+
+def test_legacy_database_is_adopted_and_converted_in_place(empty_database, model_schema):
+    r0001_baseline.upgrade(empty_database)
+    with empty_database.begin() as connection:
+        connection.execute(text(LEGACY_ROWS))
+
+    # startup refuses unless told to migrate
+    with pytest.raises(SchemaOutOfDate, match="0001"):
+        ensure_schema(empty_database)
+    assert ensure_schema(empty_database, mode="auto") == ["0002", "0003", "0004", "0005", "0006", "0007"]
+
+    # this month keeps landing in the old table; maintenance attaches it once the month is over
+    current = {(table, f"{table}_{datetime.utcnow():%Y_%m}") for table in PARTITIONED}
+    assert snapshot(empty_database) == {
+        **model_schema,
+        "partitions": sorted(set(model_schema["partitions"]) - current),
+    }
+    with empty_database.begin() as connection:
+        items = connection.execute(text("SELECT tableoid::regclass::text, id, created_at FROM transaction_items"))
+        assert sorted(items) == [
+            ("transaction_items_default", 1, datetime(2025, 3, 2, 10)),
+            ("transaction_items_default", 2, datetime(2025, 3, 2, 10)),
+        ]
+        assert connection.execute(text("SELECT count(*) FROM commissions_default")).scalar_one() == 1
+        # the parent carries on the old sequence
+        new_id = connection.execute(
+            text(
+                "INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, total_price, "
+                "discount_amount) VALUES (1, 1, 1, 1.50, 1.50, 0) RETURNING id"
+            )
+        ).scalar_one()
+        assert new_id == 3
+        assert connection.execute(
+            text("SELECT description FROM schema_migrations WHERE revision = '0001'")
+        ).scalar_one()
+        closure = connection.execute(text("SELECT ancestor_id, descendant_id, depth FROM reseller_closure"))
+        assert sorted(closure) == [(1, 1, 0), (1, 2, 1), (2, 2, 0)]
+        shards = connection.execute(text("SELECT count(*), sum(remaining) FROM promotion_usage_counters")).one()
+        assert tuple(shards) == (SHARD_COUNT, 60)
+
+
+def test_startup_only_reads_the_revision_table(empty_database):
+    upgrade(empty_database)
+    statements: List[str] = []
+
+    @event.listens_for(empty_database, "before_cursor_execute")
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    assert ensure_schema(empty_database, mode="check") == []
+    assert len(statements) == 2
+    assert all(statement.lstrip().startswith("SELECT") for statement in statements)
+    assert HEAD == "0007"
+
+
+def test_partitioned_index_is_built_partition_by_partition(clean_db):
+    ensure_partitions(now=datetime(2026, 6, 15), ahead=1)
+
+    with autocommit(ENGINES[TimeoutClass.BATCH]) as connection:
+        assert create_index(connection, "ix_stock_movements_reference_number", "stock_movements", "(reference_number)")
+        assert not create_index(
+            connection, "ix_stock_movements_reference_number", "stock_movements", "(reference_number)"
+        )
+
+    with get_session() as session:
+        children = session.execute(
+            text(
+                "SELECT c.relname, x.indisvalid FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_index x ON x.indexrelid = c.oid "
+                "WHERE i.inhparent = 'ix_stock_movements_reference_number'::regclass ORDER BY 1"
+            )
+        ).all()
+        months = monthly_partitions(session, "stock_movements")
+        assert datetime(2026, 7, 1) in months
+        assert children == sorted(
+            [(f"ix_stock_movements_reference_number_{month:%Y_%m}", True) for month in months]
+            + [("ix_stock_movements_reference_number_default", True)]
+        )
+        valid = text(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = 'ix_stock_movements_reference_number'::regclass"
+        )
+        assert session.execute(valid).scalar_one()
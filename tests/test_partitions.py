@@ -0,0 +1,179 @@
+import logging
+from datetime import datetime
+from typing import Generator, List
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from app.database import TimeoutClass, get_session
+from app.models import StockMovement
+from app.partitions import (
+    ARCHIVE_SCHEMA,
+    archive_partitions,
+    copy_backlog,
+    create_partition,
+    ensure_partitions,
+    fence_default,
+    monthly_partitions,
+    stage_partition,
+    upcoming_months,
+)
+
+ROWS_BY_PARTITION = text("SELECT tableoid::regclass::text, count(*) FROM stock_movements GROUP BY 1 ORDER BY 1")
+
+
+@pytest.fixture()
+def partitioned(sample_data) -> Generator[dict, None, None]:
+    yield sample_data
+    with get_session(TimeoutClass.BATCH) as session:
+        session.execute(text(f"DROP SCHEMA IF EXISTS {ARCHIVE_SCHEMA} CASCADE"))
+        session.commit()
+
+
+def move_stock(session: Session, data: dict, *moments: datetime) -> None:
+    session.add_all(
+        StockMovement(
+            product_id=data["cola"],
+            movement_type="in",
+            quantity=1,
+            previous_quantity=0,
+            new_quantity=1,
+            created_by=data["cashier"],
+            created_at=moment,
+        )
+        for moment in moments
+    )
+    session.commit()
+
+
+def scanned(session: Session, where: str) -> List[str]:
+    plan = session.execute(text(f"EXPLAIN (FORMAT JSON) SELECT * FROM stock_movements WHERE {where}")).scalar_one()
+    found, nodes = [], [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Relation Name" in node:
+            found.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return found
+
+
+def test_new_tables_start_with_this_and_the_coming_months(partitioned):
+    with get_session() as session:
+        assert sorted(monthly_partitions(session, "stock_movements")) == upcoming_months(datetime.utcnow())
+
+
+def test_rows_wait_in_the_default_partition_until_their_month_exists(partitioned):
+    with get_session() as session:
+        move_stock(session, partitioned, datetime(2026, 3, 5), datetime(2026, 3, 20), datetime(2026, 4, 1))
+        assert list(session.execute(ROWS_BY_PARTITION)) == [("stock_movements_default", 3)]
+
+    # April is being written: fencing it would fail inserts until the attach commits
+    created = ensure_partitions(now=datetime(2026, 4, 15), ahead=1)
+
+    assert sorted(created) == [
+        f"{table}_{month}"
+        for table in ("commissions", "stock_movements", "transaction_items")
+        for month in ("2026_03", "2026_05")
+    ]
+    assert ensure_partitions(now=datetime(2026, 4, 15), ahead=1) == []
+    with get_session() as session:
+        move_stock(session, partitioned, datetime(2026, 4, 30))
+        assert list(session.execute(ROWS_BY_PARTITION)) == [
+            ("stock_movements_2026_03", 2),
+            ("stock_movements_default", 2),
+        ]
+
+    assert "stock_movements_2026_04" in ensure_partitions(now=datetime(2026, 5, 2), ahead=1)
+    with get_session() as session:
+        assert list(session.execute(ROWS_BY_PARTITION)) == [
+            ("stock_movements_2026_03", 2),
+            ("stock_movements_2026_04", 2),
+        ]
+
+
+def test_backlog_is_copied_in_batches_and_stays_visible_until_attached(partitioned):
+    march = datetime(2026, 3, 1)
+    with get_session() as session:
+        move_stock(session, partitioned, *(datetime(2026, 3, day) for day in range(1, 8)), datetime(2026, 4, 1))
+    with get_session(TimeoutClass.BATCH) as session:
+        fence_default(session, "stock_movements", march)
+        stage_partition(session, "stock_movements", march)
+        session.commit()
+
+    assert copy_backlog("stock_movements", march, batch=2) == 7
+    assert copy_backlog("stock_movements", march, batch=2) == 0
+    with get_session() as session:
+        assert list(session.execute(ROWS_BY_PARTITION)) == [("stock_movements_default", 8)]
+        assert session.execute(text("SELECT count(*) FROM stock_movements_2026_03")).scalar_one() == 7
+
+    with get_session(TimeoutClass.BATCH) as session:
+        assert create_partition(session, "stock_movements", march) == 0
+        session.commit()
+    with get_session() as session:
+        assert list(session.execute(ROWS_BY_PARTITION)) == [
+            ("stock_movements_2026_03", 7),
+            ("stock_movements_default", 1),
+        ]
+
+
+def test_attach_skips_scanning_the_fenced_default_partition(partitioned, caplog):
+    march = datetime(2026, 3, 1)
+    with get_session() as session:
+        move_stock(session, partitioned, datetime(2026, 3, 5), datetime(2026, 4, 1))
+    with get_session(TimeoutClass.BATCH) as session:
+        fence_default(session, "stock_movements", march)
+        session.commit()
+    with pytest.raises(IntegrityError), get_session() as session:
+        move_stock(session, partitioned, datetime(2026, 3, 6))
+
+    # the server reports the scans it skips at DEBUG1; psycopg2 notices are logged at INFO
+    caplog.set_level(logging.INFO, logger="sqlalchemy.dialects.postgresql")
+    with get_session(TimeoutClass.BATCH) as session:
+        session.execute(text("SET LOCAL client_min_messages = debug1"))
+        assert create_partition(session, "stock_movements", march) == 1
+        session.commit()
+
+    assert 'default partition "stock_movements_default" is implied by existing constraints' in caplog.text
+    assert 'table "stock_movements_2026_03" is implied by existing constraints' in caplog.text
+    with get_session() as session:
+        fences = (
+            "SELECT count(*) FROM pg_constraint "
+            "WHERE conname IN ('stock_movements_default_not_2026_03', 'stock_movements_2026_03_bounds')"
+        )
+        assert session.execute(text(fences)).scalar_one() == 0
+        move_stock(session, partitioned, datetime(2026, 3, 6))
+        assert list(session.execute(ROWS_BY_PARTITION)) == [
+            ("stock_movements_2026_03", 2),
+            ("stock_movements_default", 1),
+        ]
+
+
+def test_recent_day_queries_touch_one_partition(partitioned):
+    ensure_partitions(now=datetime(2026, 7, 15), since=datetime(2026, 1, 1))
+
+    with get_session() as session:
+        assert scanned(session, "created_at >= '2026-06-14' AND created_at < '2026-06-15'") == [
+            "stock_movements_2026_06"
+        ]
+        # every monthly partition and the default one
+        assert len(scanned(session, "product_id = 1")) == len(monthly_partitions(session, "stock_movements")) + 1
+
+
+def test_old_months_are_detached_into_the_archive_schema(partitioned):
+    ensure_partitions(now=datetime(2026, 6, 15), since=datetime(2024, 1, 1))
+    with get_session() as session:
+        move_stock(session, partitioned, datetime(2024, 2, 10), datetime(2026, 6, 1))
+
+    archived = archive_partitions(now=datetime(2026, 6, 15), retention=24)
+
+    assert len(archived) == 15
+    assert f"{ARCHIVE_SCHEMA}.stock_movements_2024_02" in archived
+    with get_session() as session:
+        assert min(monthly_partitions(session, "stock_movements")) == datetime(2024, 6, 1)
+        assert session.execute(text("SELECT count(*) FROM stock_movements")).scalar_one() == 1
+        archive = f"{ARCHIVE_SCHEMA}.stock_movements_2024_02"
+        assert session.execute(text(f"SELECT count(*) FROM {archive}")).scalar_one() == 1
+    assert archive_partitions(now=datetime(2026, 6, 15), retention=24) == []
+    assert archive_partitions(now=datetime(2026, 6, 15), retention=0) == []
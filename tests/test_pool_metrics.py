@@ -0,0 +1,69 @@
+import subprocess
+import sys
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from app.database import ASYNC_ENGINES, DATABASE_URL, ENGINE, TimeoutClass, database_stats, get_session
+from app.pool_metrics import InstrumentedQueuePool, instrument, pool_stats
+
+
+def test_pool_metrics_count_waits_timeouts_and_churn():
+    engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.2)
+    metrics = instrument(engine.pool)
+
+    held = engine.connect()
+    with pytest.raises(PoolTimeout):
+        engine.connect()
+
+    release = threading.Timer(0.1, held.close)
+    release.start()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    release.join()
+    stats = pool_stats(engine.pool)
+
+    assert stats["checkouts"] == 2
+    assert stats["checkout_timeouts"] == 1
+    assert stats["peak_checked_out"] == 1
+    assert stats["connections_opened"] == 1
+    assert stats["checked_out"] == 0
+    assert stats["wait_ms"]["max"] >= 100
+    assert sum(stats["wait_ms"]["histogram"].values()) == 2
+    assert stats["wait_ms"]["histogram"]["<=250ms"] == 1
+
+    engine.dispose()
+    with engine.connect():
+        pass
+    # dispose swaps in a fresh pool, the counters carry on
+    assert engine.pool.metrics is metrics
+    assert metrics.connections_closed == 1
+    assert metrics.connections_opened == 2
+    assert metrics.checkouts == 3
+    engine.dispose()
+
+
+def test_database_stats_report_every_engine():
+    checkouts = pool_stats(ENGINE.pool)["checkouts"]
+    with get_session() as session:
+        session.execute(text("SELECT 1"))
+
+    ASYNC_ENGINES[TimeoutClass.BATCH]  # created on first use
+    stats = database_stats()
+
+    assert set(stats) == {"replicas", "oltp", "reporting", "batch"}
+    assert stats["oltp"]["engine"]["checkouts"] == checkouts + 1
+    assert stats["oltp"]["pool_settings"]["pool_size"] == stats["oltp"]["engine"]["size"]
+    assert "checked_out" in stats["batch"]["async_engine"]
+
+
+def test_database_stats_do_not_create_async_engines():
+    script = (
+        "import sys; from app.database import database_stats; stats = database_stats(); "
+        "print(stats['oltp']['async_engine'], 'asyncpg' in sys.modules)"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+
+    assert result.stdout.split() == ["None", "False"]
@@ -0,0 +1,184 @@
+import time
+from decimal import Decimal
+from typing import Dict, Generator, List
+
+import pytest
+from sqlalchemy import event, text
+from sqlmodel import select
+
+from app.checkout_service import checkout
+from app.database import ENGINE, get_session
+from app.models import (
+    Product,
+    ProductResellerPriceCreate,
+    ProductResellerPriceUpdate,
+    ProductUpdate,
+    ResellerProfile,
+    ResellerProfileCreate,
+    TransactionCreate,
+    TransactionItem,
+)
+from app.price_resolver import PriceResolver, price_resolver
+from app.product_service import create_reseller_price, update_product, update_reseller_price
+from app.reseller_service import create_reseller_profile
+
+
+@pytest.fixture()
+def statements() -> Generator[List[str], None, None]:
+    executed: List[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(ENGINE, "before_cursor_execute", record)
+    yield executed
+    event.remove(ENGINE, "before_cursor_execute", record)
+
+
+@pytest.fixture()
+def prices(sample_data) -> Dict[str, int]:
+    with get_session() as session:
+        seller = session.exec(select(ResellerProfile).where(ResellerProfile.user_id == sample_data["seller"])).one()
+        seller_profile_id = seller.id or 0
+
+    level_two_cola = create_reseller_price(
+        ProductResellerPriceCreate(product_id=sample_data["cola"], reseller_level=2, price=Decimal("1.20"))
+    )
+    create_reseller_price(
+        ProductResellerPriceCreate(product_id=sample_data["water"], reseller_level=1, price=Decimal("0.90"))
+    )
+    create_reseller_price(
+        ProductResellerPriceCreate(product_id=sample_data["water"], reseller_level=2, price=Decimal("0.85"))
+    )
+    seller_water = create_reseller_price(
+        ProductResellerPriceCreate(
+            product_id=sample_data["water"], reseller_profile_id=seller_profile_id, price=Decimal("0.80")
+        )
+    )
+    return {**sample_data, "level_two_cola": level_two_cola.id or 0, "seller_water": seller_water.id or 0}
+
+
+def test_reseller_override_then_level_then_base(prices):
+    basket = [prices["cola"], prices["water"]]
+
+    assert price_resolver.resolve(basket, prices["seller"]) == {
+        prices["cola"]: Decimal("1.20"),
+        prices["water"]: Decimal("0.80"),
+    }
+    assert price_resolver.resolve(basket, prices["top"]) == {
+        prices["cola"]: Decimal("1.50"),
+        prices["water"]: Decimal("0.90"),
+    }
+    assert price_resolver.resolve(basket) == {prices["cola"]: Decimal("1.50"), prices["water"]: Decimal("0.99")}
+    assert price_resolver.resolve(basket, prices["cashier"]) == price_resolver.resolve(basket)
+
+
+def test_warm_basket_of_100_lines_runs_no_queries(prices, statements):
+    with get_session() as session:
+        cola = session.get(Product, prices["cola"])
+        if cola is None:
+            raise ValueError("Product not found")
+        products = [
+            Product(
+                name=f"Item {i}",
+                sku=f"ITEM-{i}",
+                category_id=cola.category_id,
+                base_price=Decimal("3.00"),
+                cost_price=Decimal("1.00"),
+            )
+            for i in range(98)
+        ]
+        session.add_all(products)
+        session.commit()
+        basket = [product.id or 0 for product in products] + [prices["cola"], prices["water"]]
+
+    price_resolver.resolve(basket, prices["seller"])
+    statements.clear()
+
+    resolved = price_resolver.resolve(basket, prices["seller"])
+
+    assert statements == []
+    assert len(resolved) == 100
+    assert resolved[prices["water"]] == Decimal("0.80")
+
+
+def test_first_load_runs_outside_the_sale_session(prices, statements):
+    with get_session() as session:
+        assert price_resolver.resolve([prices["cola"]], session=session) == {prices["cola"]: Decimal("1.50")}
+
+    assert price_resolver.full_loads == 1
+    assert not any("product_reseller_prices" in statement for statement in statements)
+
+
+def test_changes_refresh_only_touched_products(prices):
+    basket = [prices["cola"], prices["water"]]
+    price_resolver.resolve(basket, prices["seller"])
+
+    update_reseller_price(prices["seller_water"], ProductResellerPriceUpdate(is_active=False))
+    update_reseller_price(prices["level_two_cola"], ProductResellerPriceUpdate(price=Decimal("1.10")))
+    update_product(prices["water"], ProductUpdate(base_price=Decimal("1.05")))
+
+    assert price_resolver.resolve(basket, prices["seller"]) == {
+        prices["cola"]: Decimal("1.10"),
+        prices["water"]: Decimal("0.85"),
+    }
+    assert price_resolver.resolve(basket)[prices["water"]] == Decimal("1.05")
+    assert price_resolver.full_loads == 1
+
+
+def test_changes_from_other_processes_show_once_the_matrix_expires(prices):
+    resolver = PriceResolver(max_age=0.2)
+    basket = [prices["cola"], prices["water"]]
+    assert resolver.resolve(basket, prices["seller"])[prices["cola"]] == Decimal("1.20")
+
+    # as another process would write them: no session, so no after_commit hook
+    with ENGINE.begin() as connection:
+        connection.execute(text("UPDATE products SET base_price = 1.60 WHERE id = :id"), {"id": prices["water"]})
+        connection.execute(
+            text("UPDATE product_reseller_prices SET price = 1.15 WHERE id = :id"), {"id": prices["level_two_cola"]}
+        )
+
+    assert resolver.resolve(basket)[prices["water"]] == Decimal("0.99")
+    time.sleep(0.2)
+    assert resolver.resolve(basket) == {prices["cola"]: Decimal("1.50"), prices["water"]: Decimal("1.60")}
+    assert resolver.resolve(basket, prices["seller"])[prices["cola"]] == Decimal("1.15")
+    assert resolver.full_loads == 2
+
+
+def test_new_reseller_profile_replaces_cached_non_reseller(prices):
+    assert price_resolver.resolve([prices["cola"]], prices["cashier"]) == {prices["cola"]: Decimal("1.50")}
+
+    create_reseller_profile(ResellerProfileCreate(user_id=prices["cashier"], level=2, commission_rate=Decimal("0")))
+
+    assert price_resolver.resolve([prices["cola"]], prices["cashier"]) == {prices["cola"]: Decimal("1.20")}
+
+
+def test_unavailable_product_is_rejected(prices):
+    update_product(prices["cola"], ProductUpdate(is_active=False))
+
+    with pytest.raises(ValueError, match="not available"):
+        price_resolver.resolve([prices["cola"]])
+
+
+def test_reseller_price_needs_exactly_one_target(prices):
+    with pytest.raises(ValueError, match="either"):
+        create_reseller_price(ProductResellerPriceCreate(product_id=prices["cola"], price=Decimal("1.00")))
+
+
+def test_reseller_checkout_uses_resolved_prices(prices):
+    transaction = checkout(
+        TransactionCreate(
+            cashier_id=prices["cashier"],
+            reseller_id=prices["seller"],
+            payment_method="cash",
+            items=[{"product_id": prices["cola"], "quantity": 2}, {"product_id": prices["water"], "quantity": 1}],
+        )
+    )
+
+    with get_session() as session:
+        items = session.exec(select(TransactionItem).where(TransactionItem.transaction_id == transaction.id)).all()
+    assert {item.product_id: item.unit_price for item in items} == {
+        prices["cola"]: Decimal("1.20"),
+        prices["water"]: Decimal("0.80"),
+    }
+    assert transaction.subtotal == Decimal("3.20")
@@ -0,0 +1,265 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import select
+
+from app.checkout_service import checkout
+from app.database import ENGINE, get_session
+from app.models import (
+    Product,
+    Promotion,
+    PromotionCreate,
+    PromotionUsageCounter,
+    PromotionType,
+    TransactionCreate,
+    TransactionPromotion,
+)
+from app.promotion_counters import SHARD_COUNT, create_missing_counters, fold_usage_counts, usage_counts
+from app.promotion_engine import BasketLine, PromotionEngine, promotion_engine
+from app.promotion_service import create_promotion, deactivate_promotion
+
+
+def promotion(promotion_type: PromotionType, value: str, days: int = 1, **kwargs) -> int:
+    now = datetime.utcnow()
+    created = create_promotion(
+        PromotionCreate(
+            name=f"{promotion_type.value} {value}",
+            promotion_type=promotion_type,
+            discount_value=Decimal(value),
+            start_date=now - timedelta(days=1) if days > 0 else now + timedelta(days=1),
+            end_date=now + timedelta(days=days) if days > 0 else now + timedelta(days=3),
+            **kwargs,
+        )
+    )
+    return created.id or 0
+
+
+@pytest.fixture()
+def promotions(sample_data) -> Dict[str, int]:
+    return {
+        **sample_data,
+        "percent": promotion(
+            PromotionType.PERCENTAGE, "10", product_ids=[sample_data["cola"]], max_discount_amount=Decimal("0.20")
+        ),
+        "three_for_two": promotion(PromotionType.BUY_X_GET_Y, "2", product_ids=[sample_data["water"]]),
+        "resellers": promotion(
+            PromotionType.FIXED_AMOUNT, "1.00", applicable_roles=["reseller"], min_purchase_amount=Decimal("5.00")
+        ),
+        "upcoming": promotion(PromotionType.PERCENTAGE, "50", days=0),
+    }
+
+
+def basket(promotions: Dict[str, int], cola: int, water: int) -> List[BasketLine]:
+    lines = [BasketLine(promotions["cola"], cola, Decimal("1.50"))]
+    if water:
+        lines.append(BasketLine(promotions["water"], water, Decimal("0.99")))
+    return lines
+
+
+def test_each_promotion_type_applies_to_its_products(promotions):
+    now = datetime.utcnow()
+
+    assert promotion_engine.evaluate(basket(promotions, 3, 3), "consumer", now) == {
+        promotions["promotion"]: Decimal("2.00"),
+        promotions["percent"]: Decimal("0.20"),
+        promotions["three_for_two"]: Decimal("0.99"),
+    }
+    assert promotion_engine.evaluate(basket(promotions, 3, 3), "reseller", now)[promotions["resellers"]] == Decimal(
+        "1.00"
+    )
+    # below min_purchase_amount, and a 10% share under the 0.20 cap
+    assert promotion_engine.evaluate(basket(promotions, 1, 0), "reseller", now) == {
+        promotions["promotion"]: Decimal("1.50"),
+        promotions["percent"]: Decimal("0.15"),
+    }
+
+
+def test_interval_index_follows_the_clock(promotions):
+    later = datetime.utcnow() + timedelta(days=2)
+
+    assert [rule.id for rule in promotion_engine.candidates([promotions["cola"]], "consumer", later)] == [
+        promotions["upcoming"]
+    ]
+    assert promotions["upcoming"] not in promotion_engine.active_at(datetime.utcnow())[2]
+
+
+def test_candidates_come_from_the_product_index(promotions):
+    for _ in range(20):
+        promotion(PromotionType.PERCENTAGE, "5", product_ids=[promotions["water"]])
+
+    candidates = promotion_engine.candidates([promotions["cola"]], "consumer", datetime.utcnow())
+
+    assert {rule.id for rule in candidates} == {promotions["promotion"], promotions["percent"]}
+
+
+def test_checkout_records_applied_promotions(promotions):
+    transaction = checkout(
+        TransactionCreate(
+            cashier_id=promotions["cashier"],
+            payment_method="cash",
+            items=[
+                {"product_id": promotions["cola"], "quantity": 3},
+                {"product_id": promotions["water"], "quantity": 3},
+            ],
+        ),
+        apply_promotions=True,
+    )
+
+    assert transaction.subtotal == Decimal("7.47")
+    assert transaction.discount_amount == Decimal("3.19")
+    with get_session() as session:
+        applied = session.exec(
+            select(TransactionPromotion).where(TransactionPromotion.transaction_id == transaction.id)
+        ).all()
+        usage = usage_counts(session, promotions.values())
+    assert {p.promotion_id: p.discount_amount for p in applied} == {
+        promotions["promotion"]: Decimal("2.00"),
+        promotions["percent"]: Decimal("0.20"),
+        promotions["three_for_two"]: Decimal("0.99"),
+    }
+    assert usage[promotions["promotion"]] == 1
+    assert usage[promotions["resellers"]] == 0
+
+
+def test_recorded_promotions_add_up_to_the_capped_discount(promotions):
+    # 1.50 off and 10% of 1.50 exceed the 1.50 subtotal
+    transaction = checkout(
+        TransactionCreate(
+            cashier_id=promotions["cashier"],
+            payment_method="cash",
+            items=[{"product_id": promotions["cola"], "quantity": 1}],
+        ),
+        apply_promotions=True,
+    )
+
+    assert transaction.discount_amount == transaction.subtotal == Decimal("1.50")
+    with get_session() as session:
+        applied = session.exec(
+            select(TransactionPromotion).where(TransactionPromotion.transaction_id == transaction.id)
+        ).all()
+    assert sum(p.discount_amount for p in applied) == transaction.discount_amount
+
+
+def test_usage_limit_holds_under_concurrent_checkouts(promotions):
+    limited = promotion(PromotionType.FIXED_AMOUNT, "0.10", product_ids=[promotions["cola"]], usage_limit=3)
+    # as at app startup, so the unsharded sample promotion is no hot row
+    create_missing_counters()
+    data = TransactionCreate(
+        cashier_id=promotions["cashier"],
+        payment_method="cash",
+        items=[{"product_id": promotions["cola"], "quantity": 1}],
+    )
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        transactions = list(pool.map(lambda _: checkout(data, apply_promotions=True), range(8)))
+
+    with get_session() as session:
+        uses = session.exec(select(TransactionPromotion).where(TransactionPromotion.promotion_id == limited)).all()
+        used = usage_counts(session, [limited])[limited]
+    assert len(transactions) == 8
+    assert len(uses) == 3
+    assert used == 3
+    assert limited not in {
+        rule.id for rule in promotion_engine.candidates([promotions["cola"]], None, datetime.utcnow())
+    }
+
+
+def test_sharded_usage_limit_is_exact_under_64_concurrent_checkouts(promotions):
+    limited = promotion(PromotionType.FIXED_AMOUNT, "0.10", usage_limit=40)
+    # as at app startup, so the unsharded sample promotion is no hot row
+    create_missing_counters()
+    with get_session() as session:
+        water = session.get(Product, promotions["water"])
+        assert water is not None
+        water.stock_quantity = 100
+        session.add(water)
+        session.commit()
+    data = TransactionCreate(
+        cashier_id=promotions["cashier"],
+        payment_method="cash",
+        items=[{"product_id": promotions["water"], "quantity": 1}],
+    )
+
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        transactions = list(pool.map(lambda _: checkout(data, apply_promotions=True), range(64)))
+
+    with get_session() as session:
+        uses = session.exec(select(TransactionPromotion).where(TransactionPromotion.promotion_id == limited)).all()
+        shards = session.exec(select(PromotionUsageCounter).where(PromotionUsageCounter.promotion_id == limited)).all()
+        assert usage_counts(session, [limited])[limited] == 40
+    assert len(transactions) == 64
+    assert len(uses) == 40
+    assert len(shards) > 1 and sum(shard.remaining or 0 for shard in shards) == 0
+
+    fold_usage_counts()
+    with get_session() as session:
+        folded = session.get(Promotion, limited)
+        assert folded is not None and folded.usage_count == 40
+        assert usage_counts(session, [limited])[limited] == 40
+
+
+def test_promotions_without_shards_count_on_their_row_until_backfilled(promotions):
+    data = TransactionCreate(
+        cashier_id=promotions["cashier"],
+        payment_method="cash",
+        items=[{"product_id": promotions["cola"], "quantity": 1}],
+    )
+    checkout(data, apply_promotions=True)
+
+    create_missing_counters()
+    checkout(data, apply_promotions=True)
+
+    with get_session() as session:
+        shards = session.exec(
+            select(PromotionUsageCounter).where(PromotionUsageCounter.promotion_id == promotions["promotion"])
+        ).all()
+        legacy = session.get(Promotion, promotions["promotion"])
+        assert legacy is not None and legacy.usage_count == 1
+        assert usage_counts(session, [promotions["promotion"]])[promotions["promotion"]] == 2
+    assert len(shards) == SHARD_COUNT
+
+
+def test_deactivation_refreshes_only_that_promotion(promotions):
+    promotion_engine.evaluate(basket(promotions, 1, 0), "consumer", datetime.utcnow())
+
+    deactivate_promotion(promotions["percent"])
+
+    assert promotion_engine.evaluate(basket(promotions, 1, 0), "consumer", datetime.utcnow()) == {
+        promotions["promotion"]: Decimal("1.50")
+    }
+    assert promotion_engine.full_loads == 1
+
+
+def test_changes_from_other_processes_show_once_the_index_expires(promotions):
+    engine = PromotionEngine(max_age=0.2)
+    now = datetime.utcnow()
+    assert promotions["percent"] in engine.evaluate(basket(promotions, 1, 0), "consumer", now)
+
+    # as another process would write it: no session, so no after_commit hook
+    with ENGINE.begin() as connection:
+        connection.execute(
+            text("UPDATE promotions SET is_active = false WHERE id = :id"), {"id": promotions["percent"]}
+        )
+
+    assert promotions["percent"] in engine.evaluate(basket(promotions, 1, 0), "consumer", now)
+    time.sleep(0.2)
+    assert promotions["percent"] not in engine.evaluate(basket(promotions, 1, 0), "consumer", now)
+    assert engine.full_loads == 2
+
+
+def test_promotion_must_end_after_it_starts(sample_data):
+    with pytest.raises(ValueError, match="end before"):
+        create_promotion(
+            PromotionCreate(
+                name="Backwards",
+                promotion_type=PromotionType.PERCENTAGE,
+                discount_value=Decimal("5"),
+                start_date=datetime.utcnow(),
+                end_date=datetime.utcnow() - timedelta(days=1),
+            )
+        )
@@ -0,0 +1,173 @@
+"""Hot queries must stay on indexes once the tables are big enough for the planner to care.
+
+The seed is a few tens of thousands of rows, generated server-side, then ANALYZEd so the plans are the ones
+production would get rather than small-table sequential scans.
+"""
+
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Generator, List, Tuple
+
+import pytest
+from sqlalchemy import Executable, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import col, select
+
+from app.catalog_cache import _lookup
+from app.database import TimeoutClass, get_session, reset_db
+from app.models import (
+    Commission,
+    Product,
+    Promotion,
+    PromotionProduct,
+    PromotionType,
+    StockMovement,
+    TransactionItem,
+)
+from app.partitions import ensure_partitions
+from app.settlement_service import _pending_query
+from app.transaction_service import _history_query
+
+# a sequential scan is fine on a small table or an empty monthly partition, not on anything bigger
+BIG_TABLE_ROWS = 1000
+
+SEED = [
+    """
+    INSERT INTO users (username, email, password_hash, full_name, role, is_active, created_at, updated_at)
+    SELECT 'user' || i, 'user' || i || '@example.com', 'x', 'User ' || i,
+           CASE WHEN i <= 50 THEN 'CASHIER' ELSE 'CONSUMER' END::userrole, true, now(), now()
+    FROM generate_series(1, 500) AS i
+    """,
+    """
+    INSERT INTO categories (name, is_active, created_at)
+    SELECT 'Category ' || i, true, now() FROM generate_series(1, 200) AS i
+    """,
+    """
+    INSERT INTO products (name, sku, barcode, category_id, base_price, cost_price, stock_quantity, min_stock_level,
+                          is_active, created_at, updated_at)
+    SELECT 'Product ' || i, 'SKU' || i, 'BC' || i, 1 + i % 200, 1.50, 0.70, 100, 0, i % 10 <> 0, now(), now()
+    FROM generate_series(1, 5000) AS i
+    """,
+    """
+    INSERT INTO transactions (transaction_number, user_id, cashier_id, reseller_id, affiliate_id, transaction_type,
+                              status, subtotal, discount_amount, tax_amount, total_amount, payment_method,
+                              created_at, completed_at)
+    SELECT 'T' || i, CASE WHEN i % 3 = 0 THEN 51 + i % 450 END, 1 + i % 50,
+           CASE WHEN i % 50 = 0 THEN 51 + i % 450 END, CASE WHEN i % 70 = 0 THEN 51 + i % 450 END,
+           'POS', CASE WHEN i % 10 = 0 THEN 'PENDING' ELSE 'COMPLETED' END::transactionstatus,
+           10, 0, 0, 10, 'cash', ts, CASE WHEN i % 10 <> 0 THEN ts END
+    FROM generate_series(1, 50000) AS i, LATERAL (SELECT timestamp '2026-01-01' + i * interval '10 minutes' AS ts) t
+    """,
+    """
+    INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, discount_amount, total_price,
+                                   created_at)
+    SELECT t.id, 1 + i % 5000, 1, 5, 0, 5, t.created_at
+    FROM generate_series(1, 100000) AS i JOIN transactions t ON t.id = 1 + i % 50000
+    """,
+    """
+    INSERT INTO commissions (user_id, transaction_id, commission_type, base_amount, commission_rate,
+                             commission_amount, is_paid, created_at)
+    SELECT 51 + i % 450, i, 'reseller', 10, 0.05, 0.50, i % 20 <> 0, now() FROM generate_series(1, 40000) AS i
+    """,
+    """
+    INSERT INTO stock_movements (product_id, movement_type, quantity, previous_quantity, new_quantity, created_by,
+                                 created_at)
+    SELECT 1 + i % 5000, 'out', -1, 100, 99, 1, timestamp '2026-01-01' + i * interval '1 minute'
+    FROM generate_series(1, 50000) AS i
+    """,
+    "ANALYZE",
+]
+
+
+@pytest.fixture(scope="module")
+def seeded() -> Generator[None, None, None]:
+    reset_db()
+    ensure_partitions(since=datetime(2026, 1, 1))
+    with get_session(TimeoutClass.BATCH) as session:
+        for statement in SEED:
+            session.execute(text(statement))
+        session.commit()
+    yield
+    reset_db()
+
+
+RELATION_ROWS = text("SELECT reltuples FROM pg_class WHERE relname = :name")
+
+
+def plan_nodes(node: Dict[str, Any]) -> Generator[Dict[str, Any], None, None]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def scans(statement: Executable) -> List[Tuple[str, str, float]]:
+    """(node type, relation, analyzed row count) for every table scan in the plan"""
+    sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    with get_session(TimeoutClass.REPORTING) as session:
+        plan = session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return [
+            (
+                node["Node Type"],
+                node["Relation Name"],
+                session.execute(RELATION_ROWS, {"name": node["Relation Name"]}).scalar_one(),
+            )
+            for node in plan_nodes(plan[0]["Plan"])
+            if "Relation Name" in node
+        ]
+
+
+HOT_QUERIES = {
+    "history by cashier": lambda: _history_query(7, None, None, 50),
+    "history by customer, next page": lambda: _history_query(None, 60, 40000, 50),
+    "barcode lookup": lambda: _lookup("barcode", "BC123"),
+    "sku lookup": lambda: _lookup("sku", "SKU123"),
+    "settlement pending": lambda: _pending_query(datetime(2026, 6, 1), datetime(2026, 6, 2), 0),
+    "items of a transaction": lambda: select(TransactionItem).where(TransactionItem.transaction_id == 123),
+    "sales of a product": lambda: select(TransactionItem).where(TransactionItem.product_id == 123),
+    "unpaid commissions": lambda: select(Commission).where(
+        Commission.user_id == 60, col(Commission.is_paid).is_(False)
+    ),
+    "commissions of a transaction": lambda: select(Commission).where(Commission.transaction_id == 123),
+    "stock movements of a product": lambda: (
+        select(StockMovement)
+        .where(StockMovement.product_id == 123, col(StockMovement.created_at) >= datetime(2026, 1, 10))
+        .order_by(col(StockMovement.created_at))
+    ),
+    "active products in a category": lambda: (
+        select(Product).where(Product.category_id == 3, col(Product.is_active).is_(True)).order_by(col(Product.name))
+    ),
+}
+
+
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_hot_query_uses_an_index(seeded, name):
+    found = scans(HOT_QUERIES[name]())
+
+    assert found
+    assert not [scan for scan in found if scan[0] == "Seq Scan" and scan[2] > BIG_TABLE_ROWS], found
+
+
+def test_constraints_reject_bad_rows(seeded):
+    with get_session() as session:
+        with pytest.raises(IntegrityError, match="ck_transaction_items_quantity_positive"):
+            session.execute(text("UPDATE transaction_items SET quantity = 0 WHERE id = 1"))
+        session.rollback()
+
+        promotion = Promotion(
+            name="Ten off",
+            promotion_type=PromotionType.PERCENTAGE,
+            discount_value=Decimal("10"),
+            start_date=datetime(2026, 1, 1),
+            end_date=datetime(2026, 2, 1),
+        )
+        session.add(promotion)
+        session.flush()
+        session.add(PromotionProduct(promotion_id=promotion.id, product_id=1))
+        session.flush()
+        session.add(PromotionProduct(promotion_id=promotion.id, product_id=1))
+        with pytest.raises(IntegrityError, match="uq_promotion_products_promotion_product"):
+            session.flush()
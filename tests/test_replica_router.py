@@ -0,0 +1,134 @@
+"""Replica routing against stand-in replicas: extra databases on the test server.
+
+Each stand-in has the app schema and a replica_lag table the router reads instead of the recovery functions,
+so tests can make a replica fall behind.
+"""
+
+from typing import Dict, Generator
+
+import pytest
+from sqlalchemy import make_url, text
+from sqlalchemy.exc import InternalError
+from sqlmodel import Session, SQLModel
+
+from app.database import (
+    DATABASE_URL,
+    ENGINES,
+    TimeoutClass,
+    _create_async_engine,
+    _create_engine,
+    get_read_session,
+    read_only,
+    read_only_async,
+)
+from app.replica_router import ReplicaRouter
+
+STAND_INS = ("pos_replica_a", "pos_replica_b")
+LAG = text("SELECT seconds FROM replica_lag")
+
+
+def url_for(database: str) -> str:
+    return make_url(DATABASE_URL).set(database=database).render_as_string(hide_password=False)
+
+
+def admin(statement: str) -> None:
+    with ENGINES[TimeoutClass.BATCH].connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(statement))
+
+
+@pytest.fixture(scope="module")
+def stand_ins() -> Generator[Dict[str, str], None, None]:
+    urls = {}
+    for database in STAND_INS:
+        admin(f"DROP DATABASE IF EXISTS {database} WITH (FORCE)")
+        admin(f"CREATE DATABASE {database}")
+        engine = _create_engine(TimeoutClass.BATCH, url_for(database))
+        SQLModel.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE replica_lag (seconds float NOT NULL)"))
+            connection.execute(text("INSERT INTO replica_lag VALUES (0)"))
+        engine.dispose()
+        urls[database] = url_for(database)
+    yield urls
+    for database in STAND_INS:
+        admin(f"DROP DATABASE IF EXISTS {database} WITH (FORCE)")
+
+
+@pytest.fixture()
+def router(stand_ins) -> Generator[ReplicaRouter, None, None]:
+    router = ReplicaRouter(
+        list(stand_ins.values()), _create_engine, _create_async_engine, max_lag=5, check_interval=0, lag_query=LAG
+    )
+    yield router
+    router.dispose()
+    for database in STAND_INS:
+        set_lag(database, 0)
+
+
+def set_lag(database: str, seconds: float) -> None:
+    engine = _create_engine(TimeoutClass.BATCH, url_for(database))
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE replica_lag SET seconds = :seconds"), {"seconds": seconds})
+    engine.dispose()
+
+
+def served_by(session: Session) -> str:
+    return session.execute(text("SELECT current_database()")).scalar_one()
+
+
+def read_from(router: ReplicaRouter) -> str:
+    with get_read_session(TimeoutClass.REPORTING, router) as session:
+        return served_by(session)
+
+
+def test_reads_rotate_over_replicas_and_cannot_write(router):
+    assert [read_from(router) for _ in range(4)] == [*STAND_INS, *STAND_INS]
+
+    with get_read_session(TimeoutClass.REPORTING, router) as session:
+        with pytest.raises(InternalError, match="read-only transaction"):
+            session.execute(text("INSERT INTO replica_lag VALUES (1)"))
+
+
+def test_lagging_replicas_are_skipped_until_primary_is_the_only_choice(router):
+    set_lag("pos_replica_a", 30)
+    assert {read_from(router) for _ in range(4)} == {"pos_replica_b"}
+
+    set_lag("pos_replica_b", 30)
+    assert read_from(router) == make_url(DATABASE_URL).database
+    assert router.stats()["fallbacks_to_primary"] == 1
+    assert [replica["lag_seconds"] for replica in router.stats()["replicas"]] == [30, 30]
+
+
+def test_unreachable_replica_fails_over(stand_ins):
+    router = ReplicaRouter(
+        [url_for("pos_replica_missing"), stand_ins["pos_replica_b"]],
+        _create_engine,
+        max_lag=5,
+        check_interval=0,
+        lag_query=LAG,
+    )
+    try:
+        assert {read_from(router) for _ in range(3)} == {"pos_replica_b"}
+        assert [replica["healthy"] for replica in router.stats()["replicas"]] == [False, True]
+    finally:
+        router.dispose()
+
+
+def test_connection_lost_mid_read_is_retried_on_the_primary(router):
+    def work(session: Session) -> str:
+        database = served_by(session)
+        if database in STAND_INS:
+            session.execute(text("SELECT pg_terminate_backend(pg_backend_pid())"))
+        return database
+
+    assert read_only(work, TimeoutClass.REPORTING, router) == make_url(DATABASE_URL).database
+    assert [replica["healthy"] for replica in router.stats()["replicas"]] == [False, True]
+    assert read_from(router) == "pos_replica_b"
+
+
+async def test_async_reads_use_replicas(router):
+    try:
+        assert await read_only_async(served_by, TimeoutClass.REPORTING, router) == "pos_replica_a"
+        assert await read_only_async(served_by, TimeoutClass.REPORTING, router) == "pos_replica_b"
+    finally:
+        await router.dispose_async()
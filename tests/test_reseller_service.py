@@ -0,0 +1,133 @@
+from decimal import Decimal
+from typing import List
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import select
+
+from app.database import get_session
+from app.models import ResellerClosure, ResellerProfile, ResellerProfileCreate, User, UserRole
+from app.reseller_service import (
+    change_parent,
+    check_closure_consistency,
+    create_reseller_profile,
+    get_reseller_upline,
+)
+
+
+def make_users(count: int) -> List[int]:
+    with get_session() as session:
+        users = [
+            User(
+                username=f"reseller{i}",
+                email=f"reseller{i}@example.com",
+                password_hash="x",
+                full_name=f"Reseller {i}",
+                role=UserRole.RESELLER,
+            )
+            for i in range(count)
+        ]
+        session.add_all(users)
+        session.commit()
+        return [user.id for user in users if user.id is not None]
+
+
+def make_chain(user_ids: List[int]) -> List[int]:
+    profile_ids: List[int] = []
+    parent_id = None
+    for level, user_id in enumerate(user_ids, start=1):
+        profile = create_reseller_profile(
+            ResellerProfileCreate(
+                user_id=user_id, level=level, parent_reseller_id=parent_id, commission_rate=Decimal("0.0100")
+            )
+        )
+        if profile.id is None:
+            raise ValueError("Profile ID cannot be None")
+        profile_ids.append(profile.id)
+        parent_id = profile.id
+    return profile_ids
+
+
+def closure_pairs() -> set:
+    with get_session() as session:
+        return {(c.ancestor_id, c.descendant_id, c.depth) for c in session.exec(select(ResellerClosure)).all()}
+
+
+def test_create_maintains_closure(clean_db):
+    a, b, c = make_chain(make_users(3))
+
+    assert closure_pairs() == {
+        (a, a, 0),
+        (b, b, 0),
+        (c, c, 0),
+        (a, b, 1),
+        (b, c, 1),
+        (a, c, 2),
+    }
+    assert check_closure_consistency() == {"missing": 0, "extra": 0, "repaired": 0}
+
+
+def test_upline_is_nearest_first(clean_db):
+    user_ids = make_users(3)
+    a, b, c = make_chain(user_ids)
+
+    with get_session() as session:
+        upline = get_reseller_upline(session, user_ids[2])
+
+    assert [row["id"] for row in upline] == [c, b, a]
+    assert [row["depth"] for row in upline] == [1, 2, 3]
+
+
+def test_change_parent_moves_subtree(clean_db):
+    user_ids = make_users(4)
+    a, b, c = make_chain(user_ids[:3])
+    d = make_chain(user_ids[3:])[0]
+
+    change_parent(b, d)
+
+    with get_session() as session:
+        upline = get_reseller_upline(session, user_ids[2])
+        moved = session.get(ResellerProfile, b)
+    assert [row["id"] for row in upline] == [c, b, d]
+    assert moved is not None and moved.parent_reseller_id == d
+    assert check_closure_consistency() == {"missing": 0, "extra": 0, "repaired": 0}
+
+    change_parent(b, None)
+    assert (d, c, 2) not in closure_pairs()
+    assert check_closure_consistency()["missing"] == 0
+
+
+def test_change_parent_rejects_cycles(clean_db):
+    a, b, c = make_chain(make_users(3))
+
+    with pytest.raises(ValueError, match="own subtree"):
+        change_parent(a, c)
+
+
+def test_depth_is_limited_to_ten_levels(clean_db):
+    user_ids = make_users(11)
+    chain = make_chain(user_ids[:10])
+
+    with pytest.raises(ValueError, match="10 levels"):
+        create_reseller_profile(
+            ResellerProfileCreate(
+                user_id=user_ids[10], level=10, parent_reseller_id=chain[-1], commission_rate=Decimal("0")
+            )
+        )
+
+
+def test_consistency_check_detects_and_repairs_drift(clean_db):
+    a, b, c = make_chain(make_users(3))
+    with get_session() as session:
+        session.execute(
+            text("DELETE FROM reseller_closure WHERE ancestor_id = :a AND descendant_id = :c"), {"a": a, "c": c}
+        )
+        session.execute(text("INSERT INTO reseller_closure VALUES (:c, :a, 5)"), {"a": a, "c": c})
+        session.commit()
+
+    report = check_closure_consistency(repair=True)
+
+    assert report["missing"] == 1
+    assert report["extra"] == 1
+    assert report["repaired"] == 6
+    assert check_closure_consistency() == {"missing": 0, "extra": 0, "repaired": 0}
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict
+
+from sqlmodel import select
+
+from app.checkout_service import checkout
+from app.database import get_session
+from app.models import AffiliateLink, AffiliateProfile, ResellerProfile, TransactionCreate
+from app.running_totals import leaderboard, verify_running_totals
+from app.settlement_service import settle_commissions
+
+NO_DRIFT = {"reseller_profiles": 0, "affiliate_profiles": 0, "affiliate_links": 0}
+
+
+def add_link(data: Dict[str, int]) -> int:
+    with get_session() as session:
+        profile = session.exec(select(AffiliateProfile).where(AffiliateProfile.user_id == data["affiliate"])).one()
+        link = AffiliateLink(affiliate_profile_id=profile.id, link_code="AFF-COLA", product_id=data["cola"])
+        session.add(link)
+        session.commit()
+        return link.id or 0
+
+
+def sell(data: Dict[str, int], link_id: int, quantity: int, defer_commissions: bool = False) -> None:
+    checkout(
+        TransactionCreate(
+            cashier_id=data["cashier"],
+            reseller_id=data["seller"],
+            affiliate_id=data["affiliate"],
+            affiliate_link_id=link_id,
+            payment_method="cash",
+            items=[{"product_id": data["cola"], "quantity": quantity}],
+        ),
+        defer_commissions=defer_commissions,
+    )
+
+
+def totals(data: Dict[str, int], link_id: int) -> Dict[str, tuple]:
+    with get_session() as session:
+        resellers = {
+            profile.user_id: (profile.total_sales, profile.total_commission)
+            for profile in session.exec(select(ResellerProfile)).all()
+        }
+        affiliate = session.exec(select(AffiliateProfile).where(AffiliateProfile.user_id == data["affiliate"])).one()
+        link = session.get(AffiliateLink, link_id)
+        assert link is not None
+        return {
+            "seller": resellers[data["seller"]],
+            "top": resellers[data["top"]],
+            "affiliate": (affiliate.total_sales, affiliate.total_commission),
+            "link": (link.total_sales, link.conversions),
+        }
+
+
+def test_checkout_adds_to_the_running_totals(sample_data):
+    link_id = add_link(sample_data)
+
+    sell(sample_data, link_id, 2)
+    sell(sample_data, link_id, 4)
+
+    # 9.00 sold: 5% to the seller, 2% to its parent, 3% to the affiliate
+    assert totals(sample_data, link_id) == {
+        "seller": (Decimal("9.00"), Decimal("0.45")),
+        "top": (Decimal("0.00"), Decimal("0.18")),
+        "affiliate": (Decimal("9.00"), Decimal("0.27")),
+        "link": (Decimal("9.00"), 2),
+    }
+    assert verify_running_totals() == NO_DRIFT
+
+
+def test_settlement_adds_the_deferred_commissions(sample_data):
+    link_id = add_link(sample_data)
+    sell(sample_data, link_id, 2, defer_commissions=True)
+    assert totals(sample_data, link_id)["seller"] == (Decimal("3.00"), Decimal("0.00"))
+
+    report = settle_commissions(datetime.utcnow() - timedelta(hours=1), datetime.utcnow() + timedelta(hours=1))
+
+    assert report.commissions == 3
+    assert totals(sample_data, link_id)["seller"] == (Decimal("3.00"), Decimal("0.15"))
+    assert verify_running_totals() == NO_DRIFT
+
+
+def test_verifier_repairs_drifted_totals(sample_data):
+    link_id = add_link(sample_data)
+    sell(sample_data, link_id, 2)
+    expected = totals(sample_data, link_id)
+    with get_session() as session:
+        seller = session.exec(select(ResellerProfile).where(ResellerProfile.user_id == sample_data["seller"])).one()
+        seller.total_commission = Decimal("99.00")
+        link = session.get(AffiliateLink, link_id)
+        assert link is not None
+        link.conversions = 7
+        session.commit()
+
+    assert verify_running_totals(repair=False) == {**NO_DRIFT, "reseller_profiles": 1, "affiliate_links": 1}
+    assert totals(sample_data, link_id) != expected
+    assert verify_running_totals() == {**NO_DRIFT, "reseller_profiles": 1, "affiliate_links": 1}
+    assert totals(sample_data, link_id) == expected
+    assert verify_running_totals() == NO_DRIFT
+
+
+def test_leaderboard_reads_the_profile_rows(sample_data):
+    sell(sample_data, add_link(sample_data), 1)
+
+    assert [profile.user_id for profile in leaderboard(ResellerProfile)] == [sample_data["seller"], sample_data["top"]]
+    assert [profile.total_sales for profile in leaderboard(AffiliateProfile, limit=1)] == [Decimal("1.50")]
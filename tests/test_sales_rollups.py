@@ -0,0 +1,214 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import pytest
+from sqlmodel import select
+
+from app.checkout_service import checkout
+from app.database import get_session
+from app.models import (
+    CashierSalesRollup,
+    CategorySalesRollup,
+    ProductSalesRollup,
+    ResellerSalesRollup,
+    SalesEvent,
+    Transaction,
+    TransactionCreate,
+    TransactionItem,
+    TransactionStatus,
+)
+from app.sales_rollups import apply_sales_events, rebuild_rollups, sales_rollups
+
+ROLLUP_MODELS = [CashierSalesRollup, ResellerSalesRollup, ProductSalesRollup, CategorySalesRollup]
+
+
+def add_sale(
+    data: Dict[str, int],
+    number: str,
+    at: datetime,
+    status: TransactionStatus,
+    quantity: int,
+    item_at: Optional[datetime] = None,
+) -> int:
+    """A transaction of `quantity` colas sold by the cashier for the seller, written directly"""
+    with get_session() as session:
+        total = Decimal("1.50") * quantity
+        transaction = Transaction(
+            transaction_number=number,
+            cashier_id=data["cashier"],
+            reseller_id=data["seller"],
+            status=status,
+            subtotal=total,
+            tax_amount=Decimal("0.10"),
+            total_amount=total + Decimal("0.10"),
+            payment_method="cash",
+            created_at=at,
+            completed_at=at if status != TransactionStatus.PENDING else None,
+        )
+        session.add(transaction)
+        session.flush()
+        session.add(
+            TransactionItem(
+                transaction_id=transaction.id,
+                product_id=data["cola"],
+                quantity=quantity,
+                unit_price=Decimal("1.50"),
+                total_price=total,
+                created_at=item_at or at,
+            )
+        )
+        session.commit()
+        return transaction.id or 0
+
+
+def set_status(transaction_id: int, status: TransactionStatus, at: datetime) -> None:
+    with get_session() as session:
+        transaction = session.get(Transaction, transaction_id)
+        assert transaction is not None
+        transaction.status = status
+        transaction.completed_at = transaction.completed_at or at
+        session.commit()
+
+
+def rollups() -> Dict[str, List[tuple]]:
+    """Every rollup row but the all-zero ones that a sale taken back leaves behind"""
+    with get_session() as session:
+        tables: Dict[str, List[tuple]] = {}
+        for model in ROLLUP_MODELS:
+            rows = [row.model_dump() for row in session.exec(select(model)).all()]
+            measures = [name for name in model.model_fields if name not in ("grain", "bucket") and "_id" not in name]
+            tables[model.__tablename__] = sorted(  # type: ignore[index]
+                tuple(row.values()) for row in rows if any(row[name] for name in measures)
+            )
+        return tables
+
+
+def queued() -> int:
+    with get_session() as session:
+        return len(session.exec(select(SalesEvent)).all())
+
+
+def test_checkouts_are_rolled_up_per_cashier_reseller_product_and_category(sample_data):
+    for quantity in (2, 1):
+        checkout(
+            TransactionCreate(
+                cashier_id=sample_data["cashier"],
+                reseller_id=sample_data["seller"],
+                payment_method="cash",
+                items=[
+                    {"product_id": sample_data["cola"], "quantity": quantity},
+                    {"product_id": sample_data["water"], "quantity": 1},
+                ],
+            )
+        )
+
+    assert apply_sales_events() == 2
+    assert queued() == 0
+
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    (cashier,) = sales_rollups(CashierSalesRollup, "day", today, datetime.max)
+    assert (cashier.cashier_id, cashier.transaction_count, cashier.subtotal) == (
+        sample_data["cashier"],
+        2,
+        Decimal("6.48"),
+    )
+    (reseller,) = sales_rollups(ResellerSalesRollup, "day", today, datetime.max)
+    assert reseller.reseller_id == sample_data["seller"] and reseller.total_amount == cashier.total_amount
+    products = {row.product_id: row.quantity for row in sales_rollups(ProductSalesRollup, "hour", today, datetime.max)}
+    assert products == {sample_data["cola"]: 3, sample_data["water"]: 2}
+    (category,) = sales_rollups(CategorySalesRollup, "day", today, datetime.max)
+    assert (category.quantity, category.total_price) == (5, Decimal("6.48"))
+    with pytest.raises(ValueError, match="grain"):
+        sales_rollups(CashierSalesRollup, "week", today, datetime.max)
+
+
+def test_refund_moves_a_sale_into_refunds(sample_data):
+    sold_at = datetime(2026, 3, 2, 10, 15)
+    transaction_id = add_sale(sample_data, "TRX-1", sold_at, TransactionStatus.COMPLETED, 2)
+    apply_sales_events()
+
+    set_status(transaction_id, TransactionStatus.REFUNDED, datetime(2026, 3, 4))
+    assert apply_sales_events() == 1
+
+    (hourly,) = sales_rollups(CashierSalesRollup, "hour", datetime(2026, 3, 2), datetime(2026, 3, 3))
+    assert hourly.bucket == datetime(2026, 3, 2, 10)
+    assert (hourly.transaction_count, hourly.total_amount) == (1, Decimal("3.10"))
+    assert (hourly.refund_count, hourly.refunded_amount) == (1, Decimal("3.10"))
+    (product,) = sales_rollups(ProductSalesRollup, "day", datetime(2026, 3, 1), datetime(2026, 4, 1))
+    assert (product.quantity, product.refunded_quantity, product.refunded_amount) == (2, 2, Decimal("3.00"))
+
+
+def test_items_count_whatever_time_they_were_written_at(sample_data):
+    # the line is written a moment after its sale, in the next month's partition
+    add_sale(
+        sample_data,
+        "TRX-1",
+        datetime(2026, 3, 31, 23, 59, 59),
+        TransactionStatus.COMPLETED,
+        2,
+        item_at=datetime(2026, 4, 1, 0, 0, 1),
+    )
+    apply_sales_events()
+    incremental = rollups()
+
+    (product,) = sales_rollups(ProductSalesRollup, "day", datetime(2026, 3, 1), datetime(2026, 4, 1))
+    assert (product.bucket, product.quantity) == (datetime(2026, 3, 31), 2)
+    (category,) = sales_rollups(CategorySalesRollup, "day", datetime(2026, 3, 1), datetime(2026, 4, 1))
+    assert category.total_price == Decimal("3.00")
+    assert rebuild_rollups() == 1
+    assert rollups() == incremental
+
+
+def test_incremental_rollups_equal_a_rebuild(sample_data):
+    pending = add_sale(sample_data, "TRX-1", datetime(2026, 3, 1, 9, 30), TransactionStatus.PENDING, 1)
+    add_sale(sample_data, "TRX-2", datetime(2026, 3, 1, 9, 45), TransactionStatus.COMPLETED, 2)
+    cancelled = add_sale(sample_data, "TRX-3", datetime(2026, 3, 1, 14, 0), TransactionStatus.COMPLETED, 3)
+    refunded = add_sale(sample_data, "TRX-4", datetime(2026, 3, 2, 8, 0), TransactionStatus.COMPLETED, 4)
+    assert apply_sales_events(batch=2) == 3
+
+    set_status(pending, TransactionStatus.COMPLETED, datetime(2026, 3, 1, 11, 5))
+    set_status(cancelled, TransactionStatus.CANCELLED, datetime(2026, 3, 1, 15, 0))
+    set_status(refunded, TransactionStatus.REFUNDED, datetime(2026, 3, 3))
+    add_sale(sample_data, "TRX-5", datetime(2026, 3, 2, 8, 30), TransactionStatus.REFUNDED, 5)
+    assert apply_sales_events(batch=2) == 4
+
+    incremental = rollups()
+    assert rebuild_rollups() == 4
+    assert rollups() == incremental
+
+    days = sales_rollups(CashierSalesRollup, "day", datetime(2026, 3, 1), datetime(2026, 3, 3))
+    assert [(row.bucket.day, row.transaction_count, row.refund_count) for row in days] == [(1, 2, 0), (2, 2, 2)]
+    hours = sales_rollups(CashierSalesRollup, "hour", datetime(2026, 3, 1), datetime(2026, 3, 2))
+    # TRX-1 is bucketed when it completed; TRX-3 is gone with the rebuild's empty bucket
+    assert [(row.bucket.hour, row.transaction_count) for row in hours] == [(9, 1), (11, 1)]
+
+
+def test_rebuild_since_only_replaces_later_days(sample_data):
+    add_sale(sample_data, "TRX-1", datetime(2026, 3, 1, 9), TransactionStatus.COMPLETED, 1)
+    add_sale(sample_data, "TRX-2", datetime(2026, 3, 2, 9), TransactionStatus.COMPLETED, 2)
+    add_sale(sample_data, "TRX-3", datetime(2026, 3, 2, 10), TransactionStatus.COMPLETED, 3)
+    apply_sales_events()
+    expected = rollups()
+    with get_session() as session:
+        for row in session.exec(select(CashierSalesRollup)).all():
+            row.transaction_count = 99
+        session.commit()
+
+    assert rebuild_rollups(since=datetime(2026, 3, 2, 17)) == 2
+
+    days = sales_rollups(CashierSalesRollup, "day", datetime(2026, 3, 1), datetime(2026, 3, 3))
+    assert [row.transaction_count for row in days] == [99, 2]
+    assert rollups()["product_sales_rollups"] == expected["product_sales_rollups"]
+
+
+def test_rebuild_takes_over_queued_events_of_the_days_it_covers(sample_data):
+    add_sale(sample_data, "TRX-1", datetime(2026, 3, 1, 9), TransactionStatus.COMPLETED, 1)
+    add_sale(sample_data, "TRX-2", datetime(2026, 3, 2, 9), TransactionStatus.COMPLETED, 2)
+
+    rebuild_rollups(since=datetime(2026, 3, 2))
+
+    assert queued() == 1
+    assert apply_sales_events() == 1
+    days = sales_rollups(CashierSalesRollup, "day", datetime(2026, 3, 1), datetime(2026, 3, 3))
+    assert [row.transaction_count for row in days] == [1, 1]
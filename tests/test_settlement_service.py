@@ -0,0 +1,121 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from sqlmodel import select
+
+from app.checkout_service import checkout, money
+from app.database import get_session
+from app.models import Commission, TransactionCreate
+from app.settlement_service import (
+    DECIMAL_SAMPLE_SIZE,
+    chunk_sample,
+    commission_cents,
+    sample_positions,
+    settle_commissions,
+)
+
+
+def test_commission_cents_matches_decimal_rounding():
+    rng = random.Random(1)
+    base = [rng.randint(-(10**9), 10**9) for _ in range(5_000)] + [5, -5, 15, 125, 0]
+    rates = [rng.randint(0, 99_999) for _ in range(5_000)] + [1_000, 1_000, 5_000, 400, 1234]
+
+    result = commission_cents(np.array(base), np.array(rates))
+
+    for cents, units, actual in zip(base, rates, result.tolist()):
+        expected = money(Decimal(cents) / 100 * (Decimal(units) / 10_000))
+        assert Decimal(actual) / 100 == expected
+
+
+def test_commission_cents_handles_int64_overflow():
+    base = np.array([10**15], dtype=np.int64)
+    rates = np.array([99_999_999], dtype=np.int64)
+
+    result = commission_cents(base, rates)
+
+    assert int(result[0]) == (10**15 * 99_999_999 + 5_000) // 10_000
+
+
+def test_decimal_sample_spans_the_chunk():
+    positions = sample_positions(50_000, 100)
+
+    assert len(positions) == 100
+    assert positions[0] == 0 and positions[-1] == 49_999
+    assert np.all(np.diff(positions) > 400)
+    assert sample_positions(3, 10).tolist() == [0, 1, 2]
+    assert len(sample_positions(0, 10)) == len(sample_positions(10, 0)) == 0
+
+
+def test_decimal_budget_is_shared_across_chunks():
+    left, shares = DECIMAL_SAMPLE_SIZE, []
+    for _ in range(8):
+        shares.append(chunk_sample(left))
+        left -= shares[-1]
+
+    assert all(share > 0 for share in shares)
+    assert sum(shares) <= DECIMAL_SAMPLE_SIZE
+
+
+def test_settlement_matches_checkout_commissions(sample_data):
+    baskets = [
+        {"product_id": sample_data["cola"], "quantity": 1},
+        {"product_id": sample_data["water"], "quantity": 1},
+    ]
+    expected = {}
+    for item in baskets:
+        data = TransactionCreate(
+            cashier_id=sample_data["cashier"],
+            reseller_id=sample_data["seller"],
+            affiliate_id=sample_data["affiliate"],
+            payment_method="cash",
+            items=[item],
+        )
+        immediate = checkout(data)
+        deferred = checkout(data, defer_commissions=True)
+        expected[deferred.id] = immediate.id
+
+    window_start = datetime.utcnow() - timedelta(hours=1)
+    report = settle_commissions(window_start, datetime.utcnow() + timedelta(hours=1))
+
+    assert report.transactions == 2
+    assert report.commissions == 6
+    assert report.db_mismatches == 0
+    assert report.decimal_checked == 6
+    assert report.decimal_mismatches == 0
+
+    with get_session() as session:
+        for deferred_id, immediate_id in expected.items():
+            settled = session.exec(select(Commission).where(Commission.transaction_id == deferred_id)).all()
+            reference = session.exec(select(Commission).where(Commission.transaction_id == immediate_id)).all()
+            assert sorted((c.user_id, c.level, c.commission_amount) for c in settled) == sorted(
+                (c.user_id, c.level, c.commission_amount) for c in reference
+            )
+    settled_total = sum((c.commission_amount for c in settled_rows(list(expected))), Decimal("0"))
+    assert report.commission_amount == settled_total
+
+    rerun = settle_commissions(window_start, datetime.utcnow() + timedelta(hours=1))
+    assert rerun.transactions == 0
+    assert rerun.commissions == 0
+
+
+def test_settlement_respects_window(sample_data):
+    checkout(
+        TransactionCreate(
+            cashier_id=sample_data["cashier"],
+            reseller_id=sample_data["seller"],
+            payment_method="cash",
+            items=[{"product_id": sample_data["cola"], "quantity": 1}],
+        ),
+        defer_commissions=True,
+    )
+
+    report = settle_commissions(datetime.utcnow() + timedelta(hours=1), datetime.utcnow() + timedelta(hours=2))
+
+    assert report.transactions == 0
+
+
+def settled_rows(transaction_ids):
+    with get_session() as session:
+        return list(session.exec(select(Commission).where(Commission.transaction_id.in_(transaction_ids))).all())
@@ -0,0 +1,20 @@
+"""Cold start: what importing the app pulls in, checked in a fresh interpreter."""
+
+import subprocess
+import sys
+
+LOADED = "import sys, {module}; print(' '.join(name for name in {optional!r} if name in sys.modules))"
+
+
+def loaded_after_import(module: str, *optional: str) -> list:
+    script = LOADED.format(module=module, optional=optional)
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+def test_app_startup_leaves_optional_subsystems_unloaded():
+    assert loaded_after_import("app.startup", "asyncpg", "databricks.sdk", "app.dbrx") == []
+
+
+def test_databricks_models_import_without_the_sdk():
+    assert loaded_after_import("app.dbrx", "databricks.sdk") == []
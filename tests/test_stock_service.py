@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+from sqlmodel import col, select
+
+from app.checkout_service import checkout
+from app.database import get_session
+from app.models import Product, StockMovement, TransactionCreate
+from app.stock_service import OversellPolicy, decrement_stock, stock_floor
+
+
+def sale(sample_data, product: str, quantity: int) -> TransactionCreate:
+    return TransactionCreate(
+        cashier_id=sample_data["cashier"],
+        payment_method="cash",
+        items=[{"product_id": sample_data[product], "quantity": quantity}],
+    )
+
+
+def stock(product_id: int) -> int:
+    with get_session() as session:
+        product = session.get(Product, product_id)
+        assert product is not None
+        return product.stock_quantity
+
+
+def test_decrement_writes_ledger_from_returned_quantities(sample_data):
+    with get_session() as session:
+        updated = decrement_stock(
+            session,
+            {sample_data["water"]: 2, sample_data["cola"]: 3},
+            "REF-1",
+            sample_data["cashier"],
+            datetime.utcnow(),
+        )
+        session.commit()
+        movements = session.exec(select(StockMovement).order_by(col(StockMovement.product_id))).all()
+
+    assert updated == {sample_data["cola"]: 7, sample_data["water"]: 3}
+    assert [(m.product_id, m.previous_quantity, m.new_quantity, m.notes) for m in movements] == [
+        (sample_data["cola"], 10, 7, None),
+        (sample_data["water"], 5, 3, None),
+    ]
+
+
+def test_rejected_line_leaves_whole_basket_untouched(sample_data):
+    with get_session() as session:
+        with pytest.raises(ValueError, match=f"Insufficient stock for product {sample_data['water']}"):
+            decrement_stock(
+                session,
+                {sample_data["cola"]: 1, sample_data["water"]: 6},
+                "REF-2",
+                sample_data["cashier"],
+                datetime.utcnow(),
+                OversellPolicy.REJECT,
+            )
+        session.rollback()
+
+    assert stock(sample_data["cola"]) == 10
+    assert stock(sample_data["water"]) == 5
+
+
+def test_oversell_policies(sample_data):
+    assert stock_floor(OversellPolicy.REJECT, 3) == 0
+    assert stock_floor(OversellPolicy.BACKORDER, 3) == -3
+    assert stock_floor(OversellPolicy.ALLOW, 3) is None
+    # default APP_OVERSELL_ALLOWANCE is 0, so backorders stop at zero
+    with get_session() as session:
+        with pytest.raises(ValueError, match="Insufficient stock"):
+            decrement_stock(
+                session,
+                {sample_data["water"]: 8},
+                None,
+                sample_data["cashier"],
+                datetime.utcnow(),
+                OversellPolicy.BACKORDER,
+            )
+        session.rollback()
+
+    checkout(sale(sample_data, "water", 8), oversell_policy=OversellPolicy.ALLOW)
+
+    with get_session() as session:
+        movement = session.exec(select(StockMovement)).one()
+    assert stock(sample_data["water"]) == -3
+    assert movement.notes == "oversold"
+
+
+def test_concurrent_sales_of_one_product_never_oversell(sample_data):
+    def sell(_: int) -> bool:
+        try:
+            checkout(sale(sample_data, "cola", 1))
+            return True
+        except ValueError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        sold = sum(pool.map(sell, range(16)))
+
+    with get_session() as session:
+        movements = session.exec(select(StockMovement).order_by(col(StockMovement.new_quantity).desc())).all()
+    assert sold == 10
+    assert stock(sample_data["cola"]) == 0
+    assert [(m.previous_quantity, m.new_quantity) for m in movements] == [(n + 1, n) for n in range(9, -1, -1)]
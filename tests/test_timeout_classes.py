@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.database import ASYNC_ENGINES, ENGINES, TimeoutClass, get_async_session, get_session
+
+
+@pytest.mark.parametrize(
+    ("timeout_class", "expected"),
+    [(TimeoutClass.OLTP, "1s"), (TimeoutClass.REPORTING, "1min"), (TimeoutClass.BATCH, "0")],
+)
+def test_each_class_has_its_own_statement_timeout(timeout_class, expected):
+    with get_session(timeout_class) as session:
+        assert session.execute(text("SHOW statement_timeout")).scalar_one() == expected
+
+
+async def test_async_sessions_follow_the_same_classes():
+    try:
+        async with get_async_session(TimeoutClass.REPORTING) as session:
+            assert (await session.execute(text("SHOW statement_timeout"))).scalar_one() == "1min"
+    finally:
+        await ASYNC_ENGINES[TimeoutClass.REPORTING].dispose()
+
+
+def test_slow_query_trips_only_the_oltp_budget():
+    with get_session() as session:
+        with pytest.raises(OperationalError, match="statement timeout"):
+            session.execute(text("SELECT pg_sleep(1.2)"))
+
+    with get_session(TimeoutClass.REPORTING) as session:
+        session.execute(text("SELECT pg_sleep(1.2)"))
+
+
+def test_reporting_does_not_use_checkout_connections():
+    oltp_before = ENGINES[TimeoutClass.OLTP].pool.checkedout()
+    with get_session(TimeoutClass.REPORTING) as session:
+        session.execute(text("SELECT 1"))
+        assert ENGINES[TimeoutClass.REPORTING].pool.checkedout() == 1
+        assert ENGINES[TimeoutClass.OLTP].pool.checkedout() == oltp_before
@@ -0,0 +1,91 @@
+import csv
+import io
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List
+
+import pytest
+
+from app.checkout_service import checkout
+from app.models import TransactionCreate
+from app.settlement_service import settle_commissions
+from app.transaction_export import export_response, export_rows
+
+START = datetime.utcnow() - timedelta(hours=1)
+END = datetime.utcnow() + timedelta(hours=1)
+TOKEN = "export-secret"
+
+
+def sell(data: Dict[str, int], quantities: List[int]) -> None:
+    for quantity in quantities:
+        checkout(
+            TransactionCreate(
+                cashier_id=data["cashier"],
+                reseller_id=data["seller"],
+                payment_method="cash",
+                items=[
+                    {"product_id": data["cola"], "quantity": quantity},
+                    {"product_id": data["water"], "quantity": 1},
+                ],
+            ),
+            defer_commissions=True,
+        )
+
+
+def read_csv(dataset: str, start: datetime = START, end: datetime = END) -> List[Dict[str, str]]:
+    chunks = list(export_rows(dataset, "csv", start, end, chunk_rows=2))
+    return list(csv.DictReader(io.StringIO(b"".join(chunks).decode())))
+
+
+def test_csv_export_streams_each_dataset(sample_data):
+    sell(sample_data, [1, 2, 3])
+    settle_commissions(START, END)
+
+    transactions = read_csv("transactions")
+    items = read_csv("items")
+    commissions = read_csv("commissions")
+
+    assert sorted(row["subtotal"] for row in transactions) == ["2.49", "3.99", "5.49"]
+    assert {row["status"] for row in transactions} == {"COMPLETED"}
+    assert len(items) == 6
+    assert sorted(row["quantity"] for row in items if row["sku"] == "COLA") == ["1", "2", "3"]
+    assert {row["transaction_number"] for row in items} == {row["transaction_number"] for row in transactions}
+    # the seller's 5% and its parent's 2% per sale
+    assert sorted(row["commission_amount"] for row in commissions) == ["0.05", "0.08", "0.11", "0.12", "0.20", "0.27"]
+
+
+def test_export_is_limited_to_the_range(sample_data):
+    sell(sample_data, [1])
+
+    assert read_csv("items", START - timedelta(days=2), START - timedelta(days=1)) == []
+    assert len(list(export_rows("items", "csv", END, END + timedelta(days=1)))) == 1  # the header alone
+
+
+def test_parquet_export_has_a_row_group_per_chunk(sample_data):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    sell(sample_data, [1, 2, 3])
+
+    chunks = list(export_rows("items", "parquet", START, END, chunk_rows=4))
+    file = parquet.ParquetFile(io.BytesIO(b"".join(chunks)))
+
+    assert file.metadata.num_row_groups == 2
+    table = file.read()
+    assert table.num_rows == 6
+    assert sum(table.column("total_price").to_pylist()) == Decimal("11.97")
+
+
+def test_response_needs_the_admin_token(clean_db):
+    assert export_response("items", "csv", START, END).status_code == 401
+    assert export_response("items", "csv", START, END, "Bearer wrong", token=TOKEN).status_code == 401
+    assert export_response("items", "csv", START, END, TOKEN, token=TOKEN).status_code == 401
+    assert export_response("items", "csv", START, END, "Bearer ", token="").status_code == 401
+    assert export_response("items", "csv", START, END, f"Bearer {TOKEN}", token=TOKEN).status_code == 200
+
+
+def test_response_rejects_unknown_datasets_and_formats(clean_db):
+    assert export_response("users", "csv", START, END, f"Bearer {TOKEN}", token=TOKEN).status_code == 400
+    assert export_response("items", "xlsx", START, END, f"Bearer {TOKEN}", token=TOKEN).status_code == 400
+
+    response = export_response("items", "csv", START, END, f"Bearer {TOKEN}", token=TOKEN)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == (f'attachment; filename="items-{START:%Y%m%d}-{END:%Y%m%d}.csv"')